@@ -0,0 +1,52 @@
+############################################################
+# Times diff.diff on synthetic workbooks of growing size that
+# differ in a single calculation. Identical datasources and
+# worksheets are skipped by their subtree hash, so the diff
+# should cost a small fraction of opening the two workbooks
+# and grow linearly with their size.
+#
+# Usage: python benchmarks/bench_diff.py [COLUMNS ...]
+############################################################
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from synthetic import make_workbook_xml  # noqa: E402
+from lxml import etree as ET  # noqa: E402
+from tableaudocumentapi import Workbook  # noqa: E402
+from tableaudocumentapi.diff import diff  # noqa: E402
+
+DATASOURCES = 10
+WORKSHEETS = 200
+
+
+def write_pair(directory, columns):
+    root = make_workbook_xml(DATASOURCES, columns, WORKSHEETS)
+    old_filename = os.path.join(directory, 'old.twb')
+    ET.ElementTree(root).write(old_filename)
+    calculation = root.find('datasources/datasource/column/calculation')
+    calculation.set('formula', calculation.get('formula') + ' + 1')
+    new_filename = os.path.join(directory, 'new.twb')
+    ET.ElementTree(root).write(new_filename)
+    return old_filename, new_filename
+
+
+def main(sizes):
+    print('{:>8} {:>10} {:>10} {:>10} {:>8}'.format('columns', 'MB', 'open s', 'diff s', 'changes'))
+    with tempfile.TemporaryDirectory() as directory:
+        for columns in sizes:
+            old_filename, new_filename = write_pair(directory, columns)
+            start = time.perf_counter()
+            old, new = Workbook(old_filename, lazy=True), Workbook(new_filename, lazy=True)
+            opened = time.perf_counter()
+            changes = diff(old, new)
+            done = time.perf_counter()
+            print('{:>8} {:>10.1f} {:>10.3f} {:>10.3f} {:>8}'.format(
+                columns, os.path.getsize(new_filename) / 1e6, opened - start, done - opened, len(changes)))
+
+
+if __name__ == '__main__':
+    main([int(x) for x in sys.argv[1:]] or [1000, 5000, 20000])
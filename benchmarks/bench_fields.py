@@ -0,0 +1,45 @@
+############################################################
+# Times Datasource.fields on synthetic data sources of growing
+# width. Field construction should grow linearly with the
+# number of columns, so the time per column should stay flat.
+# Also reports the Python memory held per field once built.
+#
+# Usage: python benchmarks/bench_fields.py [COLUMNS ...]
+############################################################
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from synthetic import make_datasource_xml  # noqa: E402
+from tableaudocumentapi import Datasource  # noqa: E402
+
+
+def time_fields(columns, repeat=3):
+    dsxml = make_datasource_xml(columns)
+    return min(timeit.repeat(lambda: Datasource(dsxml).fields, number=1, repeat=repeat))
+
+
+def memory_per_field(columns):
+    """Python memory held by the built fields, per field. The lxml tree is not counted."""
+    datasource = Datasource(make_datasource_xml(columns))
+    tracemalloc.start()
+    fields = datasource.fields
+    held, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del fields
+    return held / columns
+
+
+def main(sizes):
+    print('{:>8} {:>10} {:>14} {:>14}'.format('columns', 'seconds', 'us/column', 'bytes/field'))
+    for columns in sizes:
+        seconds = time_fields(columns)
+        print('{:>8} {:>10.4f} {:>14.2f} {:>14.0f}'.format(
+            columns, seconds, seconds / columns * 1e6, memory_per_field(columns)))
+
+
+if __name__ == '__main__':
+    main([int(x) for x in sys.argv[1:]] or [250, 500, 1000, 2000, 4000])
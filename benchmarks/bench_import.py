@@ -0,0 +1,54 @@
+############################################################
+# Times importing the package in a fresh interpreter, which
+# short-lived scripts pay on every run. Each statement is run
+# in a new process several times and the fastest run is kept.
+#
+# Exits with status 1 if a statement takes longer than its
+# budget, so it can gate changes to the package's imports.
+#
+# Usage: python benchmarks/bench_import.py [--repeat N]
+############################################################
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# Statement, and the most milliseconds it may take. Importing the package itself
+# loads nothing else, the classes pull in lxml, which is most of their cost.
+BUDGETS = [
+    ('import tableaudocumentapi', 10),
+    ('from tableaudocumentapi import Datasource', 100),
+    ('from tableaudocumentapi import Workbook', 100),
+]
+
+_TIMER = ('import time; start = time.perf_counter(); {}; '
+          'print((time.perf_counter() - start) * 1000)')
+
+
+def time_import(statement, repeat):
+    times = []
+    for _ in range(repeat):
+        output = subprocess.check_output([sys.executable, '-c', _TIMER.format(statement)], cwd=ROOT)
+        times.append(float(output))
+    return min(times)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Checks import times against their budgets.')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per statement, the fastest is kept')
+    args = parser.parse_args(argv)
+
+    over_budget = False
+    print('{:<45} {:>8} {:>8}'.format('statement', 'ms', 'budget'))
+    for statement, budget in BUDGETS:
+        milliseconds = time_import(statement, args.repeat)
+        over = milliseconds > budget
+        over_budget |= over
+        print('{:<45} {:>8.1f} {:>8} {}'.format(statement, milliseconds, budget, 'OVER BUDGET' if over else ''))
+    return 1 if over_budget else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
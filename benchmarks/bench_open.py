@@ -0,0 +1,55 @@
+############################################################
+# Times opening synthetic workbooks with wide datasources and
+# reports the cost per datasource, split into the parse and the
+# steps that walk the tree afterwards (connections, fields and
+# the worksheet index), using the instrumentation spans. The
+# walking steps should stay a small share of the parse.
+#
+# Usage: python benchmarks/bench_open.py [COLUMNS ...]
+############################################################
+import collections
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from synthetic import write_workbook  # noqa: E402
+from tableaudocumentapi import Workbook, instrumentation  # noqa: E402
+
+DATASOURCES = 10
+WORKSHEETS = 100
+REPEAT = 3
+
+STEPS = ('xml_open.parse', 'workbook.prepare_datasources', 'datasource.get_all_fields',
+         'workbook.prepare_worksheet_index')
+
+
+def time_open(filename):
+    """Best time of the whole open and of each step over REPEAT opens, in seconds."""
+    best = {}
+    for _ in range(REPEAT):
+        totals = collections.Counter()
+        with instrumentation.instrumented(lambda span: totals.update({span.name: span.seconds})):
+            start = time.perf_counter()
+            Workbook(filename)
+            totals['open'] = time.perf_counter() - start
+        for name, seconds in totals.items():
+            best[name] = min(best.get(name, seconds), seconds)
+    return best
+
+
+def main(sizes):
+    print('{:>8} {:>10}'.format('columns', 'ms/ds') + ''.join(' {:>14}'.format(x.split('.')[-1][:14]) for x in STEPS))
+    with tempfile.TemporaryDirectory() as directory:
+        for columns in sizes:
+            filename = os.path.join(directory, 'wide.twb')
+            write_workbook(filename, DATASOURCES, columns, WORKSHEETS)
+            best = time_open(filename)
+            print('{:>8} {:>10.2f}'.format(columns, best['open'] * 1000 / DATASOURCES) +
+                  ''.join(' {:>14.2f}'.format(best.get(x, 0) * 1000 / DATASOURCES) for x in STEPS))
+
+
+if __name__ == '__main__':
+    main([int(x) for x in sys.argv[1:]] or [500, 2000, 8000])
@@ -0,0 +1,51 @@
+############################################################
+# Times Workbook.rename_fields on a synthetic workbook, renaming
+# a growing number of fields of one datasource in one call, and
+# in one call per field for comparison. A single call makes one
+# pass over the workbook whatever the number of renames, so its
+# time should stay nearly flat.
+#
+# Usage: python benchmarks/bench_rename.py [RENAMES ...]
+############################################################
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from synthetic import make_workbook_xml  # noqa: E402
+from lxml import etree as ET  # noqa: E402
+from tableaudocumentapi import Workbook  # noqa: E402
+
+DATASOURCES = 10
+COLUMNS = 2000
+WORKSHEETS = 500
+# Renaming one field per call gets slow quickly, so it is only timed up to this many
+MAX_SEPARATE_CALLS = 10
+
+
+def renames(count):
+    return {'[col{}]'.format(i): '[Renamed {}]'.format(i) for i in range(count)}
+
+
+def time_rename(data, count, separate):
+    workbook = Workbook(data)
+    start = time.perf_counter()
+    if separate:
+        for old, new in renames(count).items():
+            workbook.rename_fields('federated.bench0', {old: new})
+    else:
+        workbook.rename_fields('federated.bench0', renames(count))
+    return time.perf_counter() - start
+
+
+def main(counts):
+    data = ET.tostring(make_workbook_xml(DATASOURCES, COLUMNS, WORKSHEETS))
+    print('{:>8} {:>12} {:>12}'.format('renames', 'one call s', 'per field s'))
+    for count in counts:
+        separate = '{:>12.3f}'.format(time_rename(data, count, True)) if count <= MAX_SEPARATE_CALLS else ''
+        print('{:>8} {:>12.3f} {:>12}'.format(count, time_rename(data, count, False), separate))
+
+
+if __name__ == '__main__':
+    main([int(x) for x in sys.argv[1:]] or [1, 10, 100, 1000])
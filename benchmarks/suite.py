@@ -0,0 +1,188 @@
+############################################################
+# Benchmark suite over synthetic workbooks and data sources.
+#
+# Generates .twb, .twbx and .tds files for every size in the
+# chosen preset (datasources x columns x worksheets x extract
+# bytes), times opening, field construction, connection edits,
+# saving and package rewrites, and writes the results as JSON.
+#
+# With --compare, the results are checked against a stored
+# baseline and the run fails if any case got slower than the
+# threshold allows.
+#
+# Usage:
+#   python benchmarks/suite.py [--preset small|medium|large] [--output results.json]
+#   python benchmarks/suite.py --compare baseline.json [--threshold 1.25]
+############################################################
+import argparse
+import collections
+import datetime
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import synthetic  # noqa: E402
+from lxml import etree  # noqa: E402
+from tableaudocumentapi import Datasource, Workbook  # noqa: E402
+from tableaudocumentapi.xfile import HEAVY_SUBTREES, xml_open  # noqa: E402
+
+RESULTS_VERSION = 1
+
+Size = collections.namedtuple('Size', ['datasources', 'columns', 'worksheets', 'extract_bytes'])
+
+PRESETS = {
+    'small': [Size(1, 100, 10, 0), Size(2, 500, 25, 1024 * 1024)],
+    'medium': [Size(1, 100, 10, 0), Size(2, 500, 25, 1024 * 1024), Size(5, 1000, 100, 16 * 1024 * 1024)],
+    'large': [Size(2, 500, 25, 1024 * 1024), Size(5, 1000, 100, 16 * 1024 * 1024),
+              Size(10, 4000, 400, 128 * 1024 * 1024)],
+}
+
+# About the size Tableau Desktop saves for a 192x192 sheet thumbnail
+THUMBNAIL_BYTES = 32 * 1024
+
+# Differences smaller than this are timer noise, whatever the ratio
+MIN_REGRESSION_SECONDS = 0.005
+
+
+def _best_of(func, repeat):
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def _edit_connections(datasources):
+    for datasource in datasources:
+        for connection in datasource.connections:
+            connection.server = 'moved.example.com'
+            connection.dbname = 'moved'
+
+
+def _save_modified(document):
+    # Saving an unmodified document does nothing, so every timed run needs a change to write
+    document.mark_modified()
+    document.save()
+
+
+def _cases(size, directory):
+    """Yields (case name, function) pairs for one size. Each function is timed
+    on its own, against files generated once for the size."""
+    twb = synthetic.write_workbook(os.path.join(directory, 'bench.twb'), size.datasources, size.columns,
+                                   size.worksheets, thumbnail_bytes=THUMBNAIL_BYTES)
+    twbx = synthetic.write_workbook(os.path.join(directory, 'bench.twbx'), size.datasources, size.columns,
+                                    size.worksheets, size.extract_bytes)
+    tds = synthetic.write_datasource(os.path.join(directory, 'bench.tds'), size.columns)
+    output = os.path.join(directory, 'output')
+
+    yield 'xml_open.twb', lambda: xml_open(twb, 'workbook')
+    yield 'xml_open.twbx', lambda: xml_open(twbx, 'workbook')
+    yield 'xml_open.tds', lambda: xml_open(tds, 'datasource')
+    yield 'workbook.open', lambda: Workbook(twb)
+    yield 'workbook.open_lazy', lambda: Workbook(twb, lazy=True)
+    yield 'workbook.open_opaque', lambda: Workbook(twb, lazy=True, opaque_subtrees=HEAVY_SUBTREES)
+
+    datasource_xml = synthetic.make_datasource_xml(size.columns)
+    yield 'datasource.fields', lambda: Datasource(datasource_xml).fields
+
+    workbook = Workbook(twb, lazy=True)
+    yield 'connections.edit', lambda: _edit_connections(workbook.datasources)
+
+    yield 'workbook.save_as.twb', lambda: workbook.save_as(output + '.twb')
+    yield 'datasource.save_as.tds', lambda: Datasource.from_file(tds).save_as(output + '.tds')
+
+    package = Workbook(twbx, lazy=True)
+    _edit_connections(package.datasources)
+    yield 'workbook.save_as.twbx', lambda: package.save_as(output + '.twbx')
+
+    # Saving in place rewrites the package the workbook was opened from
+    rewrite = os.path.join(directory, 'rewrite.twbx')
+    shutil.copy(twbx, rewrite)
+    in_place = Workbook(rewrite, lazy=True)
+    _edit_connections(in_place.datasources)
+    yield 'workbook.save.twbx', lambda: _save_modified(in_place)
+
+
+def _case_name(case, size):
+    return '{}[ds={},cols={},sheets={},extract={}]'.format(case, *size)
+
+
+def run(sizes, repeat=3):
+    """Runs every case for every size.
+
+    Returns:
+        A dict of results, ready to be written as JSON.
+    """
+    results = collections.OrderedDict()
+    for size in sizes:
+        directory = tempfile.mkdtemp('tda-bench')
+        try:
+            for case, func in _cases(size, directory):
+                seconds = _best_of(func, repeat)
+                results[_case_name(case, size)] = {'case': case, 'size': size._asdict(), 'seconds': seconds}
+                print('{:<75} {:>10.4f}'.format(_case_name(case, size), seconds))
+        finally:
+            shutil.rmtree(directory)
+
+    return {
+        'version': RESULTS_VERSION,
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'lxml': '.'.join(str(x) for x in etree.LXML_VERSION),
+        'platform': platform.platform(),
+        'results': results,
+    }
+
+
+def compare(results, baseline, threshold):
+    """Compares `results` with a `baseline` run of the suite.
+
+    Returns:
+        (name, baseline seconds, seconds, ratio) tuples for the cases that got slower
+        than `threshold` times the baseline. List.
+    """
+    if baseline.get('version') != RESULTS_VERSION:
+        raise ValueError('Baseline was written by a different version of the suite')
+
+    regressions = []
+    for name, result in results['results'].items():
+        before = baseline['results'].get(name)
+        if before is None:
+            continue
+        seconds, base = result['seconds'], before['seconds']
+        ratio = seconds / base if base else float('inf')
+        if ratio > threshold and seconds - base > MIN_REGRESSION_SECONDS:
+            regressions.append((name, base, seconds, ratio))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks the document API on synthetic files.')
+    parser.add_argument('--preset', choices=sorted(PRESETS), default='small')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per case, the fastest is kept')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--compare', metavar='BASELINE', help='results file to check for regressions against')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='slowdown ratio over the baseline that counts as a regression')
+    args = parser.parse_args(argv)
+
+    results = run(PRESETS[args.preset], args.repeat)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for name, base, seconds, ratio in regressions:
+            print('REGRESSION {}: {:.4f}s -> {:.4f}s ({:.2f}x)'.format(name, base, seconds, ratio))
+        if regressions:
+            return 1
+        print('No regressions over {:.2f}x the baseline'.format(args.threshold))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,146 @@
+############################################################
+# Generators for synthetic Tableau files used by the benchmarks.
+#
+# Files are shaped like the ones Tableau Desktop writes, with
+# federated datasources holding a named connection, metadata
+# records and columns (some of them calculations), and
+# worksheets depending on a handful of columns each.
+############################################################
+import os
+import zipfile
+
+from lxml import etree as ET
+
+VERSION = '18.1'
+CALCULATION_EVERY = 5
+COLUMNS_PER_WORKSHEET = 5
+# The card layout Tableau Desktop saves for a new worksheet window
+WINDOW_CARDS = (('left', ('pages', 'filters', 'marks')), ('top', ('columns', 'rows', 'title')))
+
+
+def _column_name(column):
+    return '[col{}]'.format(column)
+
+
+def make_datasource_xml(columns, index=0, version=VERSION):
+    """Builds an extract style datasource with `columns` columns, where every
+    column has both a <column> element and a metadata-record."""
+    root = ET.Element('datasource', caption='Datasource {}'.format(index), inline='true',
+                      name='federated.bench{}'.format(index), version=version)
+    connection = ET.SubElement(root, 'connection', {'class': 'federated'})
+    named_connections = ET.SubElement(connection, 'named-connections')
+    named_connection = ET.SubElement(named_connections, 'named-connection',
+                                     caption='server{}'.format(index), name='postgres.bench{}'.format(index))
+    ET.SubElement(named_connection, 'connection', {'class': 'postgres'}, dbname='db{}'.format(index),
+                  server='server{}.example.com'.format(index), port='5432', username='bench', schema='public')
+    ET.SubElement(connection, 'relation', connection='postgres.bench{}'.format(index),
+                  name='facts', table='[public].[facts]', type='table')
+
+    records = ET.SubElement(connection, 'metadata-records')
+    for i in range(columns):
+        record = ET.SubElement(records, 'metadata-record', {'class': 'column'})
+        ET.SubElement(record, 'remote-name').text = 'col{}'.format(i)
+        ET.SubElement(record, 'local-name').text = _column_name(i)
+        ET.SubElement(record, 'parent-name').text = '[facts]'
+        ET.SubElement(record, 'local-type').text = 'integer'
+        ET.SubElement(record, 'aggregation').text = 'Sum'
+
+    for i in range(columns):
+        column = ET.SubElement(root, 'column', caption='Col {}'.format(i), datatype='integer',
+                               name=_column_name(i), role='measure', type='quantitative')
+        if i % CALCULATION_EVERY == CALCULATION_EVERY - 1:
+            ET.SubElement(column, 'calculation', formula='{} * 2'.format(_column_name(i - 1)),
+                          **{'class': 'tableau'})
+    return root
+
+
+def make_workbook_xml(datasources, columns, worksheets, thumbnail_bytes=0):
+    """Builds a workbook with `datasources` datasources of `columns` columns each, and
+    `worksheets` worksheets each using a few columns of one datasource. Thumbnails
+    of `thumbnail_bytes` base64 characters are added for every worksheet."""
+    root = ET.Element('workbook', version=VERSION)
+    ET.SubElement(root, 'preferences')
+    datasources_element = ET.SubElement(root, 'datasources')
+    for i in range(datasources):
+        datasources_element.append(make_datasource_xml(columns, i))
+
+    worksheets_element = ET.SubElement(root, 'worksheets')
+    for i in range(worksheets):
+        worksheet = ET.SubElement(worksheets_element, 'worksheet', name='Sheet {}'.format(i))
+        table = ET.SubElement(worksheet, 'table')
+        view = ET.SubElement(table, 'view')
+        view_datasources = ET.SubElement(view, 'datasources')
+        datasource_name = 'federated.bench{}'.format(i % max(datasources, 1))
+        ET.SubElement(view_datasources, 'datasource', name=datasource_name)
+        dependencies = ET.SubElement(view, 'datasource-dependencies', datasource=datasource_name)
+        for j in range(min(COLUMNS_PER_WORKSHEET, columns)):
+            ET.SubElement(dependencies, 'column', datatype='integer', name=_column_name((i + j) % columns),
+                          role='measure', type='quantitative')
+        for j in range(min(2, columns)):
+            ET.SubElement(dependencies, 'column-instance', column=_column_name((i + j) % columns),
+                          derivation='Sum', name='[sum:col{}:qk]'.format((i + j) % columns), pivot='key',
+                          type='quantitative')
+        rows = ' * '.join('[{}].[sum:col{}:qk]'.format(datasource_name, (i + j) % columns)
+                          for j in range(min(2, columns)))
+        ET.SubElement(table, 'rows').text = rows
+
+    dashboards = ET.SubElement(root, 'dashboards')
+    ET.SubElement(dashboards, 'dashboard', name='Dashboard 1')
+
+    windows = ET.SubElement(root, 'windows')
+    for i in range(worksheets):
+        window = ET.SubElement(windows, 'window', {'class': 'worksheet', 'name': 'Sheet {}'.format(i)})
+        cards = ET.SubElement(window, 'cards')
+        for edge_name, card_types in WINDOW_CARDS:
+            strip = ET.SubElement(ET.SubElement(cards, 'edge', name=edge_name), 'strip', size='160')
+            for card_type in card_types:
+                ET.SubElement(strip, 'card', type=card_type)
+        ET.SubElement(window, 'viewpoint')
+        ET.SubElement(window, 'simple-id', uuid='{{00000000-0000-0000-0000-{:012d}}}'.format(i))
+
+    if thumbnail_bytes:
+        thumbnails = ET.SubElement(root, 'thumbnails')
+        image = 'iVBORw0KGgo' * (thumbnail_bytes // 11 + 1)
+        for i in range(worksheets):
+            ET.SubElement(thumbnails, 'thumbnail', height='192', name='Sheet {}'.format(i),
+                          width='192').text = image[:thumbnail_bytes]
+    return root
+
+
+def _write_xml(root, filename):
+    ET.ElementTree(root).write(filename, encoding='utf-8', xml_declaration=True)
+
+
+def _write_package(root, filename, document_name, extracts, extract_bytes):
+    with zipfile.ZipFile(filename, 'w', compression=zipfile.ZIP_DEFLATED, allowZip64=True) as package:
+        package.writestr(document_name, ET.tostring(root, encoding='utf-8', xml_declaration=True))
+        for i in range(extracts):
+            # Random bytes, so the extract doesn't compress, like real .hyper files
+            with package.open('Data/Extracts/bench{}.hyper'.format(i), 'w', force_zip64=True) as extract:
+                remaining = extract_bytes
+                while remaining > 0:
+                    chunk = min(remaining, 1024 * 1024)
+                    extract.write(os.urandom(chunk))
+                    remaining -= chunk
+
+
+def write_workbook(filename, datasources, columns, worksheets, extract_bytes=0, thumbnail_bytes=0):
+    """Writes a synthetic .twb, or a .twbx holding an extract of `extract_bytes`
+    bytes per datasource if `filename` ends with .twbx."""
+    root = make_workbook_xml(datasources, columns, worksheets, thumbnail_bytes)
+    if filename.endswith('.twbx'):
+        _write_package(root, filename, 'Bench.twb', datasources if extract_bytes else 0, extract_bytes)
+    else:
+        _write_xml(root, filename)
+    return filename
+
+
+def write_datasource(filename, columns, extract_bytes=0):
+    """Writes a synthetic .tds, or a .tdsx holding an extract of `extract_bytes`
+    bytes if `filename` ends with .tdsx."""
+    root = make_datasource_xml(columns)
+    if filename.endswith('.tdsx'):
+        _write_package(root, filename, 'Bench.tds', 1 if extract_bytes else 0, extract_bytes)
+    else:
+        _write_xml(root, filename)
+    return filename
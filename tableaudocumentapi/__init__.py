@@ -1,7 +1,29 @@
-from .field import Field
-from .connection import Connection
-from .datasource import Datasource, ConnectionParser
-from .workbook import Workbook
+import importlib
+
+# The public classes are imported from their modules the first time they are used,
+# so importing the package stays cheap for code that only needs part of it
+_LAZY_ATTRIBUTES = {
+    'Field': '.field',
+    'Connection': '.connection',
+    'Datasource': '.datasource',
+    'ConnectionParser': '.datasource',
+    'Worksheet': '.worksheet',
+    'Workbook': '.workbook',
+}
+
+__all__ = list(_LAZY_ATTRIBUTES)
 
 __version__ = '0.0.1'
 __VERSION__ = __version__
+
+
+def __getattr__(name):
+    if name not in _LAZY_ATTRIBUTES:
+        raise AttributeError("module '{}' has no attribute '{}'".format(__name__, name))
+    value = getattr(importlib.import_module(_LAZY_ATTRIBUTES[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES))
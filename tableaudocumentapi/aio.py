@@ -0,0 +1,103 @@
+import functools
+import threading
+import weakref
+
+# Most opens and saves run at the same time per event loop, unless changed with `set_concurrency_limit`
+DEFAULT_CONCURRENCY_LIMIT = 4
+
+_executor = None
+_limit = DEFAULT_CONCURRENCY_LIMIT
+_semaphores = weakref.WeakKeyDictionary()
+_state = threading.local()
+
+
+class OperationCancelled(Exception):
+    """Raised inside a worker thread when the coroutine it runs for was cancelled."""
+    pass
+
+
+def set_executor(executor):
+    """Runs the work of `Workbook.open_async` and the async saves in `executor`, a
+    `concurrent.futures.Executor`. Pass None to use the event loop's default
+    executor, which is the default.
+
+    Returns:
+        The previous executor.
+    """
+    global _executor
+    previous, _executor = _executor, executor
+    return previous
+
+
+def set_concurrency_limit(limit):
+    """Lets at most `limit` async opens and saves run at the same time in each
+    event loop. Later calls wait for a slot. Pass None for no limit.
+
+    Returns:
+        The previous limit.
+    """
+    global _limit
+    previous, _limit = _limit, limit
+    return previous
+
+
+def checkpoint():
+    """Raises OperationCancelled if the coroutine the current thread works for was
+    cancelled. Called between the steps of opening and saving, so a cancelled
+    operation stops early instead of holding its slot until it completes."""
+    cancelled = getattr(_state, 'cancelled', None)
+    if cancelled is not None and cancelled.is_set():
+        raise OperationCancelled()
+
+
+def _semaphore(loop):
+    import asyncio
+    limit, semaphore = _semaphores.get(loop, (None, None))
+    if semaphore is None or limit != _limit:
+        semaphore = asyncio.Semaphore(_limit) if _limit else None
+        _semaphores[loop] = (_limit, semaphore)
+    return semaphore
+
+
+def _call_in_worker(cancelled, func, args, kwargs):
+    _state.cancelled = cancelled
+    try:
+        checkpoint()
+        return func(*args, **kwargs)
+    finally:
+        _state.cancelled = None
+
+
+async def run(func, *args, executor=None, **kwargs):
+    """Calls `func(*args, **kwargs)` in `executor`, or the one set with
+    `set_executor`, once a slot is free, and returns its result.
+
+    If the calling task is cancelled, the work is asked to stop at its next
+    `checkpoint`, and the slot is kept until it has. A cancelled save never
+    replaces the file being saved to.
+    """
+    import asyncio
+    loop = asyncio.get_running_loop()
+    semaphore = _semaphore(loop)
+    if semaphore is not None:
+        await semaphore.acquire()
+    try:
+        cancelled = threading.Event()
+        future = loop.run_in_executor(
+            executor or _executor, functools.partial(_call_in_worker, cancelled, func, args, kwargs))
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            cancelled.set()
+            while not future.done():
+                try:
+                    # Waiting doesn't cancel the future, unlike awaiting it
+                    await asyncio.wait([future])
+                except asyncio.CancelledError:
+                    pass  # Cancelled again, the slot is still held until the work has stopped
+            if not future.cancelled():
+                future.exception()  # The error, usually OperationCancelled, is expected now
+            raise
+    finally:
+        if semaphore is not None:
+            semaphore.release()
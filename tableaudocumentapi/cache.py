@@ -0,0 +1,207 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import zlib
+
+import tableaudocumentapi
+from tableaudocumentapi.scanner import ConnectionRecord, DatasourceRecord, FieldRecord, FileSummary, WorksheetRecord, \
+    _summarize_file
+
+# Bump whenever the records or the way they are stored change, so old entries are dropped.
+# Caches are also emptied when the installed version of the library changes, see _library_version.
+CACHE_FORMAT_VERSION = 2
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)',
+    'CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, digest TEXT)',
+    'CREATE TABLE IF NOT EXISTS summaries (digest TEXT PRIMARY KEY, data BLOB, size INTEGER, last_used REAL)',
+    'CREATE INDEX IF NOT EXISTS summaries_last_used ON summaries (last_used)',
+)
+
+
+def _library_version():
+    # The version of the installed distribution follows releases, `__version__` doesn't.
+    # Running from a source checkout there is none, and only CACHE_FORMAT_VERSION tells caches apart.
+    try:
+        import importlib.metadata as metadata  # Only needed here, and slow to import
+    except ImportError:
+        # Python 3.7, where setuptools knows the installed distributions instead
+        import pkg_resources
+        try:
+            return pkg_resources.get_distribution('tableaudocumentapi').version
+        except pkg_resources.DistributionNotFound:
+            return tableaudocumentapi.__version__
+    try:
+        return metadata.version('tableaudocumentapi')
+    except metadata.PackageNotFoundError:
+        return tableaudocumentapi.__version__
+
+
+def _content_digest(filename):
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _summarize_file_with_digest(filename):
+    """Scans `filename` and hashes its contents, in a worker process of a cached scan,
+    so the parent process doesn't have to read the file as well.
+
+    Returns:
+        The FileSummary and the content hash, or None if the file couldn't be read. Tuple.
+    """
+    summary = _summarize_file(filename)
+    try:
+        digest = _content_digest(filename) if summary.error is None else None
+    except OSError:
+        digest = None
+    return summary, digest
+
+
+def _encode_summary(summary):
+    # JSON rather than pickle, so a cache file can't run code when it is loaded
+    return zlib.compress(json.dumps(summary[1:]).encode('utf-8'))
+
+
+def _decode_summary(filename, data):
+    datasources, worksheets, dashboards, shapes, error = json.loads(zlib.decompress(data).decode('utf-8'))
+    return FileSummary(
+        filename,
+        tuple(DatasourceRecord(name, caption, version, tuple(ConnectionRecord(*x) for x in connections),
+                               tuple(FieldRecord(*x) for x in fields), fingerprint)
+              for name, caption, version, connections, fields, fingerprint in datasources),
+        tuple(WorksheetRecord(name, tuple(tuple(x) for x in dependencies)) for name, dependencies in worksheets),
+        tuple(dashboards),
+        tuple(shapes),
+        error)
+
+
+class SummaryCache(object):
+    """An on-disk cache of the FileSummary of workbook and data source files, so
+    files that haven't changed since the last scan don't have to be read again.
+
+    A file is looked up by its path, size and modification time. If the path is
+    known but its size or modification time changed, its content hash is used
+    instead, so a file that was touched without being changed is still found.
+    Files at new paths are not read by `get`. Summaries are stored once per content
+    hash, so copies of a file share one, and the least recently used ones are
+    dropped when the cache grows over `max_bytes`. The cache is emptied when it was
+    written by a different installed version of the library, or with a different
+    CACHE_FORMAT_VERSION, which has to be bumped by hand when the records change.
+
+    Summaries that have their `error` field set are never cached.
+    """
+
+    def __init__(self, filename, max_bytes=DEFAULT_MAX_BYTES):
+        """Opens the cache stored at `filename`, creating it if needed."""
+        self._max_bytes = max_bytes
+        # (size, mtime, digest or None) of the files `get` missed, for `put` to reuse
+        self._pending = {}
+        self.hits = 0
+        self.misses = 0
+
+        self._db = sqlite3.connect(filename)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._check_version()
+        self._total_bytes = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM summaries').fetchone()[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _check_version(self):
+        version = '{}/{}'.format(CACHE_FORMAT_VERSION, _library_version())
+        with self._db:
+            for statement in _SCHEMA:
+                self._db.execute(statement)
+            row = self._db.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+            if row is None or row[0] != version:
+                self._db.execute('DELETE FROM files')
+                self._db.execute('DELETE FROM summaries')
+                self._db.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (version,))
+
+    def _load(self, digest, filename):
+        row = self._db.execute('SELECT data FROM summaries WHERE digest = ?', (digest,)).fetchone()
+        if row is None:
+            return None
+        self._db.execute('UPDATE summaries SET last_used = ? WHERE digest = ?', (time.time(), digest))
+        return _decode_summary(filename, row[0])
+
+    def get(self, filename):
+        """Returns the cached FileSummary of `filename`, or None if the file isn't in
+        the cache or has changed since it was added."""
+        path = os.path.abspath(filename)
+        stat = os.stat(path)
+        with self._db:
+            row = self._db.execute('SELECT size, mtime_ns, digest FROM files WHERE path = ?', (path,)).fetchone()
+            if row is None:
+                # Hashing a file that was never seen would mean reading it here as well as in the scan
+                summary = None
+                self._pending[path] = (stat.st_size, stat.st_mtime_ns, None)
+            elif row[:2] == (stat.st_size, stat.st_mtime_ns):
+                summary = self._load(row[2], filename)
+            else:
+                digest = _content_digest(path)
+                summary = self._load(digest, filename)
+                if summary is not None:
+                    self._db.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)',
+                                     (path, stat.st_size, stat.st_mtime_ns, digest))
+                else:
+                    self._pending[path] = (stat.st_size, stat.st_mtime_ns, digest)
+
+        if summary is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return summary
+
+    def put(self, filename, summary, digest=None):
+        """Adds the FileSummary of `filename` to the cache. If `get` missed the file
+        and it has changed since, the summary may be out of date and is not added.
+        `digest` is the content hash of the file, if it is already known."""
+        path = os.path.abspath(filename)
+        key = self._pending.pop(path, None)
+        if summary.error is not None:
+            return
+
+        stat = os.stat(path)
+        if key is not None and key[:2] != (stat.st_size, stat.st_mtime_ns):
+            return
+        digest = digest or (key[2] if key is not None else None) or _content_digest(path)
+        key = (stat.st_size, stat.st_mtime_ns, digest)
+
+        data = _encode_summary(summary)
+        with self._db:
+            self._db.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)', (path,) + key)
+            old = self._db.execute('SELECT size FROM summaries WHERE digest = ?', (key[2],)).fetchone()
+            self._db.execute('INSERT OR REPLACE INTO summaries VALUES (?, ?, ?, ?)',
+                             (key[2], data, len(data), time.time()))
+            self._total_bytes += len(data) - (old[0] if old else 0)
+            self._evict()
+
+    def _evict(self):
+        if self._total_bytes <= self._max_bytes:
+            return
+        rows = self._db.execute('SELECT digest, size FROM summaries ORDER BY last_used')
+        evicted = []
+        for digest, size in rows:
+            if self._total_bytes <= self._max_bytes:
+                break
+            evicted.append((digest,))
+            self._total_bytes -= size
+        self._db.executemany('DELETE FROM summaries WHERE digest = ?', evicted)
+        self._db.executemany('DELETE FROM files WHERE digest = ?', evicted)
+
+    def close(self):
+        self._db.close()
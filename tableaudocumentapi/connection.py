@@ -1,5 +1,31 @@
+import weakref
+
 from lxml import etree as ET
 from tableaudocumentapi.dbclass import is_valid_dbclass
+from tableaudocumentapi.property_decorators import marks_modified
+
+# Connection properties that connections can be looked up by, and the ones that can be changed
+MATCHABLE_ATTRIBUTES = ('server', 'dbname', 'username', 'port', 'schema', 'service', 'dbclass',
+                        'authentication', 'query_band', 'initial_sql', 'named_connection')
+CHANGEABLE_ATTRIBUTES = ('server', 'dbname', 'username', 'port', 'schema', 'service', 'dbclass',
+                         'query_band', 'initial_sql')
+
+# Properties that `_ConnectionIndex` keeps an index of
+INDEXED_ATTRIBUTES = ('dbclass', 'server', 'dbname', 'named_connection')
+
+
+def _validate_match(match):
+    unknown = set(match) - set(MATCHABLE_ATTRIBUTES)
+    if unknown:
+        raise ValueError("Can't match connections on {}".format(sorted(unknown)))
+
+
+def _validate_changes(changes):
+    unknown = set(changes) - set(CHANGEABLE_ATTRIBUTES)
+    if unknown:
+        raise ValueError("Can't change connection attributes {}".format(sorted(unknown)))
+    if 'dbclass' in changes and not is_valid_dbclass(changes['dbclass']):
+        raise AttributeError("'{}' is not a valid database type".format(changes['dbclass']))
 
 
 class Connection(object):
@@ -22,6 +48,8 @@ class Connection(object):
         self._port = connxml.get('port', None)
         self._query_band = connxml.get('query-band-spec', None)
         self._initial_sql = connxml.get('one-time-sql', None)
+        self._modified = False
+        self._owner = None
 
     def __repr__(self):
         return "'<Connection server='{}' dbname='{}' @ {}>'".format(self._server, self._dbname, hex(id(self)))
@@ -46,12 +74,54 @@ class Connection(object):
 
         return xml
 
+    @property
+    def modified(self):
+        """Whether the connection was changed since it was read or the document was last saved."""
+        return self._modified
+
+    @property
+    def named_connection(self):
+        """Name of the named-connection element holding the connection, None for connections outside one."""
+        parent = self._connectionXML.getparent()
+        if parent is None or parent.tag != 'named-connection':
+            return None
+        return parent.get('name')
+
+    def update(self, **changes):
+        """
+        Set several properties of the connection at once. Nothing is changed unless all
+        of the new values are valid.
+
+        Args:
+            **changes:  New values by property name, one of CHANGEABLE_ATTRIBUTES.
+
+        Returns:
+            Whether any property changed value. Boolean.
+
+        """
+        _validate_changes(changes)
+        updates = [(k, v) for k, v in changes.items() if getattr(self, k) != v]
+        for attrib, value in updates:
+            setattr(self, attrib, value)
+        return bool(updates)
+
+    def _set_owner(self, connection_index):
+        # Only a weak reference, the index already holds on to its connections
+        self._owner = weakref.ref(connection_index)
+
+    def _notify_change(self, attrib, old_value, new_value):
+        """Tells the index holding this connection that a property changed, so it can update itself."""
+        owner = self._owner() if self._owner is not None else None
+        if owner is not None:
+            owner._connection_changed(self, attrib, old_value, new_value)
+
     @property
     def dbname(self):
         """Database name for the connection. Not the table name."""
         return self._dbname
 
     @dbname.setter
+    @marks_modified
     def dbname(self, value):
         """
         Set the connection's database name property.
@@ -72,6 +142,7 @@ class Connection(object):
         return self._server
 
     @server.setter
+    @marks_modified
     def server(self, value):
         """
         Set the connection's server property.
@@ -92,6 +163,7 @@ class Connection(object):
         return self._username
 
     @username.setter
+    @marks_modified
     def username(self, value):
         """
         Set the connection's username property.
@@ -117,6 +189,7 @@ class Connection(object):
         return self._class
 
     @dbclass.setter
+    @marks_modified
     def dbclass(self, value):
         """Set the connection's dbclass property.
 
@@ -139,6 +212,7 @@ class Connection(object):
         return self._port
 
     @port.setter
+    @marks_modified
     def port(self, value):
         """Set the connection's port property.
 
@@ -165,6 +239,7 @@ class Connection(object):
         return self._query_band
 
     @query_band.setter
+    @marks_modified
     def query_band(self, value):
         """Set the connection's query_band property.
 
@@ -191,6 +266,7 @@ class Connection(object):
         return self._initial_sql
 
     @initial_sql.setter
+    @marks_modified
     def initial_sql(self, value):
         """Set the connection's initial_sql property.
 
@@ -217,6 +293,7 @@ class Connection(object):
         return self._schema
 
     @schema.setter
+    @marks_modified
     def schema(self, value):
         """
         Set the connection's schema property.
@@ -237,6 +314,7 @@ class Connection(object):
         return self._service
 
     @service.setter
+    @marks_modified
     def service(self, value):
         """
         Set the connection's service property.
@@ -250,3 +328,36 @@ class Connection(object):
         """
         self._service = value
         self._connectionXML.set('service', value)
+
+
+class _ConnectionIndex(object):
+    """Connections by the values of their INDEXED_ATTRIBUTES, kept up to date as the
+    connections are changed through their properties."""
+
+    def __init__(self, connections):
+        self.connections = list(connections)
+        self._positions = {x: i for i, x in enumerate(self.connections)}
+        self._by_attribute = {x: {} for x in INDEXED_ATTRIBUTES}
+        for connection in self.connections:
+            for attrib, index in self._by_attribute.items():
+                index.setdefault(getattr(connection, attrib), {})[connection] = None
+            connection._set_owner(self)
+
+    def _connection_changed(self, connection, attrib, old_value, new_value):
+        index = self._by_attribute.get(attrib)
+        if index is None:
+            return
+        del index[old_value][connection]
+        if not index[old_value]:
+            del index[old_value]
+        index.setdefault(new_value, {})[connection] = None
+
+    def find(self, match):
+        """The connections whose properties have all the values in `match`, in document order."""
+        _validate_match(match)
+        candidates = [self._by_attribute[k].get(v, {}) for k, v in match.items() if k in self._by_attribute]
+        # Narrow down with the smallest index entry, then check the rest of the properties
+        candidates = min(candidates, key=len) if candidates else self._positions
+        found = [x for x in candidates if all(getattr(x, k) == v for k, v in match.items())]
+        found.sort(key=self._positions.__getitem__)
+        return found
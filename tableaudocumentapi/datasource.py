@@ -1,46 +1,80 @@
 import collections
+import functools
+import io
 import itertools
 from lxml import etree as ET
-import xml.sax.saxutils as sax
-from uuid import uuid4
 
-from tableaudocumentapi import Connection, xfile
+from tableaudocumentapi import Connection, instrumentation, xfile
 from tableaudocumentapi import Field
+from tableaudocumentapi.field import _find_child
+from tableaudocumentapi.fingerprint import fingerprints
 from tableaudocumentapi.multilookup_dict import MultiLookupDict
-from tableaudocumentapi.xfile import xml_open
+from tableaudocumentapi.property_decorators import marks_modified
+from tableaudocumentapi.xfile import parse_version, xml_open
 
 
 _ColumnObjectReturnTuple = collections.namedtuple('_ColumnObjectReturnTupleType', ['id', 'object'])
 
 
-def _get_metadata_xml_for_field(root_xml, field_name):
-    if "'" in field_name:
-        field_name = sax.escape(field_name, {"'": "&apos;"})
-    xpath = u".//metadata-record[@class='column'][local-name='{}']".format(field_name)
-    return root_xml.find(xpath)
+def _build_metadata_index(metadata_records):
+    """Maps the local-name of each column metadata-record to the record, for matching
+    records to columns. If a name appears more than once the first record wins, as it
+    did with the XPath lookup."""
+    index = {}
+    for record in metadata_records:
+        index.setdefault(record.findtext('local-name'), record)
+    return index
 
 
-def _is_used_by_worksheet(names, field):
-    return any(y for y in names if y in field.worksheets)
+class FieldDictionary(MultiLookupDict):
+    """ The fields of a datasource, by id, caption or alias.
 
+    Besides the alias and caption lookups, fields are indexed by role, datatype, type
+    and the worksheets using them, and the indexes follow changes made to the fields.
+    """
 
-class FieldDictionary(MultiLookupDict):
+    def __init__(self, args=None):
+        super(FieldDictionary, self).__init__(args)
+        # Called with the id and new formula of a field whose calculation is set, see Datasource.dependencies
+        self._calculation_listener = None
+        for index_name in ('role', 'datatype', 'type'):
+            self.register_index(index_name)
+        self.register_index('worksheets', multi_valued=True)
+        for field in self.values():
+            field._set_owner(self)
+
+    def _insert(self, real_key, value):
+        if real_key in self:
+            # A replaced field must stop reindexing the entry that now belongs to `value`
+            dict.__getitem__(self, real_key)._set_owner(None)
+        super(FieldDictionary, self)._insert(real_key, value)
+        value._set_owner(self)
+
+    def _discard(self, real_key):
+        dict.__getitem__(self, real_key)._set_owner(None)
+        super(FieldDictionary, self)._discard(real_key)
+
+    def _field_changed(self, field, attrib, old_value, new_value):
+        if attrib in self._indexes:
+            self._reindex(field.id, attrib, old_value, new_value)
+        if attrib == 'calculation' and self._calculation_listener is not None:
+            self._calculation_listener(field.id, new_value)
 
     def used_by_sheet(self, name):
-        # If we pass in a string, no need to get complicated, just check to see if name is in
-        # the field's list of worksheets
+        # If we pass in a string, no need to get complicated, just look up the fields the worksheet uses
         if isinstance(name, str):
-            return [x for x in self.values() if name in x.worksheets]
+            return self.find_by('worksheets', name)
 
-        # if we pass in a list, we need to check to see if any of the names in the list are in
-        # the field's list of worksheets
-        return [x for x in self.values() if _is_used_by_worksheet(name, x)]
+        # if we pass in a list, we need to gather the fields used by any of the worksheets in the list
+        field_ids = {}
+        for worksheet_name in name:
+            field_ids.update(self._indexes['worksheets'].get(worksheet_name, {}))
+        return [dict.__getitem__(self, x) for x in field_ids]
 
 
-def _column_object_from_column_xml(root_xml, column_xml):
+def _column_object_from_column_xml(metadata_index, column_xml):
     field_object = Field.from_column_xml(column_xml)
-    local_name = field_object.id
-    metadata_record = _get_metadata_xml_for_field(root_xml, local_name)
+    metadata_record = metadata_index.get(field_object.id)
     if metadata_record is not None:
         field_object.apply_metadata(metadata_record)
     return _ColumnObjectReturnTuple(field_object.id, field_object)
@@ -73,8 +107,13 @@ def base36encode(number):
     return sign + base36
 
 
+def _random_id():
+    import uuid  # Only needed when creating objects, and slow to import
+    return uuid.uuid4().int
+
+
 def _make_unique_name(dbclass):
-    rand_part = base36encode(uuid4().int)
+    rand_part = base36encode(_random_id())
     name = dbclass + '.' + rand_part
     return name
 
@@ -87,19 +126,23 @@ class ConnectionParser(object):
         self._dsversion = version
 
     def _extract_federated_connections(self):
-        connections = list(map(Connection, self._dsxml.findall('.//named-connections/named-connection/*')))
+        connections = [Connection(connection)
+                       for named_connections in self._dsxml.iter('named-connections')
+                       for named_connection in named_connections.iterchildren('named-connection')
+                       for connection in named_connection.iterchildren(tag=ET.Element)]
         # 'sqlproxy' connections (Tableau Server Connections) are not embedded into named-connection elements
         # extract them manually for now
-        connections.extend(map(Connection, self._dsxml.findall("./connection[@class='sqlproxy']")))
+        connections.extend(Connection(x) for x in self._dsxml.iterchildren('connection')
+                           if x.get('class') == 'sqlproxy')
         return connections
 
     def _extract_legacy_connection(self):
-        return list(map(Connection, self._dsxml.findall('connection')))
+        return [Connection(x) for x in self._dsxml.iterchildren('connection')]
 
     def get_connections(self):
         """Find and return all connections based on file format version."""
 
-        if float(self._dsversion) < 10:
+        if parse_version(self._dsversion) < (10,):
             connections = self._extract_legacy_connection()
         else:
             connections = self._extract_federated_connections()
@@ -128,13 +171,22 @@ class Datasource(object):
             self._datasourceXML, version=self._version)
         self._connections = self._connection_parser.get_connections()
         self._fields = None
+        self._metadata_index = None
+        self._field_usage_loader = None
+        self._dependency_graph = None
+        # The workbook holding the datasource, which shares one dependency graph among its datasources
+        self._workbook = None
+        # Set by changes to the datasource itself, connections and fields track their own
+        self._modified = False
 
     @classmethod
     def from_file(cls, filename):
-        """Initialize datasource from file (.tds ot .tdsx)"""
+        """Initialize datasource from file (.tds ot .tdsx), or from the contents of
+        one as bytes, a bytes-like object or a binary file-like object"""
 
-        dsxml = xml_open(filename, 'datasource').getroot()
-        return cls(dsxml, filename)
+        source = xfile._as_source(filename)
+        dsxml = xml_open(source, 'datasource').getroot()
+        return cls(dsxml, source)
 
     @classmethod
     def from_connections(cls, caption, connections):
@@ -154,7 +206,7 @@ class Datasource(object):
 
     def save(self):
         """
-        Call finalization code and save file.
+        Call finalization code and save file. Does nothing if the datasource wasn't modified.
 
         Args:
             None.
@@ -163,10 +215,13 @@ class Datasource(object):
             Nothing.
 
         """
+        if not self.modified:
+            return
 
         # save the file
 
         xfile._save_file(self._filename, self._datasourceTree)
+        self._clear_modified()
 
     def save_as(self, new_filename):
         """
@@ -182,6 +237,31 @@ class Datasource(object):
 
         xfile._save_file(self._filename, self._datasourceTree, new_filename)
 
+    def save_to(self, stream):
+        """
+        Write the datasource to a stream, packaged if it was opened from a .tdsx.
+
+        Args:
+            stream:  Binary file-like object to write to, which doesn't need to be seekable.
+
+        Returns:
+            Nothing.
+
+        """
+        xfile._save_to_stream(self._filename, self._datasourceTree, stream)
+
+    def to_bytes(self):
+        """
+        Get the contents of the datasource file, packaged if it was opened from a .tdsx.
+
+        Returns:
+            The file contents. Bytes.
+
+        """
+        stream = io.BytesIO()
+        self.save_to(stream)
+        return stream.getvalue()
+
     @property
     def name(self):
         """ Name of the datasource. """
@@ -198,6 +278,7 @@ class Datasource(object):
         return self._caption
 
     @caption.setter
+    @marks_modified
     def caption(self, value):
         self._datasourceXML.set('caption', value)
         self._caption = value
@@ -206,6 +287,7 @@ class Datasource(object):
     def caption(self):
         del self._datasourceXML.attrib['caption']
         self._caption = ''
+        self._modified = True
 
     @property
     def connections(self):
@@ -216,38 +298,124 @@ class Datasource(object):
         tag = self._datasourceXML.find('./repository-location')
         if tag is not None:
             self._datasourceXML.remove(tag)
+            self._modified = True
+
+    def fingerprint(self):
+        """ Content fingerprint of the datasource, which is the same for copies of it embedded in other
+        workbooks. See `fingerprint.fingerprints`, which also has fingerprints per connection and field. String. """
+        return fingerprints(self).datasource
+
+    ###########
+    # Change tracking
+    ###########
+    @property
+    def modified(self):
+        """ Whether the datasource, its connections or its fields were changed since it was
+        read or last saved. Changes made directly to the XML are not tracked, see `mark_modified`. """
+        return self._modified or any(x.modified for x in self._connections) or bool(self.modified_fields)
+
+    @property
+    def modified_connections(self):
+        """ The connections that were changed. List of Connection. """
+        return [x for x in self._connections if x.modified]
+
+    @property
+    def modified_fields(self):
+        """ The fields that were changed or added. Fields are only tracked once they have been read. List of Field. """
+        if self._fields is None:
+            return []
+        return [x for x in self._fields.values() if x.modified]
+
+    def mark_modified(self):
+        """ Records a change made directly to the XML of the datasource, so `save` writes it. """
+        self._modified = True
+
+    def _clear_modified(self):
+        self._modified = False
+        for connection in self._connections:
+            connection._modified = False
+        for field in self._fields.values() if self._fields is not None else ():
+            field._modified = False
 
     @property
     def fields(self):
         """ Key-value result of field's names and its attributes. Dict. """
-        if not self._fields:
+        if self._fields is None:
             self._refresh_fields()
         return self._fields
 
     def _refresh_fields(self):
-        self._fields = self._get_all_fields()
-
-    def _get_all_fields(self):
+        metadata_records = self._get_metadata_records()
+        self._metadata_index = _build_metadata_index(metadata_records)
+        self._fields = self._get_all_fields(metadata_records, self._metadata_index)
+        if self._field_usage_loader is not None:
+            # Set by lazily loaded workbooks, which link fields to worksheets on demand
+            for worksheet_name, column_name in self._field_usage_loader():
+                if column_name in self._fields:
+                    self._fields[column_name].add_used_in(worksheet_name)
+
+    @instrumentation.timed('datasource.get_all_fields')
+    def _get_all_fields(self, metadata_records, metadata_index):
         # Some columns are represented by `column` tags and others as `metadata-record` tags
         # Find them all and chain them into one dictionary
-        column_field_objects = self._get_column_objects()
-        existing_column_fields = [x.id for x in column_field_objects]
-        metadata_only_field_objects = (x for x in self._get_metadata_objects() if x.id not in existing_column_fields)
+        column_field_objects = self._get_column_objects(metadata_index)
+        instrumentation.count('columns', len(column_field_objects))
+        instrumentation.count('metadata_records', len(metadata_records))
+        existing_column_fields = {x.id for x in column_field_objects}
+        # Records are matched to columns by local-name before any Field is built for them.
+        # All the records are kept here, so where names repeat the last one wins, as before.
+        metadata_only_field_objects = self._get_metadata_objects(
+            x for x in metadata_records if x.findtext('local-name') not in existing_column_fields)
         field_objects = itertools.chain(column_field_objects, metadata_only_field_objects)
 
         return FieldDictionary({k: v for k, v in field_objects})
 
-    def _get_metadata_objects(self):
-        return (_column_object_from_metadata_xml(x)
-                for x in self._datasourceTree.findall(".//metadata-record[@class='column']"))
+    def _get_metadata_records(self):
+        return [x for x in self._datasourceXML.iter('metadata-record') if x.get('class') == 'column']
 
-    def _get_column_objects(self):
-        return [_column_object_from_column_xml(self._datasourceTree, xml)
-                for xml in self._datasourceTree.findall('.//column')]
+    @staticmethod
+    def _get_metadata_objects(metadata_records):
+        return (_column_object_from_metadata_xml(x) for x in metadata_records)
+
+    def _get_column_objects(self, metadata_index):
+        return [_column_object_from_column_xml(metadata_index, xml)
+                for xml in self._datasourceXML.iter('column')]
 
     def _get_custom_sql(self):
         return [qry for qry in self._datasourceXML.iter('relation')]
 
+    def _append_columns(self, columns):
+        """ Appends column elements to the datasource and returns their Field objects,
+        which are added to the existing field dictionary in a single pass.
+        """
+        fields = self.fields
+        root = self._datasourceTree.getroot()
+        new_fields = []
+        for column in columns:
+            root.append(column)
+            field = Field.from_column_xml(column)
+            # As when the fields are built, the column takes properties from a metadata-record of its name
+            metadata_record = self._metadata_index.get(field.id)
+            if metadata_record is not None:
+                field.apply_metadata(metadata_record)
+            field._modified = True
+            fields._insert(field.id, field)
+            new_fields.append(field)
+
+        return new_fields
+
+    @staticmethod
+    def _create_column(name, datatype, role, field_type, caption, hidden):
+        # TODO: A better approach would be to create an empty column and then
+        # use the input validation from its "Field"-object-representation to set values.
+        # However, creating an empty column causes errors :(
+
+        # If no caption is specified, create one with the same format Tableau does
+        if not caption:
+            caption = name.replace('[', '').replace(']', '').title()
+
+        return Field.create_field_xml(caption, datatype, hidden, role, field_type, name)
+
     def add_field(self, name, datatype, role, field_type, caption, hidden):
         """ Adds a base field object with the given values.
 
@@ -261,22 +429,19 @@ class Datasource(object):
         Returns:
             The new field that was created. Field.
         """
-        # TODO: A better approach would be to create an empty column and then
-        # use the input validation from its "Field"-object-representation to set values.
-        # However, creating an empty column causes errors :(
-
-        # If no caption is specified, create one with the same format Tableau does
-        if not caption:
-            caption = name.replace('[', '').replace(']', '').title()
+        column = self._create_column(name, datatype, role, field_type, caption, hidden)
+        return self._append_columns([column])[0]
 
-        # Create the elements
-        column = Field.create_field_xml(caption, datatype, hidden, role, field_type, name)
+    def add_fields(self, fields):
+        """ Adds many base field objects at once.
 
-        self._datasourceTree.getroot().append(column)
+        Args:
+            fields: Dicts holding the arguments of `add_field` for each new field. Iterable.
 
-        # Refresh fields to reflect changes and return the Field object
-        self._refresh_fields()
-        return self.fields[name]
+        Returns:
+            The new fields that were created, in order. List of Field.
+        """
+        return self._append_columns([self._create_column(**x) for x in fields])
 
     def remove_field(self, field):
         """ Remove a given field
@@ -291,7 +456,78 @@ class Datasource(object):
             raise ValueError("Need to supply a field to remove element")
 
         self._datasourceTree.getroot().remove(field.xml)
-        self._refresh_fields()
+        self._modified = True
+        if self._fields is None or field.id not in self._fields:
+            return
+
+        self._fields._discard(field.id)
+        if self._dependency_graph is not None:
+            self._dependency_graph._set_calculation(self.name, field.id, None)
+        # The removed column may have been hiding a metadata-record for the same field
+        metadata_record = self._metadata_index.get(field.id)
+        if metadata_record is not None and metadata_record is not field.xml:
+            self._fields._insert(field.id, Field.from_metadata_xml(metadata_record))
+
+    def rename_fields(self, renames, captions=None):
+        """ Renames fields, and rewrites the calculations of the datasource that use them,
+        in one pass. Inside a workbook this is `Workbook.rename_fields`, which also rewrites
+        the worksheets and the calculations of other Data Sources using them.
+
+        Args:
+            renames: New field ids by current field id, e.g. {'[Sales]': '[Revenue]'}. Dict.
+            captions: New captions by current field id. Dict.
+
+        Returns:
+            None
+        """
+        if self._workbook is not None:
+            # Renaming only here would leave the worksheets pointing at fields that are gone
+            self._workbook.rename_fields(self.name, renames, captions)
+            return
+        self._rename_fields(self._datasourceXML, renames, captions or {})
+
+    def _rename_fields(self, root, renames, captions):
+        fields = self.fields
+        unknown = [x for x in itertools.chain(renames, captions) if x not in fields]
+        if unknown:
+            raise KeyError('No fields {}'.format(sorted(set(unknown))))
+        new_ids = collections.Counter(renames.values())
+        invalid = [x for x in new_ids if not (x.startswith('[') and x.endswith(']'))]
+        if invalid:
+            raise ValueError('Field ids must be in brackets, got {}'.format(sorted(invalid)))
+        taken = [x for x, count in new_ids.items() if count > 1 or (x in fields and x not in renames)]
+        if taken:
+            raise ValueError('Fields {} would not be unique'.format(sorted(taken)))
+
+        from tableaudocumentapi.references import rewrite_references  # Only needed here, and compiles patterns
+
+        for field_id, caption in captions.items():
+            fields[field_id].caption = caption
+        changed = rewrite_references(root, {self.name: renames}, {self.name: captions})
+        self._references_rewritten(renames, changed.get(self.name, ()))
+        return changed
+
+    def _references_rewritten(self, renames, elements):
+        """ Brings the fields up to date after `references.rewrite_references` renamed them
+        or changed the formulas of their calculations. """
+        if not renames and not elements:
+            return
+        self._modified = True
+        self._detach_dependency_graph()
+        if self._fields is None:
+            return
+
+        elements = set(elements)
+        for field in self._fields.values():
+            if field.id in renames:
+                field._id = renames[field.id]
+                field._modified = True
+            if field.calculation is not None and _find_child(field.xml, 'calculation') in elements:
+                field._calculation = Field._read_calculation(field.xml)
+                field._modified = True
+        # Rebuilt rather than re-keyed, so the fields keep their order
+        self._metadata_index = _build_metadata_index(self._get_metadata_records())
+        self._fields = FieldDictionary({x.id: x for x in self._fields.values()})
 
     ###########
     # Calculations
@@ -302,6 +538,31 @@ class Datasource(object):
         """
         return {k: v for k, v in self.fields.items() if v.calculation is not None}
 
+    @property
+    def dependencies(self):
+        """ Which fields the calculations use, see `dependencies.DependencyGraph`. Built the first
+        time it's used and updated as calculations are set. Inside a workbook, this is the graph
+        of the whole workbook, the same as `Workbook.dependencies`. DependencyGraph. """
+        if self._workbook is not None:
+            return self._workbook.dependencies
+        if self._dependency_graph is None:
+            from tableaudocumentapi.dependencies import DependencyGraph  # Only needed here, and compiles patterns
+            self._attach_dependency_graph(DependencyGraph())
+        return self._dependency_graph
+
+    def _attach_dependency_graph(self, graph):
+        fields = self.fields
+        for field_id, field in fields.items():
+            if field.calculation is not None:
+                graph._set_calculation(self.name, field_id, field.calculation)
+        fields._calculation_listener = functools.partial(graph._set_calculation, self.name)
+        self._dependency_graph = graph
+
+    def _detach_dependency_graph(self):
+        self._dependency_graph = None
+        if self._fields is not None:
+            self._fields._calculation_listener = None
+
     def add_calculation(self, caption, formula, datatype, role, type, hidden):
         """ Adds a calculated field with the given values.
 
@@ -316,9 +577,28 @@ class Datasource(object):
         Returns:
             The new calculated field that was created. Field.
         """
-        # Dynamically create the name of the field
-        name = '[Calculation_{}]'.format(str(uuid4().int)[:18])
-        field = self.add_field(name, datatype, role, type, caption, hidden)
-        field.calculation = formula
+        return self.add_calculations([dict(caption=caption, formula=formula, datatype=datatype,
+                                           role=role, type=type, hidden=hidden)])[0]
+
+    def add_calculations(self, calculations):
+        """ Adds many calculated fields at once.
 
-        return field
+        Args:
+            calculations: Dicts holding the arguments of `add_calculation` for each new calculation. Iterable.
+
+        Returns:
+            The new calculated fields that were created, in order. List of Field.
+        """
+        calculations = list(calculations)
+        columns = []
+        for calc in calculations:
+            # Dynamically create the name of the field
+            name = '[Calculation_{}]'.format(str(_random_id())[:18])
+            columns.append(self._create_column(name, calc['datatype'], calc['role'], calc['type'],
+                                               calc['caption'], calc['hidden']))
+
+        new_fields = self._append_columns(columns)
+        for field, calc in zip(new_fields, calculations):
+            field.calculation = calc['formula']
+
+        return new_fields
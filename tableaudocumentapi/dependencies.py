@@ -0,0 +1,82 @@
+from tableaudocumentapi.references import formula_references
+
+
+class DependencyGraph(object):
+    """Which fields calculations use, across one or more datasources.
+
+    Fields are (datasource name, field id) pairs, as in `Worksheet.dependencies`. A field
+    used by a formula without a datasource qualifier belongs to the datasource of the
+    calculation. Fields that no formula uses and that aren't calculations are not in
+    the graph. Graphs are built by `Datasource.dependencies` and `Workbook.dependencies`,
+    and kept up to date as the calculations of fields are set.
+    """
+
+    def __init__(self):
+        # The fields each calculation uses, and the calculations using each field, as dict keys
+        self._upstream = {}
+        self._downstream = {}
+
+    def _set_calculation(self, datasource_name, field_id, formula):
+        """Replaces the edges from a calculation, or removes them if `formula` is None."""
+        calculation = (datasource_name, field_id)
+        for used in self._upstream.pop(calculation, ()):
+            users = self._downstream[used]
+            del users[calculation]
+            if not users:
+                del self._downstream[used]
+        if formula is None:
+            return
+
+        used = dict.fromkeys((x.datasource or datasource_name, x.field) for x in formula_references(formula))
+        used.pop(calculation, None)
+        if not used:
+            return
+        self._upstream[calculation] = used
+        for field in used:
+            self._downstream.setdefault(field, {})[calculation] = None
+
+    @staticmethod
+    def _walk(edges, start, transitive):
+        # Each field is visited once, so this costs as much as the answer and its edges
+        found = dict.fromkeys(edges.get(start, ()))
+        if transitive:
+            queue = list(found)
+            for field in queue:
+                for next_field in edges.get(field, ()):
+                    if next_field not in found and next_field != start:
+                        found[next_field] = None
+                        queue.append(next_field)
+        return list(found)
+
+    def upstream(self, field, transitive=True):
+        """
+        Find the fields a calculation uses.
+
+        Args:
+            field:  The calculation, a (datasource name, field id) pair. Tuple.
+            transitive:  Whether to include the fields used by the calculations it uses,
+                and so on. Boolean.
+
+        Returns:
+            The fields, nearest first. List of (datasource name, field id) pairs.
+        """
+        return self._walk(self._upstream, tuple(field), transitive)
+
+    def downstream(self, field, transitive=True):
+        """
+        Find the calculations that use a field, for example to see what breaks if it's removed.
+
+        Args:
+            field:  The field, a (datasource name, field id) pair. Tuple.
+            transitive:  Whether to include the calculations using those calculations,
+                and so on. Boolean.
+
+        Returns:
+            The calculations, nearest first. List of (datasource name, field id) pairs.
+        """
+        return self._walk(self._downstream, tuple(field), transitive)
+
+    @property
+    def calculations(self):
+        """The calculations that use at least one field. List of (datasource name, field id) pairs."""
+        return list(self._upstream)
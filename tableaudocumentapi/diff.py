@@ -0,0 +1,177 @@
+import collections
+import hashlib
+from lxml import etree as ET
+
+from tableaudocumentapi import Datasource, Field, Workbook
+from tableaudocumentapi.datasource import _build_metadata_index
+
+# A difference between two documents. `change` is 'added', 'removed' or 'changed'. `path` names
+# what changed, e.g. ('datasource', 'Sample') or ('datasource', 'Sample', 'field', '[Sales]').
+# For changed properties `attribute` names the property and `old`/`new` hold its values; it is
+# None when only the XML of the item differs in ways the object model doesn't expose.
+Change = collections.namedtuple('Change', ['change', 'path', 'attribute', 'old', 'new'])
+
+DATASOURCE_ATTRIBUTES = ('caption', 'version')
+CONNECTION_ATTRIBUTES = ('dbclass', 'server', 'dbname', 'username', 'authentication', 'port', 'schema',
+                         'service', 'query_band', 'initial_sql')
+FIELD_ATTRIBUTES = ('caption', 'alias', 'datatype', 'role', 'type', 'hidden', 'calculation',
+                    'default_aggregation', 'description', 'aliases')
+
+
+def _subtree_hash(element):
+    """Digest of the XML of `element` and everything below it. Serializing is done by
+    lxml in C, so hashing a subtree costs little more than reading it. The XML isn't
+    canonicalized, which would take a third longer, so attributes that were reordered
+    make an item count as changed; the properties compared after that are still equal."""
+    return hashlib.sha1(ET.tostring(element, with_tail=False)).digest()
+
+
+def _diff_attributes(path, old, new, attributes):
+    changes = [Change('changed', path, x, getattr(old, x), getattr(new, x))
+               for x in attributes if getattr(old, x) != getattr(new, x)]
+    return changes or [Change('changed', path, None, None, None)]
+
+
+def _diff_keyed(path, kind, old_items, new_items, diff_item, load=lambda x: x):
+    """Compares two dicts of key to (subtree hash, item). Items with the same hash are
+    skipped without being looked at, the others are turned into objects by `load` and
+    passed to `diff_item`."""
+    changes = []
+    for key, (old_hash, old_item) in old_items.items():
+        if key not in new_items:
+            changes.append(Change('removed', path + (kind, key), None, load(old_item), None))
+            continue
+        new_hash, new_item = new_items[key]
+        if old_hash != new_hash:
+            changes.extend(diff_item(path + (kind, key), load(old_item), load(new_item)))
+    changes.extend(Change('added', path + (kind, key), None, None, load(new_item))
+                   for key, (_, new_item) in new_items.items() if key not in old_items)
+    return changes
+
+
+def _connection_key(connection, index):
+    # Connections of federated datasources are named, older ones are identified by position
+    parent = connection._connectionXML.getparent()
+    if parent is not None and parent.tag == 'named-connection':
+        return parent.get('name')
+    return index
+
+
+def _hashed_connections(datasource):
+    # Only the attributes, legacy connections hold the relation and metadata-records as well
+    return {_connection_key(x, i): (tuple(x._connectionXML.items()), x)
+            for i, x in enumerate(datasource.connections)}
+
+
+def _metadata_records(datasource):
+    """The column metadata-records of `datasource`, and a digest of the elements holding them."""
+    records = datasource._get_metadata_records()
+    parents = dict.fromkeys(x.getparent() for x in records)
+    return records, b''.join(_subtree_hash(x) for x in parents)
+
+
+def _hashed_fields(datasource, records, hash_records=True):
+    """Hashes the XML behind each field the way `Datasource.fields` finds them, without
+    building the fields. Items are (datasource, field id, column, metadata-record).
+    Metadata-records are left out of the hashes if `hash_records` is False."""
+    index = _build_metadata_index(records)
+    columns = {Field._read_id(x): x for x in datasource._datasourceXML.iter('column')}
+    hashed = {}
+    for key, column in columns.items():
+        # Columns take some of their properties from the metadata-record of the same name
+        record = index.get(key)
+        digest = _subtree_hash(column)
+        if hash_records and record is not None:
+            digest += _subtree_hash(record)
+        hashed[key] = (digest, (datasource, key, column, record))
+    # Fields of metadata-records alone take the last record of a name, as Datasource.fields does
+    for record in records:
+        key = record.findtext('local-name')
+        if key not in columns:
+            hashed[key] = (_subtree_hash(record) if hash_records else b'', (datasource, key, None, record))
+    return hashed
+
+
+def _load_field(item):
+    datasource, key, column, record = item
+    if datasource._fields is not None and key in datasource._fields:
+        return datasource._fields[key]
+    if column is None:
+        return Field.from_metadata_xml(record)
+    field = Field.from_column_xml(column)
+    if record is not None:
+        field.apply_metadata(record)
+    return field
+
+
+def _diff_connections(path, old, new):
+    return _diff_attributes(path, old, new, CONNECTION_ATTRIBUTES)
+
+
+def _diff_fields(path, old, new):
+    return _diff_attributes(path, old, new, FIELD_ATTRIBUTES)
+
+
+def _diff_datasources(path, old, new):
+    changes = [x for x in _diff_attributes(path, old, new, DATASOURCE_ATTRIBUTES) if x.attribute is not None]
+    changes.extend(_diff_keyed(path, 'connection', _hashed_connections(old), _hashed_connections(new),
+                               _diff_connections))
+    # Records are usually all in one element, which is compared first to skip hashing them one by one
+    (old_records, old_digest), (new_records, new_digest) = _metadata_records(old), _metadata_records(new)
+    hash_records = old_digest != new_digest
+    # Fields are only built for the columns that differ
+    changes.extend(_diff_keyed(path, 'field', _hashed_fields(old, old_records, hash_records),
+                               _hashed_fields(new, new_records, hash_records), _diff_fields, _load_field))
+    return changes or [Change('changed', path, None, None, None)]
+
+
+def _hashed_datasources(workbook):
+    return {x.name: (_subtree_hash(x._datasourceXML), x) for x in workbook.datasources}
+
+
+def _hashed_worksheets(workbook):
+    elements = workbook._get_worksheet_index().elements
+    return {name: (_subtree_hash(element), workbook.get_worksheet(name)) for name, element in elements.items()}
+
+
+def _diff_worksheets(path, old, new):
+    old_dependencies, new_dependencies = set(old.dependencies), set(new.dependencies)
+    removed = [x for x in old.dependencies if x not in new_dependencies]
+    added = [x for x in new.dependencies if x not in old_dependencies]
+    if not (removed or added):
+        return [Change('changed', path, None, None, None)]
+    return [Change('changed', path, 'dependencies', removed, added)]
+
+
+def diff(old, new):
+    """Lists the differences between two workbooks or two datasources.
+
+    Every datasource, connection, field and worksheet is hashed from its XML, and
+    only the ones whose hashes differ are compared property by property. Diffing two
+    large workbooks that differ in a few places is therefore close to the cost of
+    reading them.
+
+    Args:
+        old: The Workbook or Datasource to compare from.
+        new: The Workbook or Datasource to compare to, of the same type as `old`.
+
+    Returns:
+        A list of Change tuples, datasources before worksheets, in document order.
+        Added and removed items carry the item itself in `new` or `old`, e.g. a Field.
+        Worksheets whose dependencies changed have a 'dependencies' change, with
+        `old` holding the removed and `new` the added (datasource name, field id) pairs.
+    """
+    if isinstance(old, Datasource) and isinstance(new, Datasource):
+        if _subtree_hash(old._datasourceXML) == _subtree_hash(new._datasourceXML):
+            return []
+        return _diff_datasources(('datasource', new.name), old, new)
+
+    if isinstance(old, Workbook) and isinstance(new, Workbook):
+        changes = _diff_keyed((), 'datasource', _hashed_datasources(old), _hashed_datasources(new),
+                              _diff_datasources)
+        changes.extend(_diff_keyed((), 'worksheet', _hashed_worksheets(old), _hashed_worksheets(new),
+                                   _diff_worksheets))
+        return changes
+
+    raise TypeError('Can only diff two Workbooks or two Datasources, not {} and {}'.format(
+        type(old).__name__, type(new).__name__))
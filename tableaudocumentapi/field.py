@@ -1,6 +1,7 @@
-import functools
+import operator
+import sys
+import weakref
 from lxml import etree as ET
-from xml.dom import minidom
 
 from tableaudocumentapi.property_decorators import argument_is_one_of
 
@@ -27,28 +28,59 @@ _METADATA_TO_FIELD_MAP = [
 ]
 
 
+# Attributes whose values come from a small set of keywords, so one shared string can be kept per value
+_INTERNED_ATTRIBUTES = frozenset(['datatype', 'role', 'type', 'hidden', 'aggregation'])
+
+
+# Children of a metadata-record that fields are read from
+_METADATA_RECORD_TAGS = frozenset([record_name for record_name, _ in _METADATA_TO_FIELD_MAP] + _METADATA_ATTRIBUTES)
+
+
 def _find_metadata_record(record, attrib):
-    element = record.find('.//{}'.format(attrib))
+    element = record.find(attrib)
     if element is None:
         return None
     return element.text
 
 
+def _read_metadata_record(record):
+    """Texts of the children of a metadata-record that fields are read from, collected
+    in one pass over its children instead of a search per attribute."""
+    values = {}
+    for child in record:
+        tag = child.tag
+        if tag in _METADATA_RECORD_TAGS and tag not in values:
+            values[tag] = child.text
+    return values
+
+
+def _find_child(element, tag):
+    # Most columns have no children at all, which is cheap to check first
+    if not len(element):
+        return None
+    return next(element.iterchildren(tag), None)
+
+
+def _intern(value):
+    return sys.intern(value) if value is not None else None
+
+
 class Field(object):
     """ Represents a field in a datasource """
 
+    __slots__ = tuple('_{}'.format(x) for x in _ATTRIBUTES + _METADATA_ATTRIBUTES) + (
+        '_worksheets', '_xml', '_owner', '_modified')
+
     def __init__(self, column_xml=None, metadata_xml=None):
 
-        # Initialize all the possible attributes
-        for attrib in _ATTRIBUTES:
-            setattr(self, '_{}'.format(attrib), None)
-        for attrib in _METADATA_ATTRIBUTES:
-            setattr(self, '_{}'.format(attrib), None)
-        self._worksheets = set()
+        # Worksheets are only tracked for fields used by one, see add_used_in
+        self._worksheets = None
+        self._owner = None
+        self._modified = False
 
         if column_xml is not None:
-            self._initialize_from_column_xml(column_xml)
             self._xml = column_xml
+            self._initialize_from_column_xml(column_xml)
             # This isn't currently called because of the way we get the data from the xml,
             # but during the refactor, we might need it.  This is commented out as a reminder
             # if metadata_xml is not None:
@@ -62,15 +94,16 @@ class Field(object):
             raise AttributeError('column_xml or metadata_xml needed to initialize field')
 
     def _initialize_from_column_xml(self, xmldata):
-        for attrib in _ATTRIBUTES:
-            self._apply_attribute(xmldata, attrib, lambda x: xmldata.attrib.get(x, None))
+        for slot, reader in _COLUMN_READERS:
+            setattr(self, slot, reader(xmldata))
+        self._aggregation = None
 
     def _initialize_from_metadata_xml(self, xmldata):
-        for metadata_name, field_name in _METADATA_TO_FIELD_MAP:
-            self._apply_attribute(xmldata, field_name,
-                                  lambda x: getattr(xmldata.find('.//{}'.format(metadata_name)), 'text', None),
-                                  read_name=metadata_name)
-        self.apply_metadata(xmldata)
+        for slot in _UNSET_BY_METADATA:
+            setattr(self, slot, None)
+        values = _read_metadata_record(xmldata)
+        for slot, reader in _METADATA_READERS:
+            setattr(self, slot, reader(values))
 
     @classmethod
     def create_field_xml(cls, caption, datatype, hidden, role, field_type, name):
@@ -88,11 +121,29 @@ class Field(object):
     # not intended for client use
     ########################################
     def apply_metadata(self, metadata_record):
-        for attrib in _METADATA_ATTRIBUTES:
-            self._apply_attribute(metadata_record, attrib, functools.partial(_find_metadata_record, metadata_record))
+        values = _read_metadata_record(metadata_record)
+        for slot, reader in _METADATA_ONLY_READERS:
+            setattr(self, slot, reader(values))
 
     def add_used_in(self, name):
-        self._worksheets.add(name)
+        if self._worksheets is None:
+            self._worksheets = set()
+        if name not in self._worksheets:
+            self._worksheets.add(name)
+            self._notify_change('worksheets', (), (name,))
+
+    def _set_owner(self, field_dictionary):
+        # Only a weak reference, the dictionary already holds on to its fields
+        self._owner = weakref.ref(field_dictionary) if field_dictionary is not None else None
+
+    def _notify_change(self, attrib, old_value, new_value):
+        """Tells the dictionary holding this field that an attribute changed, so it can update its indexes."""
+        # Which worksheets use the field is worked out from the workbook, it isn't part of the column
+        if attrib != 'worksheets' and old_value != new_value:
+            self._modified = True
+        owner = self._owner() if self._owner is not None else None
+        if owner is not None:
+            owner._field_changed(self, attrib, old_value, new_value)
 
     @classmethod
     def from_column_xml(cls, xmldata):
@@ -102,16 +153,6 @@ class Field(object):
     def from_metadata_xml(cls, xmldata):
         return cls(metadata_xml=xmldata)
 
-    def _apply_attribute(self, xmldata, attrib, default_func, read_name=None):
-        if read_name is None:
-            read_name = attrib
-        if hasattr(self, '_read_{}'.format(read_name)):
-            value = getattr(self, '_read_{}'.format(read_name))(xmldata)
-        else:
-            value = default_func(attrib)
-
-        setattr(self, '_{}'.format(attrib), value)
-
     @property
     def name(self):
         """ Provides a nice name for the field which is derived from the alias, caption, or the id.
@@ -141,6 +182,7 @@ class Field(object):
     def pretty_xml(self):
         """Return a pretty-printed XML string for the Element.
         """
+        from xml.dom import minidom  # Rarely used, so only imported when needed
         rough_string = ET.tostring(self._xml, 'utf-8')
         prepared_string = minidom.parseString(rough_string)
         print_string = prepared_string.toprettyxml(indent="  ", newl="")
@@ -178,8 +220,10 @@ class Field(object):
             Returns:
                 Nothing.
         """
+        old_value = self._caption
         self._caption = caption
         self._xml.set('caption', caption)
+        self._notify_change('caption', old_value, caption)
 
     @property
     def alias(self):
@@ -196,8 +240,10 @@ class Field(object):
             Returns:
                 Nothing.
         """
+        old_value = self._alias
         self._alias = alias
         self._xml.set('alias', alias)
+        self._notify_change('alias', old_value, alias)
 
     @property
     def datatype(self):
@@ -215,8 +261,10 @@ class Field(object):
             Returns:
                 Nothing.
         """
+        old_value = self._datatype
         self._datatype = datatype
         self._xml.set('datatype', datatype)
+        self._notify_change('datatype', old_value, datatype)
 
     @property
     def hidden(self):
@@ -234,8 +282,10 @@ class Field(object):
             Returns:
                 Nothing.
         """
+        old_value = self._hidden
         self._hidden = hidden
         self._xml.set('hidden', hidden)
+        self._notify_change('hidden', old_value, hidden)
 
     @property
     def role(self):
@@ -253,8 +303,10 @@ class Field(object):
             Returns:
                 Nothing.
         """
+        old_value = self._role
         self._role = role
         self._xml.set('role', role)
+        self._notify_change('role', old_value, role)
 
     @property
     def type(self):
@@ -272,8 +324,10 @@ class Field(object):
             Returns:
                 Nothing.
         """
+        old_value = self._type
         self._type = field_type
         self._xml.set('type', field_type)
+        self._notify_change('type', old_value, field_type)
 
     ########################################
     # Aliases getter and setter
@@ -303,6 +357,8 @@ class Field(object):
         # if not, create a new ET.Element
         alias = existing_alias[0] if existing_alias else ET.Element('alias')
 
+        if alias.get('value') != value:
+            self._modified = True
         alias.set('key', key)
         alias.set('value', value)
         if not existing_alias:
@@ -355,6 +411,7 @@ class Field(object):
         Args:
             new_calculation: The new calculation/formula of the field. String.
         """
+        old_value = self._calculation
         if self.calculation is None:
             calculation = ET.Element('calculation')
             calculation.set('class', 'tableau')
@@ -366,6 +423,12 @@ class Field(object):
             self._xml.find('calculation').set('formula', new_calculation)
 
         self._calculation = new_calculation
+        self._notify_change('calculation', old_value, new_calculation)
+
+    @property
+    def modified(self):
+        """ Whether the field was changed since it was read or the document was last saved """
+        return self._modified
 
     @property
     def default_aggregation(self):
@@ -380,7 +443,7 @@ class Field(object):
     @property
     def worksheets(self):
         """ Worksheets which uses field. """
-        return list(self._worksheets)
+        return list(self._worksheets or ())
 
     ######################################
     # Special Case handling methods for reading the values from the XML
@@ -393,7 +456,7 @@ class Field(object):
     @staticmethod
     def _read_calculation(xmldata):
         # The formula for a calculation is stored in a child element, so we need to pull it out separately.
-        calc = xmldata.find('.//calculation')
+        calc = _find_child(xmldata, 'calculation')
         if calc is None:
             return None
 
@@ -401,7 +464,7 @@ class Field(object):
 
     @staticmethod
     def _read_description(xmldata):
-        description = xmldata.find('.//desc')
+        description = _find_child(xmldata, 'desc')
         if description is None:
             return None
 
@@ -411,3 +474,36 @@ class Field(object):
             description_string = description_string.decode('utf-8')
 
         return description_string
+
+
+######################################
+# Readers used to initialize fields, one per attribute. They are looked up once here
+# instead of for every attribute of every field.
+######################################
+def _make_reader(attrib, read):
+    if attrib in _INTERNED_ATTRIBUTES:
+        return lambda xmldata: _intern(read(xmldata))
+    return read
+
+
+def _column_reader(attrib):
+    special_reader = getattr(Field, '_read_{}'.format(attrib), None)
+    if special_reader is not None:
+        return _make_reader(attrib, special_reader)
+    return _make_reader(attrib, operator.methodcaller('get', attrib))
+
+
+def _metadata_reader(record_name, attrib):
+    # Readers of metadata are given the values collected by _read_metadata_record
+    return _make_reader(attrib, operator.methodcaller('get', record_name))
+
+
+_COLUMN_READERS = tuple(('_{}'.format(x), _column_reader(x)) for x in _ATTRIBUTES)
+
+_METADATA_ONLY_READERS = tuple(('_{}'.format(x), _metadata_reader(x, x)) for x in _METADATA_ATTRIBUTES)
+
+_METADATA_READERS = tuple(('_{}'.format(attrib), _metadata_reader(record_name, attrib))
+                          for record_name, attrib in _METADATA_TO_FIELD_MAP) + _METADATA_ONLY_READERS
+
+_UNSET_BY_METADATA = tuple('_{}'.format(x) for x in _ATTRIBUTES
+                           if x not in {attrib for _, attrib in _METADATA_TO_FIELD_MAP})
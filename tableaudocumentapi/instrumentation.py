@@ -0,0 +1,121 @@
+import collections
+import contextlib
+import functools
+import threading
+import time
+
+# A finished span. `parent` is the name of the span it ran inside, or None, and
+# `counters` holds its own counts plus those of the spans inside it.
+Span = collections.namedtuple('Span', ['name', 'parent', 'start', 'seconds', 'counters'])
+
+_callback = None
+_state = threading.local()
+
+
+class _NullSpan(object):
+    """Stands in for a span while instrumentation is disabled."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _ActiveSpan(object):
+
+    __slots__ = ('_name', '_callback', '_parent', '_start', 'counters')
+
+    def __init__(self, name, callback):
+        self._name = name
+        self._callback = callback
+        self._parent = None
+        self._start = None
+        self.counters = collections.Counter()
+
+    def __enter__(self):
+        stack = _stack()
+        self._parent = stack[-1] if stack else None
+        stack.append(self)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = time.perf_counter() - self._start
+        _stack().pop()
+        if self._parent is not None:
+            self._parent.counters.update(self.counters)
+        self._callback(Span(self._name, self._parent._name if self._parent is not None else None,
+                            self._start, seconds, dict(self.counters)))
+        return False
+
+
+def _stack():
+    try:
+        return _state.stack
+    except AttributeError:
+        _state.stack = []
+        return _state.stack
+
+
+def set_callback(callback):
+    """Sends a Span to `callback` whenever an instrumented step of opening, reading
+    or saving a document finishes, in any thread. Pass None to turn instrumentation
+    off, which is the default.
+
+    Returns:
+        The previous callback.
+    """
+    global _callback
+    previous, _callback = _callback, callback
+    return previous
+
+
+def enabled():
+    """ Whether a callback is set. Bool. """
+    return _callback is not None
+
+
+@contextlib.contextmanager
+def instrumented(callback):
+    """Sets `callback` for the duration of a `with` block, see `set_callback`."""
+    previous = set_callback(callback)
+    try:
+        yield
+    finally:
+        set_callback(previous)
+
+
+def span(name):
+    """Times a `with` block as a span called `name`, if instrumentation is enabled."""
+    callback = _callback
+    if callback is None:
+        return _NULL_SPAN
+    return _ActiveSpan(name, callback)
+
+
+def count(counter, amount=1):
+    """Adds `amount` to `counter` on the innermost span open in this thread."""
+    if _callback is None:
+        return
+    stack = _stack()
+    if stack:
+        stack[-1].counters[counter] += amount
+
+
+def timed(name):
+    """Decorator that runs each call of the function in a span called `name`."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _callback is None:
+                return func(*args, **kwargs)
+            with _ActiveSpan(name, _callback):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
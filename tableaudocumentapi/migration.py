@@ -0,0 +1,103 @@
+import collections
+import functools
+import os
+import time
+
+from tableaudocumentapi import Datasource, Workbook
+# Rules match on MATCHABLE_ATTRIBUTES and change CHANGEABLE_ATTRIBUTES, both defined with Connection
+from tableaudocumentapi.connection import MATCHABLE_ATTRIBUTES, CHANGEABLE_ATTRIBUTES  # noqa: F401
+from tableaudocumentapi.connection import _validate_changes, _validate_match
+from tableaudocumentapi.scanner import _run_in_pool
+
+ConnectionRule = collections.namedtuple('ConnectionRule', ['match', 'changes'])
+
+RewriteResult = collections.namedtuple(
+    'RewriteResult', ['filename', 'connections_matched', 'connections_changed', 'saved', 'seconds', 'error'])
+
+
+def _validate_rules(rules):
+    rules = [ConnectionRule(*x) for x in rules]
+    for rule in rules:
+        _validate_match(rule.match)
+        _validate_changes(rule.changes)
+    return rules
+
+
+def _open_document(filename):
+    if os.path.splitext(filename)[1].lower() in ('.tds', '.tdsx'):
+        return Datasource.from_file(filename)
+    # Only the connections are needed, so don't build fields or worksheets
+    return Workbook(filename, lazy=True)
+
+
+def _matching_rule(connection, rules):
+    for rule in rules:
+        if all(getattr(connection, k) == v for k, v in rule.match.items()):
+            return rule
+    return None
+
+
+def apply_rules(connections, rules):
+    """Applies the first matching rule to each connection.
+
+    Args:
+        connections: The Connection objects to update. Iterable.
+        rules: (match, changes) pairs of dicts. A connection matches when all of its
+            properties named in `match` have the given values, and then has the
+            properties in `changes` set. Iterable.
+
+    Returns:
+        The number of connections that matched a rule, and the number that were
+        actually changed. Tuple of ints.
+    """
+    rules = _validate_rules(rules)
+    matched = changed = 0
+    for connection in connections:
+        rule = _matching_rule(connection, rules)
+        if rule is None:
+            continue
+        matched += 1
+        if connection.update(**rule.changes):
+            changed += 1
+    return matched, changed
+
+
+def rewrite_file(filename, rules):
+    """Applies the connection `rules` to the workbook or data source at `filename`
+    and saves it in place, atomically. The file is only saved if a connection was
+    changed. Errors are captured in the result's `error` field instead of raised.
+
+    Returns:
+        A RewriteResult.
+    """
+    start = time.perf_counter()
+    matched = changed = 0
+    try:
+        document = _open_document(filename)
+        datasources = [document] if isinstance(document, Datasource) else document.datasources
+        matched, changed = apply_rules((c for ds in datasources for c in ds.connections), rules)
+        if changed:
+            document.save()
+    except Exception as ex:
+        return RewriteResult(filename, matched, changed, False, time.perf_counter() - start,
+                             '{}: {}'.format(type(ex).__name__, ex))
+
+    return RewriteResult(filename, matched, changed, bool(changed), time.perf_counter() - start, None)
+
+
+def rewrite_connections(paths, rules, workers=None, max_in_flight=None):
+    """Applies connection `rules` to many workbook and data source files in parallel,
+    for example to move them all to a new database server.
+
+    Args:
+        paths: Paths of the files to rewrite. Any iterable, it is consumed as work is handed out.
+        rules: (match, changes) pairs of dicts, see `apply_rules`. Iterable.
+        workers: Number of worker processes, defaults to the number of CPUs. Int.
+        max_in_flight: Most files handed to the workers at any time, defaults to four per worker. Int.
+
+    Returns:
+        A generator of RewriteResult tuples, one per file in the order they complete.
+    """
+    # Fail on bad rules here rather than once per file in the workers
+    rules = [tuple(x) for x in _validate_rules(rules)]
+    return _run_in_pool(functools.partial(rewrite_file, rules=rules), paths, workers, max_in_flight)
@@ -1,6 +1,3 @@
-import weakref
-
-
 _no_default_value = object()
 
 
@@ -18,40 +15,151 @@ def _resolve_value(key, value):
     return retval
 
 
-def _build_index(key, d):
-    return {_resolve_value(key, v): k
-            for k, v in d.items()
-            if _resolve_value(key, v) is not None}
+def _index_values(index_value, multi_valued):
+    if index_value is None:
+        return ()
+    return index_value if multi_valued else (index_value,)
+
+
+def _build_index(key, d, multi_valued=False):
+    index = {}
+    for k, v in d.items():
+        for index_value in _index_values(_resolve_value(key, v), multi_valued):
+            index.setdefault(index_value, {})[k] = None
+    return index
+
+
+def _last_key(keys):
+    try:
+        return next(reversed(keys))
+    except TypeError:
+        # Dicts can only be reversed from Python 3.8
+        return list(keys)[-1]
 
 
 # TODO: Improve this to be more generic
 class MultiLookupDict(dict):
+    """A dict whose values can also be looked up by their alias or caption.
+
+    Each index maps an attribute value to the keys holding it, in insertion order.
+    When several values share an alias or caption the last one inserted wins.
+    Further indexes can be registered with `register_index` and queried with `find_by`.
+    """
+
+    _LOOKUP_INDEXES = ('alias', 'caption')
+
     def __init__(self, args=None):
         if args is None:
             args = {}
         super(MultiLookupDict, self).__init__(args)
-        self._indexes = {
-            'alias': weakref.WeakValueDictionary(),
-            'caption': weakref.WeakValueDictionary()
-        }
-        self._populate_indexes()
-
-    def _populate_indexes(self):
-        self._indexes['alias'] = _build_index('alias', self)
-        self._indexes['caption'] = _build_index('caption', self)
+        self._indexes = {}
+        self._multi_valued_indexes = set()
+        for index_name in self._LOOKUP_INDEXES:
+            self.register_index(index_name)
+
+    def register_index(self, index_name, multi_valued=False):
+        """ Indexes the values by one of their attributes, so `find_by` can query it.
+
+        Args:
+            index_name: Name of the attribute or key to index on. String.
+            multi_valued: Whether the attribute holds a collection of values, each of which is indexed. Boolean.
+        """
+        if multi_valued:
+            self._multi_valued_indexes.add(index_name)
+        self._indexes[index_name] = _build_index(index_name, self, multi_valued)
+
+    def _reindex(self, key, index_name, old_index_value, new_index_value):
+        """Moves 'key' from the entries for 'old_index_value' to 'new_index_value' in one index."""
+        multi_valued = index_name in self._multi_valued_indexes
+        index = self._indexes[index_name]
+        for index_value in _index_values(old_index_value, multi_valued):
+            keys = index.get(index_value)
+            if keys is not None and key in keys:
+                del keys[key]
+                if not keys:
+                    del index[index_value]
+        for index_value in _index_values(new_index_value, multi_valued):
+            index.setdefault(index_value, {})[key] = None
+
+    def _index_value(self, key, value, index_names=None):
+        for index_name in self._indexes if index_names is None else index_names:
+            self._reindex(key, index_name, None, _resolve_value(index_name, value))
+
+    def _unindex_value(self, key, value, index_names=None):
+        for index_name in self._indexes if index_names is None else index_names:
+            self._reindex(key, index_name, _resolve_value(index_name, value), None)
 
     def _get_real_key(self, key):
-        if key in self._indexes['alias']:
-            return self._indexes['alias'][key]
-        if key in self._indexes['caption']:
-            return self._indexes['caption'][key]
+        for index_name in self._LOOKUP_INDEXES:
+            keys = self._indexes[index_name].get(key)
+            if keys:
+                return _last_key(keys)
 
         return key
 
+    def _insert(self, real_key, value):
+        """Stores 'value' under its exact key and updates the indexes for it."""
+        if real_key in self:
+            old_value = dict.__getitem__(self, real_key)
+            # A replacement that doesn't carry an alias or caption of its own
+            # stays reachable by the ones its key already had
+            changed = [x for x in self._indexes if _resolve_value(x, value) is not None]
+            self._unindex_value(real_key, old_value, changed)
+            self._index_value(real_key, value, changed)
+        else:
+            self._index_value(real_key, value)
+        dict.__setitem__(self, real_key, value)
+
+    def _discard(self, real_key):
+        """Removes the value stored under its exact key, along with its index entries."""
+        self._unindex_value(real_key, dict.__getitem__(self, real_key))
+        dict.__delitem__(self, real_key)
+
+    def find_by(self, index_name, index_value):
+        """ Returns the values whose indexed attribute `index_name` is (or, for a multi valued
+        index, contains) `index_value`, in the order they were indexed. List.
+        """
+        return [dict.__getitem__(self, k) for k in self._indexes[index_name].get(index_value, ())]
+
     def __setitem__(self, key, value):
+        self._insert(self._get_real_key(key), value)
+
+    def __delitem__(self, key):
+        self._discard(self._get_real_key(key))
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def pop(self, key, default_value=_no_default_value):
         real_key = self._get_real_key(key)
+        if real_key not in self:
+            if default_value is not _no_default_value:
+                return default_value
+            raise KeyError(key)
+        value = dict.__getitem__(self, real_key)
+        self._discard(real_key)
+        return value
 
-        dict.__setitem__(self, real_key, value)
+    def setdefault(self, key, default_value=None):
+        real_key = self._get_real_key(key)
+        if real_key in self:
+            return dict.__getitem__(self, real_key)
+        self._insert(real_key, default_value)
+        return default_value
+
+    def popitem(self):
+        if not self:
+            raise KeyError('popitem(): dictionary is empty')
+        real_key = _last_key(self)
+        value = dict.__getitem__(self, real_key)
+        self._discard(real_key)
+        return real_key, value
+
+    def clear(self):
+        # One key at a time, so subclasses see every value leave
+        for real_key in list(self):
+            self._discard(real_key)
 
     def get(self, key, default_value=_no_default_value):
         try:
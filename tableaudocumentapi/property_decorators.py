@@ -14,3 +14,20 @@ def argument_is_one_of(*allowed_values):
         return wrapper
 
     return property_type_decorator
+
+
+def marks_modified(func):
+    """Sets `_modified` on the object when the property set by the decorated setter changes value,
+    and calls its `_notify_change(name, old_value, new_value)` if it has one."""
+    @wraps(func)
+    def wrapper(self, value):
+        old_value = getattr(self, func.__name__)
+        func(self, value)
+        new_value = getattr(self, func.__name__)
+        if new_value != old_value:
+            self._modified = True
+            notify = getattr(self, '_notify_change', None)
+            if notify is not None:
+                notify(func.__name__, old_value, new_value)
+
+    return wrapper
@@ -0,0 +1,188 @@
+import collections
+import re
+
+from lxml import etree as ET
+
+# A field used by a formula. `datasource` is the name of the datasource it was qualified
+# with, or None, and `field` the field id, e.g. '[Sales]'.
+Reference = collections.namedtuple('Reference', ['datasource', 'field'])
+
+# A bracketed name, in which ']' is escaped as ']]'
+_NAME = r'\[(?:[^\]]|\]\])*\]'
+
+# Field references, either qualified by a datasource, [federated.1a2b].[Sales], or not, [Sales].
+# String literals are matched too so that brackets inside them are left alone.
+_REFERENCE = r'(?P<qualifier>{0})\.(?P<qualified>{0})|(?P<name>{0})'.format(_NAME)
+_REFERENCE_RE = re.compile(r'"(?:[^"]|"")*"|' + _REFERENCE)
+# Formulas also have single quoted strings and comments
+_FORMULA_REFERENCE_RE = re.compile(r'//[^\n]*|"(?:[^"]|"")*"|\'(?:[^\']|\'\')*\'|' + _REFERENCE)
+
+# Elements naming tables and remote columns of the database, not fields, so they are left alone
+_DATABASE_ELEMENTS = frozenset(['relation', 'parent-name', 'remote-name', 'remote-alias'])
+
+# Elements that change which datasources references belong to, see _context
+_CONTEXT_ELEMENTS = _DATABASE_ELEMENTS | frozenset(['datasource', 'datasource-dependencies', 'worksheet'])
+
+
+def _unquote(name):
+    return name[1:-1].replace(']]', ']')
+
+
+def formula_references(formula):
+    """Finds the fields a calculation formula uses, leaving out brackets in string
+    literals and comments.
+
+    Args:
+        formula:  The formula. String.
+
+    Returns:
+        The references in the order they appear, repeats included. List of Reference.
+    """
+    references = []
+    for match in _FORMULA_REFERENCE_RE.finditer(formula):
+        qualifier, qualified, name = match.group('qualifier', 'qualified', 'name')
+        if qualified is not None:
+            references.append(Reference(_unquote(qualifier), qualified))
+        elif name is not None:
+            references.append(Reference(None, name))
+    return references
+
+
+def _renamed_instance(instance_name, old_id, new_id):
+    # Instances of a field used in worksheets are named after it, e.g. [sum:Sales:qk] for [Sales]
+    old, new = ':{}:'.format(old_id[1:-1]), ':{}:'.format(new_id[1:-1])
+    if old not in instance_name:
+        return None
+    return instance_name.replace(old, new, 1)
+
+
+def _is_datasource(element):
+    # Datasources of the workbook, as opposed to the ones a worksheet's view lists
+    parent = element.getparent()
+    if parent is None:
+        return True
+    grandparent = parent.getparent()
+    return parent.tag == 'datasources' and grandparent is not None and grandparent.tag == 'workbook'
+
+
+def _context(element, context):
+    """The datasources that references in `element` without a qualifier can belong to,
+    None where they can't be fields, and the datasource the element is part of."""
+    tag = element.tag
+    names, owner = context
+    if names is None or tag in _DATABASE_ELEMENTS:
+        return None, owner
+    if tag == 'datasource' and _is_datasource(element):
+        name = element.get('name') or element.get('formatted-name')
+        return (name,), name
+    if tag == 'datasource-dependencies':
+        return (element.get('datasource'),), owner
+    if tag == 'worksheet':
+        return tuple(x.get('datasource') for x in element.iter('datasource-dependencies')), owner
+    return context
+
+
+def _find_sites(root, renames, captions):
+    """Walks the tree once, collecting every attribute and text that may hold a reference
+    along with its context, and the names of the instances of renamed fields. Captions
+    of renamed fields are updated on the columns that worksheets depend on as they are found."""
+    sites = []
+    stack = [((), None)]
+    for event, element in ET.iterwalk(root, events=('start', 'end')):
+        if event == 'end':
+            stack.pop()
+            continue
+
+        context = stack[-1]
+        if element.tag in _CONTEXT_ELEMENTS:
+            context = _context(element, context)
+        stack.append(context)
+        names, owner = context
+        if names is None:
+            continue
+
+        if len(names) == 1:
+            datasource_renames = renames.get(names[0])
+            if element.tag == 'column-instance' and datasource_renames:
+                new_id = datasource_renames.get(element.get('column'))
+                instance_name = element.get('name')
+                if new_id is not None and instance_name is not None:
+                    new_instance_name = _renamed_instance(instance_name, element.get('column'), new_id)
+                    if new_instance_name is not None:
+                        datasource_renames[instance_name] = new_instance_name
+            elif element.tag == 'column' and element.getparent().tag == 'datasource-dependencies':
+                caption = captions.get(names[0], {}).get(element.get('name'))
+                if caption is not None:
+                    element.set('caption', caption)
+
+        for key, value in element.items():
+            if '[' in value:
+                sites.append((element, key, names, owner))
+        if element.text is not None and '[' in element.text:
+            sites.append((element, None, names, owner))
+    return sites
+
+
+def _substitution(renames, names):
+    """Replacement function for re.sub that renames the references in one context."""
+    candidates = [renames[x] for x in names if x in renames]
+
+    def substitute(match):
+        qualifier, qualified, name = match.group('qualifier', 'qualified', 'name')
+        if qualified is not None:
+            new_name = renames.get(_unquote(qualifier), {}).get(qualified)
+            return match.group() if new_name is None else '{}.{}'.format(qualifier, new_name)
+        if name is not None:
+            # Only renamed if it can't be a field of another datasource in the context
+            found = [x[name] for x in candidates if name in x]
+            if len(found) == 1:
+                return found[0]
+        return match.group()
+    return substitute
+
+
+def rewrite_references(root, renames, captions=None):
+    """Renames fields, and rewrites all the references to them, in one pass over the tree
+    below `root`, which is a workbook or a datasource.
+
+    The columns and metadata-records of the fields are renamed, as are references in
+    calculation formulas and in worksheets: the columns they depend on, the instances
+    of those columns and the shelves, filters and encodings that use them.
+    References are found with one regular expression that matches any field name, and
+    looked up in `renames`, so the cost of a pass doesn't grow with the number of renames.
+
+    Args:
+        root:  The workbook or datasource element. ET.Element.
+        renames:  New field ids by old field id, by datasource name. Dict of dicts.
+        captions:  New captions by old field id, by datasource name, for the columns that
+            worksheets depend on. Dict of dicts.
+
+    Returns:
+        The elements that changed, by the name of the datasource they are part of, or None
+        if they are outside any datasource. Dict of lists of ET.Element.
+    """
+    renames = {name: dict(x) for name, x in renames.items() if x}
+    # Where no renamed field can be referenced without a qualifier, only qualified references can change
+    qualifiers = tuple('[{}].'.format(x.replace(']', ']]')) for x in renames)
+    changed = {}
+    sites = _find_sites(root, renames, captions or {})
+    substitutions = {}
+    for element, key, names, owner in sites:
+        value = element.text if key is None else element.get(key)
+        if not any(x in renames for x in names) and not any(x in value for x in qualifiers):
+            continue
+
+        substitute = substitutions.get(names)
+        if substitute is None:
+            substitute = substitutions[names] = _substitution(renames, names)
+        is_formula = key == 'formula' and element.tag == 'calculation'
+        pattern = _FORMULA_REFERENCE_RE if is_formula else _REFERENCE_RE
+        new_value = pattern.sub(substitute, value)
+        if new_value == value:
+            continue
+        if key is None:
+            element.text = new_value
+        else:
+            element.set(key, new_value)
+        changed.setdefault(owner, []).append(element)
+    return changed
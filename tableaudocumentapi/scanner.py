@@ -0,0 +1,246 @@
+import collections
+import concurrent.futures
+import itertools
+import os
+from lxml import etree as ET
+
+from tableaudocumentapi import Datasource
+from tableaudocumentapi.worksheet import _worksheet_dependencies
+from tableaudocumentapi.xfile import _check_supported_version, _open_xml_stream
+
+DatasourceRecord = collections.namedtuple(
+    'DatasourceRecord', ['name', 'caption', 'version', 'connections', 'fields', 'fingerprint'])
+
+ConnectionRecord = collections.namedtuple(
+    'ConnectionRecord', ['dbclass', 'server', 'dbname', 'username', 'authentication', 'port', 'schema',
+                         'service', 'query_band', 'initial_sql'])
+
+FieldRecord = collections.namedtuple(
+    'FieldRecord', ['id', 'caption', 'alias', 'datatype', 'role', 'type', 'hidden', 'calculation',
+                    'default_aggregation', 'description'])
+
+WorksheetRecord = collections.namedtuple('WorksheetRecord', ['name', 'dependencies'])
+
+DashboardRecord = collections.namedtuple('DashboardRecord', ['name'])
+
+ShapeRecord = collections.namedtuple('ShapeRecord', ['name'])
+
+FileSummary = collections.namedtuple(
+    'FileSummary', ['filename', 'datasources', 'worksheets', 'dashboards', 'shapes', 'error'])
+
+TABLEAU_FILE_EXTENSIONS = ('.twb', '.twbx', '.tds', '.tdsx')
+
+# Paths (as tuples of tags from the root) of the elements turned into records
+_WORKBOOK_DATASOURCE_PATH = ('workbook', 'datasources', 'datasource')
+_WORKSHEET_PATH = ('workbook', 'worksheets', 'worksheet')
+_DASHBOARD_PATH = ('workbook', 'dashboards', 'dashboard')
+_SHAPE_PATH = ('workbook', 'external', 'shapes', 'shape')
+_TDS_DATASOURCE_PATH = ('datasource',)
+
+
+def _connection_record(connection):
+    return ConnectionRecord(connection.dbclass, connection.server, connection.dbname, connection.username,
+                            connection.authentication, connection.port, connection.schema, connection.service,
+                            connection.query_band, connection.initial_sql)
+
+
+def _field_record(field):
+    return FieldRecord(field.id, field.caption, field.alias, field.datatype, field.role, field.type, field.hidden,
+                       field.calculation, field.default_aggregation, field.description)
+
+
+def _datasource_record(element):
+    # Go through the object model so the records always agree with it
+    datasource = Datasource(element)
+    return DatasourceRecord(datasource.name, datasource.caption, datasource.version,
+                            tuple(_connection_record(x) for x in datasource.connections),
+                            tuple(_field_record(x) for x in datasource.fields.values()),
+                            datasource.fingerprint())
+
+
+def _worksheet_record(element):
+    # The same lookup as the worksheet index of `Workbook`, so the records agree with it
+    return WorksheetRecord(element.attrib['name'], tuple(_worksheet_dependencies(element)))
+
+
+_RECORD_BUILDERS = {
+    _WORKBOOK_DATASOURCE_PATH: _datasource_record,
+    _TDS_DATASOURCE_PATH: _datasource_record,
+    _WORKSHEET_PATH: _worksheet_record,
+    _DASHBOARD_PATH: lambda x: DashboardRecord(x.attrib['name']),
+    _SHAPE_PATH: lambda x: ShapeRecord(x.attrib['name']),
+}
+
+
+def _release(element):
+    """Frees an element that has been fully handled, along with its earlier siblings."""
+    element.clear()
+    parent = element.getparent()
+    if parent is not None:
+        while element.getprevious() is not None:
+            del parent[0]
+
+
+def scan_file(filename):
+    """Reads the workbook or data source at `filename` (packaged or not) and yields
+    a record for each Data Source, Worksheet, dashboard and shape it contains, in
+    document order.
+
+    This is a read-only alternative to `Workbook` and `Datasource.from_file` for
+    inventory jobs. The document is streamed and every element is freed as soon as
+    it has been handled, so memory use is bounded by the largest single Data Source
+    or Worksheet rather than by the size of the file.
+
+    Worksheet records list the (datasource name, column name) pairs they depend on,
+    which is what `Field.worksheets` is built from in a `Workbook`.
+
+    """
+    with _open_xml_stream(filename) as xml_stream:
+        path = []
+        # Depth of the outermost element being kept for a record, None if there is none
+        keep_depth = None
+        for event, element in ET.iterparse(xml_stream, events=('start', 'end')):
+            if event == 'start':
+                path.append(element.tag)
+                if len(path) == 1:
+                    _check_supported_version(element)
+                if keep_depth is None and tuple(path) in _RECORD_BUILDERS:
+                    keep_depth = len(path)
+                continue
+
+            depth = len(path)
+            if keep_depth == depth:
+                yield _RECORD_BUILDERS[tuple(path)](element)
+                keep_depth = None
+            if keep_depth is None:
+                _release(element)
+            path.pop()
+
+
+def summarize_file(filename, cache=None):
+    """Scans `filename` and gathers its records into a FileSummary. Any error raised
+    while reading the file is captured in the summary's `error` field as a string
+    instead of being raised, so one bad file does not stop a bulk scan.
+
+    If a `cache.SummaryCache` is given, an unchanged file is answered from it
+    without being read, and new summaries are added to it."""
+    if cache is None:
+        return _summarize_file(filename)
+
+    summary = _cached_summary(cache, filename)
+    if summary is None:
+        summary = _summarize_file(filename)
+        cache.put(filename, summary)
+    return summary
+
+
+def _cached_summary(cache, filename):
+    try:
+        return cache.get(filename)
+    except OSError:
+        # Leave it to the scan to report the file as unreadable
+        return None
+
+
+def _summarize_file(filename):
+    records = collections.defaultdict(list)
+    try:
+        for record in scan_file(filename):
+            records[type(record)].append(record)
+    except Exception as ex:
+        return FileSummary(filename, (), (), (), (), '{}: {}'.format(type(ex).__name__, ex))
+
+    return FileSummary(filename,
+                       tuple(records[DatasourceRecord]),
+                       tuple(records[WorksheetRecord]),
+                       tuple(x.name for x in records[DashboardRecord]),
+                       tuple(x.name for x in records[ShapeRecord]),
+                       None)
+
+
+def find_tableau_files(directory):
+    """Yields the paths of all workbook and data source files below `directory`."""
+    for root_dir, _, files in os.walk(directory):
+        for f in sorted(files):
+            if os.path.splitext(f)[1].lower() in TABLEAU_FILE_EXTENSIONS:
+                yield os.path.join(root_dir, f)
+
+
+def _run_in_pool(func, items, workers=None, max_in_flight=None):
+    """Calls `func` on every item in a pool of `workers` processes and yields the
+    results in completion order. At most `max_in_flight` items are submitted at a
+    time, so `items` can be a long-running generator. `func` must be picklable."""
+    workers = workers or os.cpu_count() or 1
+    if max_in_flight is None:
+        max_in_flight = workers * 4
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        items = iter(items)
+        pending = {executor.submit(func, x) for x in itertools.islice(items, max_in_flight)}
+        while pending:
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            pending.update(executor.submit(func, x) for x in itertools.islice(items, len(done)))
+            for future in done:
+                yield future.result()
+
+
+def _scan_with_cache(paths, workers, max_in_flight, cache):
+    """Like `_run_in_pool`, but cache hits are yielded as soon as they are found and only
+    misses go to the pool, which isn't started until the first miss."""
+    from tableaudocumentapi.cache import _summarize_file_with_digest  # The cache module imports this one
+
+    workers = workers or os.cpu_count() or 1
+    if max_in_flight is None:
+        max_in_flight = workers * 4
+
+    def results(futures):
+        for future in futures:
+            summary, digest = future.result()
+            # The cache is only used here in the parent process, the workers never see it
+            cache.put(summary.filename, summary, digest)
+            yield summary
+
+    executor = None
+    pending = set()
+    try:
+        for path in paths:
+            summary = _cached_summary(cache, path)
+            if summary is not None:
+                yield summary
+                continue
+
+            if executor is None:
+                executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+            if len(pending) >= max_in_flight:
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                yield from results(done)
+            pending.add(executor.submit(_summarize_file_with_digest, path))
+            done = {x for x in pending if x.done()}
+            pending -= done
+            yield from results(done)
+
+        while pending:
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            yield from results(done)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+
+def scan(paths, workers=None, max_in_flight=None, cache=None):
+    """Scans many workbook and data source files in parallel.
+
+    Args:
+        paths: Paths of the files to scan. Any iterable, it is consumed as work is handed out.
+        workers: Number of worker processes, defaults to the number of CPUs. Int.
+        max_in_flight: Most files handed to the workers at any time, defaults to four per worker. Int.
+        cache: A `cache.SummaryCache` that unchanged files are answered from without
+            being read, and that new summaries are added to. Optional.
+
+    Returns:
+        A generator of FileSummary tuples, one per file in the order they complete.
+        Files that could not be read have their `error` field set.
+    """
+    if cache is not None:
+        return _scan_with_cache(paths, workers, max_in_flight, cache)
+    return _run_in_pool(_summarize_file, paths, workers, max_in_flight)
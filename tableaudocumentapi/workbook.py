@@ -1,62 +1,272 @@
+import collections
+import functools
+import io
 import weakref
 
-from tableaudocumentapi import Datasource, xfile
+from tableaudocumentapi import Datasource, Worksheet, aio, instrumentation, xfile
+from tableaudocumentapi.connection import _ConnectionIndex, _validate_changes
+from tableaudocumentapi.worksheet import _worksheet_dependencies
 from tableaudocumentapi.xfile import xml_open, TableauInvalidFileException
 
+# Which columns each worksheet uses, and the reverse, built in one pass over the worksheets.
+# by_worksheet maps a worksheet name, and by_field a (datasource name, column name) pair,
+# to the matching entries of the other kind in document order (as dict keys).
+_WorksheetIndex = collections.namedtuple(
+    '_WorksheetIndex', ['names', 'elements', 'by_datasource', 'by_worksheet', 'by_field'])
+
 
 class Workbook(object):
     """A class for writing Tableau workbook files."""
 
-    def __init__(self, filename):
+    def __init__(self, filename, lazy=False, opaque_subtrees=None):
         """Open the workbook at `filename`. This will handle packaged and unpacked
         workbook files automatically. This will also parse Data Sources and Worksheets
         for access.
 
+        If `lazy` is True, dashboards, Data Sources, Worksheets and shapes are only
+        parsed the first time they are accessed, and which worksheets use a field is
+        only worked out when the fields of its Data Source are first built.
+
+        `opaque_subtrees` names top-level elements of the workbook, such as
+        `xfile.HEAVY_SUBTREES` (thumbnails and windows), that are kept as raw bytes
+        instead of being parsed, and are written back unchanged on save.
+
+        `filename` can also be the contents of a workbook file, as bytes, a
+        bytes-like object or a binary file-like object. Such a workbook has no
+        filename, and is saved with `save_as`, `save_to` or `to_bytes`.
+
         """
 
-        self._filename = filename
+        self._source = xfile._as_source(filename)
+        self._filename = None if xfile._is_in_memory(self._source) else self._source
+        self._lazy = lazy
 
-        self._workbookTree = xml_open(self._filename, 'workbook')
+        self._opaque_segments = None
+        if opaque_subtrees:
+            self._workbookTree, self._opaque_segments = xfile.xml_open_spliced(
+                self._source, opaque_subtrees, 'workbook')
+        else:
+            self._workbookTree = xml_open(self._source, 'workbook')
         if not self._workbookTree:
             raise TableauInvalidFileException("Workbook file must have a workbook element at root")
 
         self._workbookRoot = self._workbookTree.getroot()
+        aio.checkpoint()
 
-        self._dashboards = self._prepare_dashboards(self._workbookRoot)
+        self._dashboards = None
+        self._datasources = None
+        self._datasource_index = None
+        self._worksheets = None
+        self._worksheet_index = None
+        self._worksheet_objects = {}
+        self._shapes = None
+        self._connection_index = None
+        self._dependency_graph = None
+        self._modified = False
 
-        self._datasources = self._prepare_datasources(
-            self._workbookRoot)
+        if not lazy:
+            self._dashboards = self._prepare_dashboards(self._workbookRoot)
 
-        self._datasource_index = self._prepare_datasource_index(self._datasources)
+            self._datasources = self._prepare_datasources(
+                self._workbookRoot)
+            for datasource in self._datasources:
+                datasource._workbook = self
+
+            self._datasource_index = self._prepare_datasource_index(self._datasources)
 
-        self._worksheets = self._prepare_worksheets(
-            self._workbookRoot, self._datasource_index)
+            self._worksheets = self._prepare_worksheets(
+                self._get_worksheet_index(), self._datasource_index)
 
-        self._shapes = self._prepare_shapes(self._workbookRoot)
+            self._shapes = self._prepare_shapes(self._workbookRoot)
 
     @property
     def dashboards(self):
+        if self._dashboards is None:
+            self._dashboards = self._prepare_dashboards(self._workbookRoot)
         return self._dashboards
 
     @property
     def datasources(self):
+        if self._datasources is None:
+            self._load_datasources()
         return self._datasources
 
     @property
     def worksheets(self):
+        if self._worksheets is None:
+            self._worksheets = self._get_worksheet_index().names
         return self._worksheets
 
     @property
     def filename(self):
         return self._filename
 
+    @property
+    def dependencies(self):
+        """Which fields the calculations of all the Data Sources use, including fields of other
+        Data Sources, see `dependencies.DependencyGraph`. Built the first time it's used and
+        updated as calculations are set."""
+        if self._dependency_graph is None:
+            from tableaudocumentapi.dependencies import DependencyGraph  # Only needed here, and compiles patterns
+            graph = DependencyGraph()
+            for datasource in self.datasources:
+                datasource._attach_dependency_graph(graph)
+            self._dependency_graph = graph
+        return self._dependency_graph
+
+    @property
+    def connections(self):
+        """The connections of all the datasources, in document order. List of Connection."""
+        return list(self._get_connection_index().connections)
+
+    @property
+    def modified(self):
+        """Whether the workbook or any of its datasources were changed since it was opened or
+        last saved. Changes made directly to the XML are not tracked, see `mark_modified`."""
+        return self._modified or bool(self.modified_datasources)
+
+    @property
+    def modified_datasources(self):
+        """The datasources that were changed, see `Datasource.modified`. List of Datasource."""
+        return [x for x in self._datasources or () if x.modified]
+
+    def mark_modified(self):
+        """Records a change made directly to the XML of the workbook, so `save` writes it."""
+        self._modified = True
+
     @property
     def shapes(self):
+        if self._shapes is None:
+            self._shapes = self._prepare_shapes(self._workbookRoot)
         return self._shapes
 
+    def get_worksheet(self, name):
+        """
+        Get a worksheet and the fields it uses by name.
+
+        Args:
+            name:  Name of the worksheet. String.
+
+        Returns:
+            The worksheet. Worksheet. Raises KeyError if there is no worksheet with that name.
+
+        """
+        worksheet = self._worksheet_objects.get(name)
+        if worksheet is None:
+            worksheet = Worksheet(self._get_worksheet_index().elements[name], self)
+            self._worksheet_objects[name] = worksheet
+        return worksheet
+
+    def worksheets_using(self, datasource_name, field_id):
+        """
+        Find the worksheets that use a field.
+
+        Args:
+            datasource_name:  Name of the Data Source holding the field. String.
+            field_id:  Id of the field, e.g. '[Sales]'. String.
+
+        Returns:
+            The worksheets using the field, in document order. List of Worksheet.
+
+        """
+        names = self._get_worksheet_index().by_field.get((datasource_name, field_id), ())
+        return [self.get_worksheet(x) for x in names]
+
+    def rename_fields(self, datasource_name, renames, captions=None):
+        """
+        Rename fields of a Data Source, and rewrite the references to them in the calculations
+        of all the Data Sources and in the worksheets, in one pass over the workbook. Worksheets
+        refer to the fields in the columns they depend on, the instances of those columns,
+        and their shelves, filters and encodings.
+
+        Args:
+            datasource_name:  Name of the Data Source holding the fields. String.
+            renames:  New field ids by current field id, e.g. {'[Sales]': '[Revenue]'}. Dict.
+            captions:  New captions by current field id, which are also set on the columns
+                worksheets depend on. Dict.
+
+        Returns:
+            Nothing.
+
+        """
+        datasource = self._get_datasource(datasource_name)
+        changed = datasource._rename_fields(self._workbookRoot, renames, captions or {})
+        for other in self.datasources:
+            if other is not datasource:
+                other._references_rewritten({}, changed.get(other.name, ()))
+        self._reset_dependency_graph()
+        if changed.get(None) or captions:
+            self._modified = True
+        # Worksheets now depend on the new ids
+        self._worksheet_index = None
+
+    def find_connections(self, **match):
+        """
+        Find connections of any of the datasources by their properties, using an index of
+        their dbclass, server, dbname and named_connection that is built on first use.
+
+        Args:
+            **match:  Values of connection properties, one of connection.MATCHABLE_ATTRIBUTES.
+
+        Returns:
+            The connections with all of the given values, in document order. List of Connection.
+
+        """
+        return self._get_connection_index().find(match)
+
+    def update_connections(self, match=None, **changes):
+        """
+        Change properties of all the connections matching some values in one pass.
+
+        Args:
+            match:  Values of connection properties, see `find_connections`. All connections
+                if None. Dict.
+            **changes:  New values of connection properties, one of connection.CHANGEABLE_ATTRIBUTES.
+                All of them are checked before any connection is changed.
+
+        Returns:
+            The connections that changed, in document order. Matching connections that already
+            had the new values are left out. List of Connection.
+
+        """
+        _validate_changes(changes)
+        return [x for x in self.find_connections(**(match or {})) if x.update(**changes)]
+
+    def _reset_dependency_graph(self):
+        # Calculations of any Data Source can use renamed fields, so the graph is built again when next used
+        self._dependency_graph = None
+        if self._datasources is not None:
+            for datasource in self._datasources:
+                datasource._detach_dependency_graph()
+
+    def _get_connection_index(self):
+        if self._connection_index is None:
+            self._connection_index = _ConnectionIndex(c for ds in self.datasources for c in ds.connections)
+        return self._connection_index
+
+    def _load_datasources(self):
+        self._datasources = self._prepare_datasources(self._workbookRoot)
+        self._datasource_index = self._prepare_datasource_index(self._datasources)
+        for datasource in self._datasources:
+            datasource._field_usage_loader = functools.partial(self._get_field_usage, datasource.name)
+            datasource._workbook = self
+
+    def _get_datasource(self, name):
+        if self._datasource_index is None:
+            self._load_datasources()
+        return self._datasource_index[name]
+
+    def _get_worksheet_index(self):
+        if self._worksheet_index is None:
+            self._worksheet_index = self._prepare_worksheet_index(self._workbookRoot)
+        return self._worksheet_index
+
+    def _get_field_usage(self, datasource_name):
+        return self._get_worksheet_index().by_datasource.get(datasource_name, [])
+
     def save(self):
         """
-        Call finalization code and save file.
+        Call finalization code and save file. Does nothing if the workbook wasn't modified.
 
         Args:
             None.
@@ -65,9 +275,14 @@ class Workbook(object):
             Nothing.
 
         """
+        if not self.modified:
+            return
 
         # save the file
-        xfile._save_file(self._filename, self._workbookTree)
+        xfile._save_file(self._source, self._workbookTree, opaque_segments=self._opaque_segments)
+        self._modified = False
+        for datasource in self._datasources or ():
+            datasource._clear_modified()
 
     def save_as(self, new_filename):
         """
@@ -81,7 +296,67 @@ class Workbook(object):
 
         """
         xfile._save_file(
-            self._filename, self._workbookTree, new_filename)
+            self._source, self._workbookTree, new_filename, self._opaque_segments)
+
+    @classmethod
+    async def open_async(cls, filename, lazy=False, opaque_subtrees=None, executor=None):
+        """
+        Open a workbook without blocking the event loop, see `aio.run`.
+
+        Args:
+            filename, lazy, opaque_subtrees:  As for the constructor.
+            executor:  Executor to parse the workbook in, instead of the one set with `aio.set_executor`.
+
+        Returns:
+            The workbook. Workbook.
+
+        """
+        return await aio.run(cls, filename, lazy=lazy, opaque_subtrees=opaque_subtrees, executor=executor)
+
+    async def save_async(self, executor=None):
+        """
+        Save the file without blocking the event loop, see `save` and `aio.run`.
+
+        Returns:
+            Nothing.
+
+        """
+        await aio.run(self.save, executor=executor)
+
+    async def save_as_async(self, new_filename, executor=None):
+        """
+        Save the file with the name provided without blocking the event loop, see `save_as` and `aio.run`.
+
+        Returns:
+            Nothing.
+
+        """
+        await aio.run(self.save_as, new_filename, executor=executor)
+
+    def save_to(self, stream):
+        """
+        Write the workbook to a stream, packaged if it was opened from a .twbx.
+
+        Args:
+            stream:  Binary file-like object to write to, which doesn't need to be seekable.
+
+        Returns:
+            Nothing.
+
+        """
+        xfile._save_to_stream(self._source, self._workbookTree, stream, self._opaque_segments)
+
+    def to_bytes(self):
+        """
+        Get the contents of the workbook file, packaged if it was opened from a .twbx.
+
+        Returns:
+            The file contents. Bytes.
+
+        """
+        stream = io.BytesIO()
+        self.save_to(stream)
+        return stream.getvalue()
 
     @staticmethod
     def _prepare_datasource_index(datasources):
@@ -92,6 +367,7 @@ class Workbook(object):
         return retval
 
     @staticmethod
+    @instrumentation.timed('workbook.prepare_datasources')
     def _prepare_datasources(xml_root):
         datasources = []
 
@@ -107,10 +383,11 @@ class Workbook(object):
         return datasources
 
     @staticmethod
+    @instrumentation.timed('workbook.prepare_dashboards')
     def _prepare_dashboards(xml_root):
         dashboards = []
 
-        dashboard_elements = xml_root.find('.//dashboards')
+        dashboard_elements = xml_root.find('dashboards')
         if dashboard_elements is None:
             return []
 
@@ -121,32 +398,44 @@ class Workbook(object):
         return dashboards
 
     @staticmethod
-    def _prepare_worksheets(xml_root, ds_index):
-        worksheets = []
-        worksheets_element = xml_root.find('.//worksheets')
+    @instrumentation.timed('workbook.prepare_worksheet_index')
+    def _prepare_worksheet_index(xml_root):
+        index = _WorksheetIndex([], {}, collections.defaultdict(list), {}, collections.defaultdict(dict))
+        worksheets_element = xml_root.find('worksheets')
         if worksheets_element is None:
-            return worksheets
+            return index
 
         for worksheet_element in worksheets_element:
             worksheet_name = worksheet_element.attrib['name']
-            worksheets.append(worksheet_name)  # TODO: A real worksheet object, for now, only name
+            index.names.append(worksheet_name)
+            index.elements[worksheet_name] = worksheet_element
+            used_fields = index.by_worksheet.setdefault(worksheet_name, {})
+
+            dependencies = _worksheet_dependencies(worksheet_element)
+            instrumentation.count('elements', len(dependencies))
+            for datasource_name, column_name in dependencies:
+                index.by_datasource[datasource_name].append((worksheet_name, column_name))
+                used_fields[(datasource_name, column_name)] = None
+                index.by_field[(datasource_name, column_name)][worksheet_name] = None
 
-            dependencies = worksheet_element.findall('.//datasource-dependencies')
+        return index
 
-            for dependency in dependencies:
-                datasource_name = dependency.attrib['datasource']
-                datasource = ds_index[datasource_name]
-                for column in dependency.findall('.//column'):
-                    column_name = column.attrib['name']
-                    if column_name in datasource.fields:
-                        datasource.fields[column_name].add_used_in(worksheet_name)
+    @staticmethod
+    @instrumentation.timed('workbook.prepare_worksheets')
+    def _prepare_worksheets(worksheet_index, ds_index):
+        for datasource_name, dependencies in worksheet_index.by_datasource.items():
+            datasource = ds_index[datasource_name]
+            for worksheet_name, column_name in dependencies:
+                if column_name in datasource.fields:
+                    datasource.fields[column_name].add_used_in(worksheet_name)
 
-        return worksheets
+        return worksheet_index.names
 
     @staticmethod
+    @instrumentation.timed('workbook.prepare_shapes')
     def _prepare_shapes(xml_root):
         shapes = []
-        worksheets_element = xml_root.find('.//external/shapes')
+        worksheets_element = xml_root.find('external/shapes')
         if worksheets_element is None:
             return shapes
 
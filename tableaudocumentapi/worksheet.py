@@ -0,0 +1,51 @@
+def _worksheet_dependencies(worksheet_xml):
+    """(datasource name, column name) pairs of the columns a worksheet element depends on,
+    in document order, repeats included. List."""
+    return [(dependency.attrib['datasource'], column.attrib['name'])
+            for dependency in worksheet_xml.iter('datasource-dependencies')
+            for column in dependency.iter('column')]
+
+
+class Worksheet(object):
+    """A class representing a worksheet in a workbook, and the fields it uses."""
+
+    def __init__(self, worksheet_xml, workbook):
+        """Worksheets are created by their Workbook, see `Workbook.get_worksheet`."""
+        self._worksheetXML = worksheet_xml
+        self._workbook = workbook
+        self._name = worksheet_xml.get('name')
+
+    def __repr__(self):
+        return "'<Worksheet name='{}' @ {}>'".format(self._name, hex(id(self)))
+
+    @property
+    def name(self):
+        """ Name of the worksheet. """
+        return self._name
+
+    @property
+    def xml(self):
+        """ XML representation of the worksheet. """
+        return self._worksheetXML
+
+    @property
+    def dependencies(self):
+        """ (datasource name, field id) pairs of the columns used by the worksheet. List. """
+        return list(self._workbook._get_worksheet_index().by_worksheet.get(self._name, ()))
+
+    @property
+    def datasources(self):
+        """ Data Sources the worksheet draws fields from. List of Datasource. """
+        names = dict.fromkeys(x for x, _ in self.dependencies)
+        return [self._workbook._get_datasource(x) for x in names]
+
+    @property
+    def fields(self):
+        """ Fields used by the worksheet. Columns that don't resolve to a field of their
+        Data Source are left out. List of Field. """
+        fields = []
+        for datasource_name, field_id in self.dependencies:
+            datasource_fields = self._workbook._get_datasource(datasource_name).fields
+            if field_id in datasource_fields:
+                fields.append(datasource_fields[field_id])
+        return fields
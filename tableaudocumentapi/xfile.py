@@ -1,58 +1,340 @@
+import collections
 import contextlib
+import io
 import os
+import re
 import shutil
-import tempfile
+import struct
+import time
 import zipfile
 from lxml import etree as ET
 
-from distutils.version import LooseVersion as Version
+from tableaudocumentapi import aio, instrumentation
 
-MIN_SUPPORTED_VERSION = Version("9.0")
+_VERSION_PATTERN = re.compile(r'\d+(?:\.\d+)*')
+
+DOCUMENT_ROOT_TAGS = ('workbook', 'datasource')
+
+_ZIP_LOCAL_HEADER_SIZE = 30
+_ZIP_DATA_DESCRIPTOR_FLAG = 0x08
+_ZIP64_EXTRA_ID = 0x0001
+_COPY_CHUNK_SIZE = 1024 * 1024
+
+# Top-level elements of a workbook that the API never reads, and that can hold
+# megabytes of base64 images and window layout
+HEAVY_SUBTREES = ('thumbnails', 'windows')
+
+_OPAQUE_PI_TARGET = 'tableaudocumentapi-opaque'
+_XML_ENCODING_PATTERN = re.compile(br'^\s*<\?xml[^>]*?encoding\s*=\s*["\']([^"\']+)')
+
+# Raw bytes of the subtrees left out of a parsed document, each one replaced in the
+# tree by a processing instruction `<?tableaudocumentapi-opaque {marker}-{index}?>`
+OpaqueSegments = collections.namedtuple('OpaqueSegments', ['marker', 'chunks'])
 
 
 class TableauVersionNotSupportedException(Exception):
     pass
 
 
+def parse_version(version):
+    """Parses a Tableau document version such as '9.3' or '18.1' into a tuple of
+    ints that compares the way the versions do. Trailing zeros are dropped, so
+    '10' and '10.0' are equal. Anything after the leading numbers is ignored, and
+    a missing version or one that doesn't start with a number is (0,).
+
+    Returns:
+        Tuple of ints.
+    """
+    match = _VERSION_PATTERN.match(version or '')
+    if match is None:
+        return (0,)
+    parts = [int(x) for x in match.group().split('.')]
+    while len(parts) > 1 and parts[-1] == 0:
+        parts.pop()
+    return tuple(parts)
+
+
+MIN_SUPPORTED_VERSION = parse_version('9.0')
+
+
 class TableauInvalidFileException(Exception):
     pass
 
 
+class _BufferReader(io.RawIOBase):
+    """A seekable binary stream over a bytes-like object, so memoryviews and
+    bytearrays can be read without copying them into a BytesIO first."""
+
+    def __init__(self, buffer):
+        self._view = memoryview(buffer).cast('B')
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._view[self._position:self._position + len(buffer)]
+        buffer[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._position, io.SEEK_END: len(self._view)}[whence]
+        self._position = max(base + offset, 0)
+        return self._position
+
+    def tell(self):
+        return self._position
+
+
+def _as_source(file_or_data):
+    """Normalizes what a document can be opened from. Paths are returned as they
+    are, bytes and other bytes-like objects as bytes or a memoryview, and binary
+    file-like objects are read, from their current position, into bytes."""
+    if isinstance(file_or_data, bytes):
+        return file_or_data
+    if isinstance(file_or_data, (bytearray, memoryview)):
+        return memoryview(file_or_data)
+    if hasattr(file_or_data, 'read'):
+        return file_or_data.read()
+    return file_or_data
+
+
+def _is_in_memory(source):
+    return isinstance(source, (bytes, memoryview))
+
+
+def _reader(source):
+    """Returns what zipfile and lxml should be given to read 'source': the path
+    itself, or a new stream over the in-memory document."""
+    if isinstance(source, bytes):
+        return io.BytesIO(source)  # Shares the bytes rather than copying them
+    if isinstance(source, memoryview):
+        return _BufferReader(source)
+    return source
+
+
+def _describe(source):
+    return '<in-memory document>' if _is_in_memory(source) else source
+
+
+def _is_package(source):
+    return zipfile.is_zipfile(_reader(source))
+
+
+@instrumentation.timed('xml_open')
 def xml_open(filename, expected_root=None):
     """Opens the provided 'filename'. Handles detecting if the file is an archive,
-    detecting the document version, and validating the root tag."""
+    detecting the document version, and validating the root tag. Instead of a
+    path, 'filename' can be the contents of the file as bytes, a bytes-like
+    object or a binary file-like object."""
+    filename = _as_source(filename)
 
     # Is the file a zip (.twbx or .tdsx)
-    if zipfile.is_zipfile(filename):
-        tree = get_xml_from_archive(filename)
-    else:
+    with instrumentation.span('xml_open.detect_archive'):
+        is_archive = _is_package(filename)
+
+    with instrumentation.span('xml_open.parse'):
+        if is_archive:
+            tree = get_xml_from_archive(filename)
+        else:
+            _register_all_namespaces()
+            tree = ET.parse(_reader(filename))
+            if instrumentation.enabled():
+                instrumentation.count('bytes_read', len(filename) if _is_in_memory(filename)
+                                      else os.path.getsize(filename))
+
+    return _check_document(filename, tree, expected_root)
+
+
+@instrumentation.timed('xml_open')
+def xml_open_spliced(filename, opaque_subtrees, expected_root=None):
+    """Opens 'filename' like `xml_open`, but the top-level elements whose tags are
+    in 'opaque_subtrees' are kept as raw bytes instead of being parsed. Pass the
+    returned segments to `_save_file` to write them back out verbatim.
+
+    Returns:
+        The tree, or None as for `xml_open`, and an OpaqueSegments or None if
+        nothing was left out. Tuple.
+    """
+    filename = _as_source(filename)
+    with instrumentation.span('xml_open.read'), _open_xml_stream(filename) as xml_stream:
+        # Grown in place, unlike bytes, so the document isn't copied while it is read
+        data = bytearray()
+        for chunk in iter(lambda: xml_stream.read(_COPY_CHUNK_SIZE), b''):
+            aio.checkpoint()
+            data += chunk
+
+    with instrumentation.span('xml_open.parse'):
         _register_all_namespaces()
-        tree = ET.parse(filename)
-
+        pieces, segments = _splice_out_subtrees(data, opaque_subtrees)
+        parser = ET.XMLParser()
+        for piece in pieces:
+            # libxml2 refuses to take more than about 10 MB in one go
+            for start in range(0, len(piece), _COPY_CHUNK_SIZE):
+                parser.feed(bytes(piece[start:start + _COPY_CHUNK_SIZE]))
+        tree = parser.close().getroottree()
+        if segments is not None and _count_opaque_placeholders(tree, segments) != len(segments.chunks):
+            # A match wasn't really a top-level element, e.g. it was inside a comment
+            tree, segments = ET.parse(io.BytesIO(bytes(data))), None
+        if segments is not None:
+            instrumentation.count('bytes_skipped', sum(len(x) for x in segments.chunks))
+
+    return _check_document(filename, tree, expected_root), segments
+
+
+def _check_document(filename, tree, expected_root):
     # Is the file a supported version
     tree_root = tree.getroot()
-    file_version = Version(tree_root.attrib.get('version', '0.0'))
-
-    if file_version < MIN_SUPPORTED_VERSION:
-        raise TableauVersionNotSupportedException(file_version)
+    if instrumentation.enabled():
+        instrumentation.count('elements', sum(1 for _ in tree_root.iter()))
+    _check_supported_version(tree_root)
 
     # Does the root tag match the object type (workbook or data source)
     if expected_root and (expected_root != tree_root.tag):
         if expected_root == 'workbook' and tree_root.tag == 'datasource':
             return  # A .twbx can contain .tds files if it contains custom geocoding.
         raise TableauInvalidFileException(
-            "'{}'' is not a valid '{}' file".format(filename, expected_root))
+            "'{}'' is not a valid '{}' file".format(_describe(filename), expected_root))
 
     return tree
 
 
+def _find_subtree(data, tag):
+    """Returns the (start, end) offsets of the first non-empty element called 'tag'
+    in 'data', or None."""
+    open_tag = b'<' + tag.encode('utf-8')
+    close_tag = b'</' + tag.encode('utf-8') + b'>'
+    start_pattern = re.compile(re.escape(open_tag) + br'(?:\s[^>]*?)?(/?)>')
+    start = data.find(open_tag)
+    while start >= 0:
+        match = start_pattern.match(data, start)
+        if match is not None and not match.group(1):
+            end = data.find(close_tag, match.end())
+            return (start, end + len(close_tag)) if end >= 0 else None
+        # Another tag starting with the same name, or an empty element
+        start = data.find(open_tag, start + 1)
+    return None
+
+
+def _splice_out_subtrees(data, tags):
+    """Cuts the first element with each of 'tags' out of the utf-8 document 'data',
+    leaving a processing instruction in place of each one. Workbooks only have one
+    of each top-level element, and stopping at the first saves scanning the rest
+    of the document again for every tag.
+
+    Returns:
+        The pieces of the new document, to be fed to a parser in turn, and an
+        OpaqueSegments with the cut out bytes, or [data] and None if nothing
+        was cut out. Tuple.
+    """
+    declared = _XML_ENCODING_PATTERN.match(data)
+    if not tags or (declared and declared.group(1).lower() not in (b'utf-8', b'utf8')):
+        return [data], None
+
+    import uuid  # Only needed here, and slow to import
+    marker = uuid.uuid4().hex
+    # The pieces are views on 'data', which is only needed while parsing. The cut out
+    # bytes are copied, so 'data' can be freed once the document is parsed.
+    view = memoryview(data)
+    pieces, chunks = [], []
+    position = 0
+    for start, end in sorted(filter(None, (_find_subtree(data, tag) for tag in set(tags)))):
+        if start < position:
+            continue  # Inside an element already cut out
+        pieces.append(view[position:start])
+        pieces.append('<?{} {}-{}?>'.format(_OPAQUE_PI_TARGET, marker, len(chunks)).encode('ascii'))
+        chunks.append(bytes(view[start:end]))
+        position = end
+
+    if not chunks:
+        return [data], None
+    pieces.append(view[position:])
+    return pieces, OpaqueSegments(marker, chunks)
+
+
+def _count_opaque_placeholders(tree, segments):
+    prefix = segments.marker + '-'
+    return sum(1 for x in tree.getroot()
+               if x.tag is ET.PI and x.target == _OPAQUE_PI_TARGET and x.text.startswith(prefix))
+
+
+def _write_document(xml_tree, stream, opaque_segments=None):
+    """Writes 'xml_tree' to 'stream' as utf-8, splicing the raw bytes of
+    'opaque_segments' back in place of their processing instructions."""
+    if opaque_segments is None:
+        xml_tree.write(stream, encoding="utf-8", xml_declaration=True)
+        return
+
+    data = ET.tostring(xml_tree, encoding="utf-8", xml_declaration=True)
+    placeholder = re.compile(r'<\?{} {}-(\d+)\?>'.format(_OPAQUE_PI_TARGET, opaque_segments.marker).encode('ascii'))
+    position = 0
+    for match in placeholder.finditer(data):
+        stream.write(data[position:match.start()])
+        stream.write(opaque_segments.chunks[int(match.group(1))])
+        position = match.end()
+    stream.write(data[position:])
+
+
+def _check_supported_version(root):
+    file_version = root.attrib.get('version', '0.0')
+
+    if parse_version(file_version) < MIN_SUPPORTED_VERSION:
+        raise TableauVersionNotSupportedException(file_version)
+
+
+@contextlib.contextmanager
+def _open_xml_stream(filename):
+    """Opens the twb/tds document in 'filename' for reading as a binary stream,
+    from inside the archive if the file is a .twbx or .tdsx. 'filename' can also
+    be an in-memory document, see `_as_source`."""
+    if not _is_package(filename):
+        if _is_in_memory(filename):
+            instrumentation.count('bytes_read', len(filename))
+            yield _reader(filename)
+            return
+        with open(filename, 'rb') as xml_file:
+            if instrumentation.enabled():
+                instrumentation.count('bytes_read', os.fstat(xml_file.fileno()).st_size)
+            yield xml_file
+        return
+
+    with zipfile.ZipFile(_reader(filename), allowZip64=True) as zf:
+        xml_file = find_file_in_zip(zf)
+        if xml_file is None:
+            raise TableauInvalidFileException(
+                "'{}' does not contain a workbook or data source".format(_describe(filename)))
+        instrumentation.count('bytes_read', zf.getinfo(xml_file).compress_size)
+        with zf.open(xml_file) as xml_stream:
+            yield xml_stream
+
+
 @contextlib.contextmanager
-def temporary_directory(*args, **kwargs):
-    d = tempfile.mkdtemp(*args, **kwargs)
+def _atomic_output(new_filename, original_filename=None):
+    """Yields a temporary file opened for binary writing next to 'new_filename',
+    which replaces 'new_filename' once the block completes without error. This
+    means a failed save never leaves a partial file behind, and saving over the
+    file being read from is safe."""
+    import tempfile  # Only needed when saving, and slow to import
+    temp_file = tempfile.NamedTemporaryFile(
+        dir=os.path.dirname(os.path.abspath(new_filename)), suffix='.tmp', delete=False)
     try:
-        yield d
-    finally:
-        shutil.rmtree(d)
+        with temp_file:
+            yield temp_file
+
+        # Keep the permissions of the file being replaced, or of the one it came from
+        for mode_source in (new_filename, original_filename):
+            if mode_source is not None and not _is_in_memory(mode_source) and os.path.exists(mode_source):
+                shutil.copymode(mode_source, temp_file.name)
+                break
+        aio.checkpoint()
+        os.replace(temp_file.name, new_filename)
+    except BaseException:
+        os.unlink(temp_file.name)
+        raise
 
 
 def _register_all_namespaces():
@@ -60,10 +342,22 @@ def _register_all_namespaces():
     ET.register_namespace("user", "http://www.tableausoftware.com/xml/user")
 
 
+def _read_root_tag(xml_file):
+    """Returns the tag of the root element of 'xml_file', or None if it is not XML.
+    Only the start of the document is read, the rest is never parsed."""
+    try:
+        for _, element in ET.iterparse(xml_file, events=('start',)):
+            return element.tag
+    except ET.ParseError:
+        pass
+    return None
+
+
 def find_file_in_zip(zip_file):
     '''Returns the twb/tds file from a Tableau packaged file format. Packaged
     files can contain cache entries which are also valid XML, so only look for
-    files with a .tds or .twb extension.
+    files with a .tds or .twb extension whose root element is a workbook or
+    data source.
     '''
 
     candidate_files = filter(lambda x: x.split('.')[-1] in ('twb', 'tds'),
@@ -71,67 +365,157 @@ def find_file_in_zip(zip_file):
 
     for filename in candidate_files:
         with zip_file.open(filename) as xml_candidate:
-            try:
-                ET.parse(xml_candidate)
+            if _read_root_tag(xml_candidate) in DOCUMENT_ROOT_TAGS:
                 return filename
-            except ET.ParseError:
-                # That's not an XML file by gosh
-                pass
 
 
 def get_xml_from_archive(filename):
-    with zipfile.ZipFile(filename, allowZip64=True) as zf:
-        with zf.open(find_file_in_zip(zf)) as xml_file:
-            xml_tree = ET.parse(xml_file)
+    with _open_xml_stream(filename) as xml_stream:
+        xml_tree = ET.parse(xml_stream)
 
     return xml_tree
 
 
-def build_archive_file(archive_contents, zip_file):
-    """Build a Tableau-compatible archive file."""
-
-    # This is tested against Desktop and Server, and reverse engineered by lots
-    # of trial and error. Do not change this logic.
-    for root_dir, _, files in os.walk(archive_contents):
-        relative_dir = os.path.relpath(root_dir, archive_contents)
-        for f in files:
-            temp_file_full_path = os.path.join(
-                archive_contents, relative_dir, f)
-            zipname = os.path.join(relative_dir, f)
-            zip_file.write(temp_file_full_path, arcname=zipname)
-
-
-def save_into_archive(xml_tree, filename, new_filename=None):
-    # Saving an archive means extracting the contents into a temp folder,
-    # saving the changes over the twb/tds in that folder, and then
-    # packaging it back up into a zip with a very specific format
-    # e.g. no empty files for directories, which Windows and Mac do by default
+def _strip_zip64_extra(extra):
+    """Removes ZIP64 records from a member's extra field. They describe the
+    member's position in the old archive and are rebuilt when it is written."""
+    stripped = b''
+    offset = 0
+    while offset + 4 <= len(extra):
+        extra_id, extra_length = struct.unpack('<HH', extra[offset:offset + 4])
+        if extra_id != _ZIP64_EXTRA_ID:
+            stripped += extra[offset:offset + 4 + extra_length]
+        offset += 4 + extra_length
+    return stripped
+
+
+def _can_copy_raw(source, destination):
+    # Raw copies use ZipFile internals, which are the same from CPython 3.7 to 3.13
+    return (hasattr(source, 'fp') and hasattr(zipfile.ZipInfo, 'FileHeader') and
+            all(hasattr(destination, x) for x in ('fp', 'start_dir', 'filelist', 'NameToInfo')))
+
+
+def _copy_member(source, destination, zinfo):
+    """Copies the member 'zinfo' from the 'source' archive into 'destination'
+    through the public API, decompressing and recompressing it."""
+    new_info = zipfile.ZipInfo(zinfo.filename, zinfo.date_time)
+    for attrib in ('compress_type', 'comment', 'create_system', 'external_attr', 'file_size'):
+        setattr(new_info, attrib, getattr(zinfo, attrib))
+    with source.open(zinfo) as member, destination.open(new_info, 'w') as new_member:
+        shutil.copyfileobj(member, new_member, _COPY_CHUNK_SIZE)
+
+
+def _copy_raw_member(source, destination, zinfo):
+    """Copies the member 'zinfo' from the 'source' archive into 'destination'
+    as raw compressed bytes, without decompressing and recompressing it."""
+    if not _can_copy_raw(source, destination):
+        _copy_member(source, destination, zinfo)
+        return
+
+    # Skip over the local file header to the start of the compressed data
+    source.fp.seek(zinfo.header_offset)
+    local_header = source.fp.read(_ZIP_LOCAL_HEADER_SIZE)
+    name_length, extra_length = struct.unpack('<HH', local_header[26:30])
+    source.fp.seek(name_length + extra_length, os.SEEK_CUR)
+
+    new_info = zipfile.ZipInfo(zinfo.filename, zinfo.date_time)
+    for attrib in ('compress_type', 'comment', 'create_system', 'create_version', 'extract_version',
+                   'internal_attr', 'external_attr', 'CRC', 'compress_size', 'file_size'):
+        setattr(new_info, attrib, getattr(zinfo, attrib))
+    # Sizes and CRC are known up front, so they go in the local header instead of a data descriptor
+    new_info.flag_bits = zinfo.flag_bits & ~_ZIP_DATA_DESCRIPTOR_FLAG
+    new_info.extra = _strip_zip64_extra(zinfo.extra)
+    zip64 = zinfo.file_size > zipfile.ZIP64_LIMIT or zinfo.compress_size > zipfile.ZIP64_LIMIT
+
+    # ZipFile has no public API for adding already compressed data, so the member
+    # is written the same way ZipFile.open(..., 'w') does it. Streams that can't
+    # seek are always at start_dir already
+    if destination.fp.tell() != destination.start_dir:
+        destination.fp.seek(destination.start_dir)
+    new_info.header_offset = destination.fp.tell()
+    destination.fp.write(new_info.FileHeader(zip64))
+
+    remaining = zinfo.compress_size
+    while remaining > 0:
+        chunk = source.fp.read(min(_COPY_CHUNK_SIZE, remaining))
+        if not chunk:
+            raise zipfile.BadZipFile("Truncated member '{}'".format(zinfo.filename))
+        destination.fp.write(chunk)
+        remaining -= len(chunk)
+
+    destination.start_dir = destination.fp.tell()
+    destination.filelist.append(new_info)
+    destination.NameToInfo[new_info.filename] = new_info
+    instrumentation.count('members_copied')
+    instrumentation.count('bytes_copied', zinfo.compress_size)
+
+
+def save_into_archive(xml_tree, filename, new_filename=None, opaque_segments=None):
+    # Saving an archive means streaming the members of the original package
+    # into a new one. Only the twb/tds is re-serialized, everything else
+    # (extracts, images, caches) is copied as raw compressed bytes. The new
+    # package keeps a very specific format: the original member order and
+    # no empty files for directories, which Windows and Mac add by default
 
     if new_filename is None:
         new_filename = filename
 
-    # Extract to temp directory
-    with temporary_directory() as temp_path:
-        with zipfile.ZipFile(filename, allowZip64=True) as zf:
-            xml_file = find_file_in_zip(zf)
-            zf.extractall(temp_path)
-        # Write the new version of the file to the temp directory
-        xml_tree.write(os.path.join(
-            temp_path, xml_file), encoding="utf-8", xml_declaration=True)
+    with _atomic_output(new_filename, filename) as temp_file:
+        _write_package(xml_tree, filename, temp_file, opaque_segments)
+
+
+def _write_package(xml_tree, source, stream, opaque_segments=None):
+    """Writes the package 'source', with its document replaced by 'xml_tree', to
+    the binary 'stream', which doesn't need to be seekable."""
+    with zipfile.ZipFile(_reader(source), allowZip64=True) as zf:
+        xml_file = find_file_in_zip(zf)
+        with zipfile.ZipFile(stream, "w", compression=zipfile.ZIP_DEFLATED, allowZip64=True) as new_archive:
+            for zinfo in zf.infolist():
+                if zinfo.filename.endswith('/'):
+                    continue
+                aio.checkpoint()
+                if zinfo.filename != xml_file:
+                    _copy_raw_member(zf, new_archive, zinfo)
+                    continue
 
-        # Write the new archive with the contents of the temp folder
-        with zipfile.ZipFile(new_filename, "w", compression=zipfile.ZIP_DEFLATED, allowZip64=True) as new_archive:
-            build_archive_file(temp_path, new_archive)
+                xml_info = zipfile.ZipInfo(xml_file, time.localtime()[:6])
+                xml_info.compress_type = zipfile.ZIP_DEFLATED
+                xml_info.external_attr = zinfo.external_attr
+                with instrumentation.span('save_file.write_document'), new_archive.open(xml_info, 'w') as xml_stream:
+                    _write_document(xml_tree, xml_stream, opaque_segments)
 
 
-def _save_file(container_file, xml_tree, new_filename=None):
+@instrumentation.timed('save_file')
+def _save_file(container_file, xml_tree, new_filename=None, opaque_segments=None):
 
     _register_all_namespaces()  # this shouldn't be necessary, should be done on open
 
     if new_filename is None:
+        if container_file is None or _is_in_memory(container_file):
+            raise ValueError('The document was not opened from a file, so it has to be saved under a new name')
         new_filename = container_file
 
-    if zipfile.is_zipfile(container_file):
-        save_into_archive(xml_tree, container_file, new_filename)
+    if container_file is not None and _is_package(container_file):
+        save_into_archive(xml_tree, container_file, new_filename, opaque_segments)
+    else:
+        with _atomic_output(new_filename, container_file) as temp_file:
+            with instrumentation.span('save_file.write_document'):
+                _write_document(xml_tree, temp_file, opaque_segments)
+
+    if instrumentation.enabled():
+        instrumentation.count('bytes_written', os.path.getsize(new_filename))
+
+
+@instrumentation.timed('save_file')
+def _save_to_stream(container_file, xml_tree, stream, opaque_segments=None):
+    """Writes the document to the binary 'stream': as a package like 'container_file'
+    if that is one, otherwise as plain XML. 'container_file' may be a path, an
+    in-memory document or None, and nothing is written to the filesystem."""
+
+    _register_all_namespaces()
+
+    if container_file is not None and _is_package(container_file):
+        _write_package(xml_tree, container_file, stream, opaque_segments)
     else:
-        xml_tree.write(new_filename, encoding="utf-8", xml_declaration=True)
+        with instrumentation.span('save_file.write_document'):
+            _write_document(xml_tree, stream, opaque_segments)
@@ -0,0 +1,136 @@
+import asyncio
+import concurrent.futures
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from test.assets.index import *
+from tableaudocumentapi import Workbook, aio
+
+
+class AsyncWorkbook(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp('tda-aio')
+        self.executor = concurrent.futures.ThreadPoolExecutor(8)
+
+    def tearDown(self):
+        aio.set_concurrency_limit(aio.DEFAULT_CONCURRENCY_LIMIT)
+        self.executor.shutdown()
+        shutil.rmtree(self.temp_dir)
+
+    def test_open_and_save_as(self):
+        new_filename = os.path.join(self.temp_dir, 'saved.twbx')
+
+        async def main():
+            wb = await Workbook.open_async(TWBX_WITH_CACHE_FILES, lazy=True, executor=self.executor)
+            wb.datasources[1].connections[0].server = 'newserver'
+            await wb.save_as_async(new_filename)
+
+        asyncio.run(main())
+        self.assertEqual('newserver', Workbook(new_filename).datasources[1].connections[0].server)
+
+    def test_concurrency_limit(self):
+        lock = threading.Lock()
+        running = [0]
+        most_running = [0]
+
+        def work():
+            with lock:
+                running[0] += 1
+                most_running[0] = max(most_running[0], running[0])
+            time.sleep(0.02)
+            with lock:
+                running[0] -= 1
+
+        async def main():
+            await asyncio.gather(*(aio.run(work, executor=self.executor) for _ in range(8)))
+
+        aio.set_concurrency_limit(2)
+        asyncio.run(main())
+        self.assertEqual(2, most_running[0])
+
+    def test_cancelled_work_stops_at_checkpoint(self):
+        started = threading.Event()
+        stopped = []
+
+        def work():
+            started.set()
+            try:
+                while True:
+                    aio.checkpoint()
+                    time.sleep(0.001)
+            except aio.OperationCancelled:
+                stopped.append(True)
+                raise
+
+        async def main():
+            task = asyncio.ensure_future(aio.run(work, executor=self.executor))
+            while not started.is_set():
+                await asyncio.sleep(0.001)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            self.assertEqual([True], stopped)
+            # The slot was given back
+            self.assertEqual(3, await aio.run(len, 'abc', executor=self.executor))
+
+        aio.set_concurrency_limit(1)
+        asyncio.run(main())
+
+    def test_cancelled_twice_keeps_slot_until_stopped(self):
+        started = threading.Event()
+        resume = threading.Event()
+        finished = []
+
+        def work():
+            started.set()
+            resume.wait()
+            finished.append(True)
+
+        async def main():
+            task = asyncio.ensure_future(aio.run(work, executor=self.executor))
+            while not started.is_set():
+                await asyncio.sleep(0.001)
+            task.cancel()
+            await asyncio.sleep(0.001)
+            task.cancel()
+            await asyncio.sleep(0.001)
+            later = asyncio.ensure_future(aio.run(lambda: list(finished), executor=self.executor))
+            asyncio.get_running_loop().call_later(0.01, resume.set)
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            # Only started once the cancelled work had stopped
+            self.assertEqual([True], await later)
+
+        aio.set_concurrency_limit(1)
+        try:
+            asyncio.run(main())
+        finally:
+            resume.set()
+
+    def test_cancelled_save_keeps_file(self):
+        new_filename = os.path.join(self.temp_dir, 'saved.twb')
+        wb = Workbook(TABLEAU_10_TWB)
+        started = threading.Event()
+        resume = threading.Event()
+
+        def save():
+            started.set()
+            resume.wait()
+            wb.save_as(new_filename)
+
+        async def main():
+            task = asyncio.ensure_future(aio.run(save, executor=self.executor))
+            while not started.is_set():
+                await asyncio.sleep(0.001)
+            task.cancel()
+            asyncio.get_running_loop().call_later(0.01, resume.set)
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(main())
+        self.assertEqual([], os.listdir(self.temp_dir))
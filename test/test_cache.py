@@ -0,0 +1,151 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from test.assets.index import *
+from tableaudocumentapi import cache as cache_module
+from tableaudocumentapi.cache import SummaryCache
+from tableaudocumentapi.scanner import scan, summarize_file
+
+ASSETS = [TABLEAU_10_TWB, TABLEAU_10_TWBX, TABLEAU_10_TDS, TWBX_WITH_CACHE_FILES]
+
+
+class SummaryCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp('tda-cache')
+        self.cache_file = os.path.join(self.temp_dir, 'summaries.db')
+        self.filenames = [self.copy_asset(x) for x in ASSETS]
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def copy_asset(self, filename, new_name=None):
+        new_filename = os.path.join(self.temp_dir, new_name or os.path.basename(filename))
+        shutil.copy(filename, new_filename)
+        return new_filename
+
+    def test_cached_summaries_match_scanned_ones(self):
+        with SummaryCache(self.cache_file) as cache:
+            for filename in self.filenames:
+                self.assertIsNone(cache.get(filename))
+                cache.put(filename, summarize_file(filename))
+
+        with SummaryCache(self.cache_file) as cache:
+            for filename in self.filenames:
+                self.assertEqual(summarize_file(filename), cache.get(filename))
+            self.assertEqual((len(self.filenames), 0), (cache.hits, cache.misses))
+
+    def test_summarize_file_uses_cache(self):
+        filename = self.filenames[0]
+        with SummaryCache(self.cache_file) as cache:
+            expected = summarize_file(filename, cache)
+            self.assertEqual(expected, summarize_file(filename, cache))
+            self.assertEqual((1, 1), (cache.hits, cache.misses))
+
+    def test_changed_files_are_rescanned(self):
+        touched, changed = self.filenames[0], self.filenames[2]
+        with SummaryCache(self.cache_file) as cache:
+            for filename in (touched, changed):
+                summarize_file(filename, cache)
+
+            # Only the modification time changes, so the content hash still matches
+            os.utime(touched, ns=(0, 0))
+            self.assertIsNotNone(cache.get(touched))
+
+            with open(changed, 'rb') as f:
+                data = f.read()
+            with open(changed, 'wb') as f:
+                f.write(data.replace(b'mysql55', b'newserver'))
+            self.assertIsNone(cache.get(changed))
+            self.assertEqual('newserver', summarize_file(changed, cache).datasources[0].connections[0].server)
+
+    def test_copies_share_a_summary(self):
+        with SummaryCache(self.cache_file) as cache:
+            summarize_file(self.filenames[1], cache)
+            copy = self.copy_asset(self.filenames[1], 'copy.twbx')
+            # A new path isn't hashed by get, only after it is scanned
+            self.assertIsNone(cache.get(copy))
+            summarize_file(copy, cache)
+            self.assertEqual(copy, cache.get(copy).filename)
+            self.assertEqual(1, cache._db.execute('SELECT COUNT(*) FROM summaries').fetchone()[0])
+
+    def test_new_files_are_not_hashed_by_get(self):
+        with mock.patch.object(cache_module, '_content_digest', side_effect=AssertionError), \
+                SummaryCache(self.cache_file) as cache:
+            self.assertIsNone(cache.get(self.filenames[0]))
+            cache.put(self.filenames[0], summarize_file(self.filenames[0]), 'digest')
+            self.assertIsNotNone(cache.get(self.filenames[0]))
+
+    def test_errors_are_not_cached(self):
+        filename = self.copy_asset(BAD_ZIP_FILE)
+        with SummaryCache(self.cache_file) as cache:
+            self.assertIsNotNone(summarize_file(filename, cache).error)
+            self.assertEqual({}, cache._pending)
+            self.assertIsNone(cache.get(filename))
+
+    def test_least_recently_used_summaries_are_evicted(self):
+        summaries = [summarize_file(x) for x in self.filenames]
+        sizes = [len(cache_module._encode_summary(x)) for x in summaries]
+
+        # Room for all but the second summary, which is the least recently used when the last is added
+        with SummaryCache(self.cache_file, max_bytes=sum(sizes) - sizes[1]) as cache:
+            for filename, summary in zip(self.filenames[:3], summaries):
+                cache.put(filename, summary)
+            cache.get(self.filenames[0])
+            cache.put(self.filenames[3], summaries[3])
+
+            self.assertEqual([True, False, True, True], [cache.get(x) is not None for x in self.filenames])
+
+    def test_new_format_version_empties_cache(self):
+        with SummaryCache(self.cache_file) as cache:
+            summarize_file(self.filenames[0], cache)
+
+        version = cache_module.CACHE_FORMAT_VERSION
+        cache_module.CACHE_FORMAT_VERSION = version + 1
+        try:
+            with SummaryCache(self.cache_file) as cache:
+                self.assertIsNone(cache.get(self.filenames[0]))
+        finally:
+            cache_module.CACHE_FORMAT_VERSION = version
+
+    def test_new_library_version_empties_cache(self):
+        with mock.patch('importlib.metadata.version', return_value='0.11'):
+            with SummaryCache(self.cache_file) as cache:
+                summarize_file(self.filenames[0], cache)
+            with SummaryCache(self.cache_file) as cache:
+                self.assertIsNotNone(cache.get(self.filenames[0]))
+        with mock.patch('importlib.metadata.version', return_value='0.12'):
+            with SummaryCache(self.cache_file) as cache:
+                self.assertIsNone(cache.get(self.filenames[0]))
+
+    def test_scan_with_cache(self):
+        missing = os.path.join(self.temp_dir, 'missing.twb')
+        with SummaryCache(self.cache_file) as cache:
+            first = {x.filename: x for x in scan(self.filenames + [missing], workers=2, cache=cache)}
+            second = {x.filename: x for x in scan(self.filenames + [missing], workers=2, cache=cache)}
+            self.assertEqual(len(self.filenames), cache.hits)
+
+        self.assertEqual(first, second)
+        self.assertIsNotNone(second[missing].error)
+        self.assertEqual(summarize_file(self.filenames[1]), second[self.filenames[1]])
+
+    def test_warm_scan_is_lazy(self):
+        with SummaryCache(self.cache_file) as cache:
+            for filename in self.filenames:
+                summarize_file(filename, cache)
+
+            consumed = []
+
+            def paths():
+                for filename in self.filenames * 10:
+                    consumed.append(filename)
+                    yield filename
+
+            with mock.patch('concurrent.futures.ProcessPoolExecutor', side_effect=AssertionError):
+                results = scan(paths(), workers=1, max_in_flight=2, cache=cache)
+                self.assertEqual(self.filenames[0], next(results).filename)
+                self.assertEqual(1, len(consumed))
+                self.assertEqual(len(self.filenames) * 10 - 1, len(list(results)))
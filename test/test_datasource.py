@@ -1,3 +1,4 @@
+import copy
 import os
 import os.path
 import shutil
@@ -5,7 +6,7 @@ import tempfile
 import unittest
 
 
-from tableaudocumentapi import Datasource, Workbook
+from tableaudocumentapi import Datasource, Field, Workbook
 
 TEST_ASSET_DIR = os.path.join(
     os.path.dirname(__file__),
@@ -53,6 +54,9 @@ class DataSourceFieldsTDS(unittest.TestCase):
     def test_datasource_column_name_contains_apostrophy(self):
         self.assertIsNotNone(self.ds.fields.get("[Today's Date]", None))
 
+    def test_datasource_column_name_contains_apostrophy_uses_metadata_record(self):
+        self.assertEqual('Count', self.ds.fields["[Today's Date]"].default_aggregation)
+
     def test_datasource_field_can_get_caption(self):
         self.assertEqual(self.ds.fields['[a]'].caption, 'A')
         self.assertEqual(getattr(self.ds.fields['[a]'], 'caption', None), 'A')
@@ -80,6 +84,46 @@ class DataSourceFieldsTDS(unittest.TestCase):
         self.assertIsNotNone(actual)
         self.assertTrue(u'muted gray' in actual)
 
+    def test_datasource_field_lookup_follows_caption_change(self):
+        field = self.ds.fields['A']
+        field.caption = 'New A'
+        self.assertIs(field, self.ds.fields['New A'])
+        self.assertIsNone(self.ds.fields.get('A', None))
+
+    def test_datasource_fields_find_by_role(self):
+        measures = self.ds.fields.find_by('role', 'measure')
+        self.assertEqual({x.id for x in self.ds.fields.values() if x.role == 'measure'}, {x.id for x in measures})
+        self.assertIn(self.ds.fields['[x]'], measures)
+
+        self.ds.fields['[x]'].role = 'dimension'
+        self.assertNotIn(self.ds.fields['[x]'], self.ds.fields.find_by('role', 'measure'))
+        self.assertIn(self.ds.fields['[x]'], self.ds.fields.find_by('role', 'dimension'))
+
+    def test_datasource_removed_field_is_not_indexed(self):
+        field = self.ds.fields['[y]']
+        self.ds.remove_field(field)
+        field.role = 'dimension'
+        self.assertNotIn(field, self.ds.fields.find_by('role', 'dimension'))
+
+    def test_datasource_replaced_field_is_not_indexed(self):
+        old_field = self.ds.fields['[y]']
+        new_field = Field.from_column_xml(copy.deepcopy(old_field.xml))
+        self.ds.fields['[y]'] = new_field
+        old_field.role = 'dimension'
+        self.assertIs(self.ds.fields['[y]'], new_field)
+        self.assertIn(new_field, self.ds.fields.find_by('role', 'measure'))
+        self.assertNotIn(new_field, self.ds.fields.find_by('role', 'dimension'))
+
+    def test_datasource_repeated_metadata_record_last_wins(self):
+        with open(TEST_TDS_FILE, encoding='utf-8') as f:
+            text = f.read()
+        duplicate = ("<metadata-record class='column'><remote-name>z</remote-name><local-name>[z]</local-name>"
+                     "<local-type>real</local-type></metadata-record></metadata-records>")
+        path = self.get_temp_file('repeated.tds')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text.replace('</metadata-records>', duplicate))
+        self.assertEqual(Datasource.from_file(path).fields['[z]'].datatype, 'real')
+
     def test_datasource_caption(self):
         actual = self.ds.caption
         self.assertIsNotNone(actual)
@@ -157,6 +201,11 @@ class DataSourceFieldsFoundIn(unittest.TestCase):
         self.assertIn('X', (x.name for x in actual_values))
         self.assertNotIn('Y', (x.name for x in actual_values))
 
+    def test_datasource_fields_found_in_follows_new_usage(self):
+        self.ds.fields['[y]'].add_used_in('Sheet 1')
+        actual_values = self.ds.fields.used_by_sheet('Sheet 1')
+        self.assertEqual({'A', 'Y'}, {x.name for x in actual_values})
+
     def test_datasource_fields_found_in_accepts_lists(self):
         actual_values = self.ds.fields.used_by_sheet(['Sheet 1', 'Sheet 2'])
         self.assertIsNotNone(actual_values)
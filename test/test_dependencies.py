@@ -0,0 +1,91 @@
+import unittest
+
+from test.assets.index import *
+from tableaudocumentapi import Workbook
+from tableaudocumentapi.references import Reference, formula_references
+
+DATASOURCE_TWB_FILE = os.path.join(TEST_DIR, 'datasource_test.twb')
+
+
+def _add_calculation(datasource, formula):
+    return datasource.add_calculation('Calc', formula, 'integer', 'measure', 'quantitative', 'false')
+
+
+class FormulaReferences(unittest.TestCase):
+
+    def test_references(self):
+        formula = 'IF [a] > 0 THEN [Parameters].[Rate 1] ELSE LEN("[b]") + [c]]d] END // [e]\n+ [a]'
+        self.assertEqual([Reference(None, '[a]'), Reference('Parameters', '[Rate 1]'),
+                          Reference(None, '[c]]d]'), Reference(None, '[a]')],
+                         formula_references(formula))
+
+
+class Dependencies(unittest.TestCase):
+
+    def setUp(self):
+        self.datasource = Workbook(DATASOURCE_TWB_FILE).datasources[0]
+        self.total = _add_calculation(self.datasource, '[x] + [y]')
+        self.double = _add_calculation(self.datasource, '{} * 2'.format(self.total.id))
+
+    def node(self, field):
+        return ('datasource_test', field if isinstance(field, str) else field.id)
+
+    def test_upstream_and_downstream(self):
+        graph = self.datasource.dependencies
+        self.assertEqual([self.node(self.total), self.node(self.double)], graph.downstream(self.node('[x]')))
+        self.assertEqual([self.node(self.total)], graph.downstream(self.node('[x]'), transitive=False))
+        self.assertEqual([self.node(self.total), self.node('[x]'), self.node('[y]')],
+                         graph.upstream(self.node(self.double)))
+        self.assertEqual([], graph.upstream(self.node('[x]')))
+        self.assertEqual([self.node(self.total), self.node(self.double)], graph.calculations)
+
+    def test_graph_follows_changes(self):
+        graph = self.datasource.dependencies
+        self.total.calculation = '[a]'
+        self.assertEqual([], graph.downstream(self.node('[x]')))
+        self.assertEqual([self.node(self.total), self.node('[a]')], graph.upstream(self.node(self.double)))
+
+        added = _add_calculation(self.datasource, '[a] + 1')
+        # Nearest first
+        self.assertEqual([self.node(self.total), self.node(added), self.node(self.double)],
+                         graph.downstream(self.node('[a]')))
+
+        self.datasource.remove_field(self.double)
+        self.assertEqual([], graph.downstream(self.node(self.total)))
+
+    def test_graph_follows_renames(self):
+        self.datasource.dependencies
+        self.datasource.rename_fields({'[x]': '[Sales]'})
+        self.assertEqual([self.node(self.total), self.node(self.double)],
+                         self.datasource.dependencies.downstream(self.node('[Sales]')))
+
+
+class WorkbookDependencies(unittest.TestCase):
+
+    def test_references_between_datasources(self):
+        wb = Workbook(TWBX_WITH_CACHE_FILES)
+        datasource = wb.datasources[1]
+        calculation = _add_calculation(datasource, '[Sales Target] * [Parameters].[Commission Rate]')
+
+        graph = wb.dependencies
+        self.assertIs(graph, datasource.dependencies)
+        self.assertEqual([(datasource.name, calculation.id)], graph.downstream(('Parameters', '[Commission Rate]')))
+
+        calculation.calculation = '[Sales Target] * [Parameters].[Base Salary]'
+        self.assertEqual([], graph.downstream(('Parameters', '[Commission Rate]')))
+        self.assertEqual([(datasource.name, calculation.id)], graph.downstream(('Parameters', '[Base Salary]')))
+
+    def test_rename_through_datasource(self):
+        wb = Workbook(DATASOURCE_TWB_FILE)
+        datasource = wb.datasources[0]
+        total = _add_calculation(datasource, '[x] + [y]')
+        wb.dependencies
+        datasource.rename_fields({'[x]': '[Sales]'})
+
+        graph = wb.dependencies
+        self.assertIs(graph, datasource.dependencies)
+        self.assertEqual([(datasource.name, total.id)], graph.downstream((datasource.name, '[Sales]')))
+        self.assertEqual([], graph.downstream((datasource.name, '[x]')))
+
+        datasource.fields[total.id].calculation = '[y]'
+        self.assertEqual([], graph.downstream((datasource.name, '[Sales]')))
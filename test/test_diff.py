@@ -0,0 +1,80 @@
+import unittest
+
+from test.assets.index import *
+from tableaudocumentapi import Datasource, Workbook
+from tableaudocumentapi.diff import Change, diff
+
+DATASOURCE_TWB_FILE = os.path.join(TEST_DIR, 'datasource_test.twb')
+PATH = ('datasource', 'datasource_test')
+
+
+class Diff(unittest.TestCase):
+
+    def setUp(self):
+        with open(DATASOURCE_TWB_FILE, 'rb') as f:
+            self.data = f.read()
+
+    def edited(self, *replacements):
+        data = self.data
+        for old, new in replacements:
+            self.assertIn(old, data)
+            data = data.replace(old, new, 1)
+        return Workbook(data)
+
+    def test_identical_documents(self):
+        self.assertEqual([], diff(Workbook(self.data), Workbook(DATASOURCE_TWB_FILE)))
+        self.assertEqual([], diff(Datasource.from_file(TABLEAU_10_TDS), Datasource.from_file(TABLEAU_10_TDS)))
+
+    def test_changed_properties(self):
+        new = Workbook(self.data)
+        datasource = new.datasources[0]
+        datasource.connections[0].server = 'newserver'
+        datasource.fields['[x]'].calculation = '[y] * 2'
+        datasource.fields['[y]'].caption = 'Why'
+
+        self.assertEqual([
+            Change('changed', PATH + ('connection', 0), 'server', 'postgres91.test.tsi.lan', 'newserver'),
+            Change('changed', PATH + ('field', '[x]'), 'calculation', None, '[y] * 2'),
+            Change('changed', PATH + ('field', '[y]'), 'caption', 'Y', 'Why'),
+        ], diff(Workbook(self.data), new))
+
+    def test_metadata_changes(self):
+        new = self.edited((b'<aggregation>Count</aggregation>', b'<aggregation>Sum</aggregation>'))
+        self.assertEqual([Change('changed', PATH + ('field', '[a]'), 'default_aggregation', 'Count', 'Sum')],
+                         diff(Workbook(self.data), new))
+
+    def test_added_and_removed_fields(self):
+        new = Workbook(self.data)
+        added = new.datasources[0].add_field('[z]', 'string', 'dimension', 'nominal', 'Z', 'false')
+
+        changes = diff(Workbook(self.data), new)
+        self.assertEqual([('added', PATH + ('field', '[z]'))], [(x.change, x.path) for x in changes])
+        self.assertIs(added, changes[0].new)
+
+        changes = diff(new, Workbook(self.data))
+        self.assertEqual([('removed', PATH + ('field', '[z]'))], [(x.change, x.path) for x in changes])
+        self.assertIs(added, changes[0].old)
+
+    def test_worksheet_dependencies(self):
+        new = self.edited((b"<worksheet name='Sheet 1'>", b"<worksheet name='Sheet 3'>"))
+        self.assertEqual([('removed', ('worksheet', 'Sheet 1')), ('added', ('worksheet', 'Sheet 3'))],
+                         [(x.change, x.path) for x in diff(Workbook(self.data), new)])
+
+        new = self.edited((b"\r\n            <column caption='X' datatype='integer' name='[x]' role='measure' "
+                           b"type='quantitative' />", b''))
+        self.assertEqual(
+            [Change('changed', ('worksheet', 'Sheet 2'), 'dependencies', [('datasource_test', '[x]')], [])],
+            diff(Workbook(self.data), new))
+
+    def test_unmodelled_changes(self):
+        new = self.edited((b"table='[public].[xy]'", b"table='[public].[xz]'"))
+        self.assertEqual([Change('changed', PATH, None, None, None)], diff(Workbook(self.data), new))
+
+    def test_datasources(self):
+        old = Datasource.from_file(TABLEAU_10_TDS)
+        new = Datasource.from_file(TABLEAU_10_TDS)
+        new.caption = 'Renamed'
+        self.assertEqual(['caption'], [x.attribute for x in diff(old, new)])
+
+        with self.assertRaises(TypeError):
+            diff(old, Workbook(self.data))
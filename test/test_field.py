@@ -37,3 +37,29 @@ class FieldsHandleUnicode(unittest.TestCase):
     def test_description_unicode(self):
         ds = Datasource.from_file(TEST_UNICODE_FILE)
         self.assertIsNotNone(ds.fields['A'].description)
+
+
+class FieldsAreCompact(unittest.TestCase):
+    def setUp(self):
+        self.ds = Datasource.from_file(TEST_TDS_FILE)
+
+    def test_field_has_no_instance_dict(self):
+        self.assertFalse(hasattr(self.ds.fields['[x]'], '__dict__'))
+
+    def test_repeated_values_are_shared(self):
+        self.assertIs(self.ds.fields['[x]'].datatype, self.ds.fields['[Number of Records]'].datatype)
+        self.assertIs(self.ds.fields['[x]'].role, self.ds.fields['[y]'].role)
+
+    def test_unused_field_has_no_worksheets(self):
+        field = self.ds.fields['[x]']
+        self.assertEqual([], field.worksheets)
+        field.add_used_in('Sheet 1')
+        self.assertEqual(['Sheet 1'], field.worksheets)
+
+    def test_metadata_only_field_has_all_attributes(self):
+        field = Field.from_metadata_xml(self.ds._datasourceXML.find(".//metadata-record[@class='column']"))
+        self.assertEqual('[a]', field.id)
+        self.assertEqual('string', field.datatype)
+        self.assertEqual('Count', field.default_aggregation)
+        self.assertIsNone(field.caption)
+        self.assertIsNone(field.calculation)
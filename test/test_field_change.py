@@ -18,6 +18,10 @@ TEST_TDS_FILE_OUTPUT = os.path.join(
     'field_change_test_output.tds'
 )
 
+# Everything a Field reads from its XML
+FIELD_PROPERTIES = ('id', 'name', 'caption', 'alias', 'datatype', 'hidden', 'role', 'type', 'aliases',
+                    'calculation', 'default_aggregation', 'description')
+
 MESSAGES = {
     'test_change_values1': 'Value has not changed when altering values for {}.',
     'test_change_values2': 'XML-Structure has not changed when altering values for {}.',
@@ -49,6 +53,10 @@ ALIASES = {
 }
 
 
+def _field_state(field):
+    return {x: getattr(field, x) for x in FIELD_PROPERTIES}
+
+
 class TestFieldChange(unittest.TestCase):
 
     def setUp(self):
@@ -198,6 +206,56 @@ class TestFieldChange(unittest.TestCase):
         self.tds.remove_field(calc)
         self.assertEqual(len(self.tds.calculations), original_len)
 
+    def test_add_field_keeps_existing_fields(self):
+        """ Test if adding a field updates the fields in place instead of rebuilding them.
+        """
+        amount = self.tds.fields['[amount]']
+        field = self.tds.add_field('[new]', 'integer', 'measure', 'quantitative', 'New Field', 'false')
+        self.assertIs(self.tds.fields['[amount]'], amount)
+        self.assertIs(self.tds.fields['New Field'], field)
+
+    def test_add_fields(self):
+        """ Test if many fields can be added at once.
+        """
+        original_len = len(self.tds.fields)
+        new_fields = self.tds.add_fields(
+            dict(name='[new{}]'.format(i), datatype='integer', role='measure', field_type='quantitative',
+                 caption=None, hidden='false') for i in range(10))
+        self.assertEqual(len(new_fields), 10)
+        self.assertEqual(len(self.tds.fields), original_len + 10)
+        self.assertIs(self.tds.fields['New3'], new_fields[3])
+
+    def test_add_calculations(self):
+        """ Test if many calculations can be added at once.
+        """
+        original_len = len(self.tds.calculations)
+        new_calcs = self.tds.add_calculations(
+            dict(caption='Calc{}'.format(i), formula='{} * 2'.format(i), datatype='integer', role='measure',
+                 type='quantitative', hidden='false') for i in range(5))
+        self.assertEqual(len(self.tds.calculations), original_len + 5)
+        self.assertEqual(self.tds.fields['Calc4'].calculation, '4 * 2')
+        self.assertEqual([x.caption for x in new_calcs], ['Calc{}'.format(i) for i in range(5)])
+
+    def test_remove_field_reveals_metadata_record(self):
+        """ Test if removing a column falls back to its metadata-record, like a full rebuild does.
+        """
+        self.tds.remove_field(self.tds.fields['The Amount'])
+        self.assertIsNone(self.tds.fields.get('The Amount', None))
+        self.assertIsNone(self.tds.fields['[amount]'].caption)
+
+    def test_mutations_match_rebuilt_fields(self):
+        """ Test if the incrementally maintained fields match the ones built from the XML.
+        """
+        self.tds.add_calculation('TestCalc', '12*34', 'integer', 'measure', 'quantitative', 'False')
+        self.tds.add_field('[new]', 'integer', 'measure', 'quantitative', 'New Field', 'false')
+        self.tds.remove_field(self.tds.fields['The Name'])
+        # Takes properties from the metadata-record left behind by the removed column
+        self.tds.add_field('[name]', 'string', 'dimension', 'nominal', 'New Name', 'false')
+        incremental = {k: _field_state(v) for k, v in self.tds.fields.items()}
+
+        self.tds._refresh_fields()
+        self.assertEqual(incremental, {k: _field_state(v) for k, v in self.tds.fields.items()})
+
     def tearDown(self):
         """ Test if the file can be saved.
         Output file will be ignored by git, but can be used to verify the results.
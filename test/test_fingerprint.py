@@ -0,0 +1,68 @@
+import copy
+import unittest
+from lxml import etree as ET
+
+from test.assets.index import *
+from tableaudocumentapi import Datasource, Workbook
+from tableaudocumentapi.fingerprint import fingerprints
+from tableaudocumentapi.scanner import scan_file
+
+
+class Fingerprints(unittest.TestCase):
+
+    def setUp(self):
+        self.original = Workbook(TWBX_WITH_CACHE_FILES).datasources[1]
+        self.copy = Datasource(copy.deepcopy(self.original._datasourceXML))
+
+    def test_copies_match(self):
+        root = self.copy._datasourceXML
+        root.set('name', 'federated.renamed')
+        ET.SubElement(root, 'repository-location', id='published', path='/datasources')
+        # Reverse the order of the children and the attributes of every element
+        for element in list(root.iter()):
+            element[:] = reversed(list(element))
+            attributes = list(element.items())
+            element.attrib.clear()
+            for key, value in reversed(attributes):
+                element.set(key, value)
+
+        self.assertEqual(fingerprints(self.original), fingerprints(Datasource(root)))
+        self.assertEqual(self.original.fingerprint(), self.copy.fingerprint())
+
+    def test_changes_are_seen_where_they_are_made(self):
+        field_id = next(x for x in self.copy.fields if self.copy.fields[x].xml.tag == 'column')
+        self.copy.fields[field_id].calculation = '1 + 1'
+        original, changed = fingerprints(self.original), fingerprints(self.copy)
+
+        self.assertNotEqual(original.datasource, changed.datasource)
+        self.assertEqual(original.connections, changed.connections)
+        self.assertEqual([field_id], [x for x in original.fields if original.fields[x] != changed.fields[x]])
+
+        self.copy.connections[0].server = 'newserver'
+        self.assertNotEqual(original.connections, fingerprints(self.copy).connections)
+
+    def test_every_connection_and_field_has_one(self):
+        result = fingerprints(self.original)
+        self.assertEqual(len(self.original.connections), len(result.connections))
+        self.assertEqual(set(self.original.fields), set(result.fields))
+        self.assertEqual(32, len(result.datasource))
+
+    def test_scanned_records_have_fingerprints(self):
+        records = [x for x in scan_file(TWBX_WITH_CACHE_FILES) if x.name == self.original.name]
+        self.assertEqual([self.original.fingerprint()], [x.fingerprint for x in records])
+
+    def test_repeated_metadata_records_match_fields(self):
+        datasource = Datasource.from_file(os.path.join(TEST_DIR, 'datasource_test.tds'))
+        records = {x.findtext('local-name'): x for x in datasource._get_metadata_records()}
+        original = fingerprints(datasource)
+        for name in ('[a]', '[z]'):
+            repeated = copy.deepcopy(records[name])
+            ET.SubElement(repeated, 'width').text = '1'
+            records[name].addnext(repeated)
+
+        # The column [a] keeps the first record, the metadata-only field [z] takes the last one
+        result = fingerprints(datasource)
+        self.assertEqual(original.fields['[a]'], result.fields['[a]'])
+        records['[z]'].getparent().remove(records['[z]'])
+        self.assertEqual(fingerprints(datasource).fields['[z]'], result.fields['[z]'])
+        self.assertNotEqual(original.fields['[z]'], result.fields['[z]'])
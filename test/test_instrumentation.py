@@ -0,0 +1,70 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from test.assets.index import *
+from tableaudocumentapi import Workbook, instrumentation
+
+
+def spans_by_name(spans):
+    return {x.name: x for x in spans}
+
+
+class Instrumentation(unittest.TestCase):
+
+    def setUp(self):
+        self.spans = []
+        self.temp_dir = tempfile.mkdtemp('tda-instrumentation')
+
+    def tearDown(self):
+        instrumentation.set_callback(None)
+        shutil.rmtree(self.temp_dir)
+
+    def test_disabled_by_default(self):
+        self.assertFalse(instrumentation.enabled())
+        with instrumentation.span('unused'):
+            instrumentation.count('unused')
+
+    def test_open_and_save_emit_spans(self):
+        with instrumentation.instrumented(self.spans.append):
+            wb = Workbook(TWBX_WITH_CACHE_FILES)
+            wb.save_as(os.path.join(self.temp_dir, 'saved.twbx'))
+        self.assertFalse(instrumentation.enabled())
+
+        spans = spans_by_name(self.spans)
+        for name in ('xml_open', 'xml_open.detect_archive', 'xml_open.parse', 'workbook.prepare_datasources',
+                     'workbook.prepare_worksheet_index', 'workbook.prepare_worksheets',
+                     'datasource.get_all_fields', 'save_file', 'save_file.write_document'):
+            self.assertIn(name, spans)
+            self.assertGreaterEqual(spans[name].seconds, 0)
+
+        self.assertEqual('xml_open', spans['xml_open.parse'].parent)
+        self.assertEqual('workbook.prepare_worksheets', spans['datasource.get_all_fields'].parent)
+        self.assertGreater(spans['xml_open'].counters['elements'], 0)
+        # Counters of inner spans are included in the outer ones
+        self.assertEqual(spans['xml_open.parse'].counters['bytes_read'], spans['xml_open'].counters['bytes_read'])
+        self.assertGreater(spans['save_file'].counters['members_copied'], 0)
+        self.assertEqual(os.path.getsize(os.path.join(self.temp_dir, 'saved.twbx')),
+                         spans['save_file'].counters['bytes_written'])
+
+    def test_counts_outside_spans_are_ignored(self):
+        instrumentation.set_callback(self.spans.append)
+        instrumentation.count('orphan')
+        with instrumentation.span('outer'):
+            instrumentation.count('visited', 2)
+            with instrumentation.span('inner'):
+                instrumentation.count('visited')
+
+        self.assertEqual([('inner', 'outer', {'visited': 1}), ('outer', None, {'visited': 3})],
+                         [(x.name, x.parent, x.counters) for x in self.spans])
+
+    def test_spans_nest_per_thread(self):
+        instrumentation.set_callback(self.spans.append)
+        with instrumentation.span('main'):
+            thread = threading.Thread(target=Workbook, args=(TABLEAU_10_TWB,))
+            thread.start()
+            thread.join()
+
+        self.assertIsNone(spans_by_name(self.spans)['xml_open'].parent)
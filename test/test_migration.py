@@ -0,0 +1,71 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from test.assets.index import *
+from tableaudocumentapi import Datasource, Workbook
+from tableaudocumentapi.migration import apply_rules, rewrite_connections, rewrite_file
+
+RULES = [
+    ({'server': 'mssql2012.test.tsi.lan', 'dbname': 'TestV1'}, {'server': 'newserver', 'port': '1444'}),
+    ({'dbclass': 'mysql'}, {'dbname': 'newdb'}),
+]
+
+
+class RewriteConnections(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp('tda-migration')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def copy_asset(self, filename):
+        new_filename = os.path.join(self.temp_dir, os.path.basename(filename))
+        shutil.copy(filename, new_filename)
+        return new_filename
+
+    def test_apply_rules_uses_first_matching_rule(self):
+        wb = Workbook(TABLEAU_10_TWB)
+        connections = wb.datasources[0].connections
+        self.assertEqual((2, 2), apply_rules(connections, RULES))
+        self.assertEqual(('mysql55.test.tsi.lan', 'newdb'), (connections[0].server, connections[0].dbname))
+        self.assertEqual(('newserver', '1444'), (connections[1].server, connections[1].port))
+
+        # Applying the rules again matches the mysql connection but changes nothing
+        self.assertEqual((1, 0), apply_rules(connections, RULES))
+
+    def test_bad_rules_raise(self):
+        with self.assertRaises(ValueError):
+            apply_rules([], [({'hostname': 'a'}, {'server': 'b'})])
+        with self.assertRaises(ValueError):
+            rewrite_connections([], [({'server': 'a'}, {'authentication': 'b'})])
+
+    def test_rewrite_file_saves_changes(self):
+        filename = self.copy_asset(TABLEAU_10_TDSX)
+        result = rewrite_file(filename, RULES)
+
+        self.assertEqual((1, 1, True, None), (result.connections_matched, result.connections_changed,
+                                              result.saved, result.error))
+        self.assertEqual('newserver', Datasource.from_file(filename).connections[0].server)
+
+    def test_rewrite_file_skips_unchanged_files(self):
+        filename = self.copy_asset(MULTI_CONNECTION_10)
+        before = os.stat(filename).st_mtime_ns
+        result = rewrite_file(filename, [({'server': 'nowhere'}, {'server': 'newserver'})])
+
+        self.assertFalse(result.saved)
+        self.assertEqual(before, os.stat(filename).st_mtime_ns)
+
+    def test_rewrite_connections_across_files(self):
+        assets = (TABLEAU_93_TWB, TABLEAU_10_TWB, TABLEAU_10_TWBX, TABLEAU_10_TDS, MULTI_CONNECTION_10, BAD_ZIP_FILE)
+        filenames = [self.copy_asset(x) for x in assets]
+        results = {x.filename: x for x in rewrite_connections(filenames, RULES, workers=2)}
+
+        self.assertEqual(set(filenames), set(results))
+        self.assertEqual(2, results[filenames[1]].connections_changed)
+        self.assertEqual(1, results[filenames[3]].connections_changed)
+        self.assertIsNotNone(results[filenames[-1]].error)
+        self.assertEqual('newserver', Workbook(filenames[2]).datasources[0].connections[0].server)
+        self.assertEqual('newdb', Datasource.from_file(filenames[3]).connections[0].dbname)
@@ -78,3 +78,52 @@ class MLDTests(unittest.TestCase):
     def test_multilookupdict_can_set_with_alias(self):
         self.mld['bar'] = 2
         self.assertEqual(2, self.mld['[foo]'])
+
+    def test_multilookupdict_can_delete_item(self):
+        del self.mld['baz']
+        self.assertNotIn('[foo]', self.mld)
+        self.assertIsNone(self.mld.get('bar', None))
+        self.assertIsNone(self.mld.get('baz', None))
+
+    def test_multilookupdict_indexes_new_item(self):
+        self.mld['[wakka]'] = {'caption': 'wakka caption', 'value': 5}
+        self.assertEqual(5, self.mld['wakka caption']['value'])
+
+    def test_multilookupdict_shared_caption_falls_back_after_delete(self):
+        self.mld['[qux]'] = {'caption': 'foo', 'value': 6}
+        self.assertEqual(6, self.mld['foo']['value'])
+        del self.mld['[qux]']
+        self.assertEqual(2, self.mld['foo']['value'])
+
+    def test_multilookupdict_pop(self):
+        self.assertEqual(1, self.mld.pop('bar')['value'])
+        self.assertIsNone(self.mld.get('baz', None))
+        self.assertEqual('missing', self.mld.pop('bar', 'missing'))
+
+    def test_multilookupdict_setdefault(self):
+        self.assertEqual(1, self.mld.setdefault('bar', {'value': 7})['value'])
+        self.assertEqual(7, self.mld.setdefault('[qux]', {'caption': 'qux caption', 'value': 7})['value'])
+        self.assertEqual(7, self.mld['qux caption']['value'])
+
+    def test_multilookupdict_popitem(self):
+        self.mld['[qux]'] = {'caption': 'qux caption', 'value': 7}
+        key, value = self.mld.popitem()
+        self.assertEqual(('[qux]', 7), (key, value['value']))
+        self.assertIsNone(self.mld.get('qux caption', None))
+        self.mld.clear()
+        self.assertEqual([], self.mld.find_by('caption', 'foo'))
+        self.assertRaises(KeyError, self.mld.popitem)
+
+    def test_multilookupdict_find_by_registered_index(self):
+        self.mld.register_index('value')
+        self.assertEqual([self.mld['[bar]']], self.mld.find_by('value', 2))
+        self.mld['[qux]'] = {'value': 2}
+        self.assertEqual([2, 2], [x['value'] for x in self.mld.find_by('value', 2)])
+        del self.mld['[bar]']
+        self.assertEqual([{'value': 2}], self.mld.find_by('value', 2))
+
+    def test_multilookupdict_find_by_multi_valued_index(self):
+        self.mld['[qux]'] = {'sheets': ['one', 'two']}
+        self.mld.register_index('sheets', multi_valued=True)
+        self.assertEqual([self.mld['[qux]']], self.mld.find_by('sheets', 'two'))
+        self.assertEqual([], self.mld.find_by('sheets', 'three'))
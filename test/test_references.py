@@ -0,0 +1,78 @@
+import unittest
+from lxml import etree as ET
+
+from test.assets.index import *
+from tableaudocumentapi import Datasource, Workbook
+from tableaudocumentapi.references import rewrite_references
+
+DATASOURCE_TWB_FILE = os.path.join(TEST_DIR, 'datasource_test.twb')
+
+
+class RenameFields(unittest.TestCase):
+
+    def setUp(self):
+        self.wb = Workbook(DATASOURCE_TWB_FILE)
+        self.datasource = self.wb.datasources[0]
+
+    def test_worksheets_follow_renames(self):
+        self.wb.rename_fields('datasource_test', {'[a]': '[Region]', '[x]': '[Sales]'}, {'[x]': 'Sales'})
+
+        sheet = self.wb.get_worksheet('Sheet 2').xml
+        self.assertEqual(['[Region]', '[Sales]'], [x.get('name') for x in sheet.iter('column')])
+        self.assertEqual('Sales', sheet.find('.//column[@name="[Sales]"]').get('caption'))
+        self.assertEqual([('[Region]', '[none:Region:nk]'), ('[Sales]', '[sum:Sales:qk]')],
+                         [(x.get('column'), x.get('name')) for x in sheet.iter('column-instance')])
+        self.assertEqual('[datasource_test].[none:Region:nk]', sheet.findtext('.//rows'))
+        self.assertEqual('[datasource_test].[sum:Sales:qk]', sheet.findtext('.//cols'))
+        self.assertEqual([('datasource_test', '[Region]'), ('datasource_test', '[Sales]')],
+                         self.wb.get_worksheet('Sheet 2').dependencies)
+        self.assertTrue(self.wb.modified)
+
+    def test_fields_and_metadata_follow_renames(self):
+        field = self.datasource.fields['[x]']
+        self.wb.rename_fields('datasource_test', {'[x]': '[Sales]'})
+
+        self.assertIs(field, self.datasource.fields['[Sales]'])
+        self.assertEqual('[Sales]', field.id)
+        self.assertNotIn('[x]', self.datasource.fields)
+        self.assertEqual(['Sheet 2'], field.worksheets)
+        self.assertEqual(['[a]', '[Sales]', '[y]'],
+                         [x.text for x in self.datasource._datasourceXML.iter('local-name')])
+        self.assertEqual('Sum', field.default_aggregation)
+
+        reopened = Workbook(self.wb.to_bytes()).datasources[0]
+        self.assertEqual('Sum', reopened.fields['[Sales]'].default_aggregation)
+        self.assertEqual(['Sheet 2'], reopened.fields['[Sales]'].worksheets)
+
+    def test_calculations_follow_renames(self):
+        calculation = self.datasource.add_calculation('Double', '[x] * 2 + LEN("[x]") // [x]', 'integer',
+                                                      'measure', 'quantitative', 'false')
+        self.datasource.rename_fields({'[x]': '[Sales]'})
+        self.assertEqual('[Sales] * 2 + LEN("[x]") // [x]', calculation.calculation)
+        self.assertEqual(calculation.calculation, calculation.xml.find('calculation').get('formula'))
+
+    def test_datasource_renames_go_through_workbook(self):
+        self.datasource.rename_fields({'[x]': '[Sales]'})
+        self.assertEqual([('datasource_test', '[a]'), ('datasource_test', '[Sales]')],
+                         self.wb.get_worksheet('Sheet 2').dependencies)
+        self.assertEqual('[datasource_test].[sum:Sales:qk]', self.wb.get_worksheet('Sheet 2').xml.findtext('.//cols'))
+
+    def test_invalid_renames(self):
+        with self.assertRaises(KeyError):
+            self.datasource.rename_fields({'[nope]': '[Sales]'})
+        with self.assertRaises(ValueError):
+            self.datasource.rename_fields({'[x]': '[y]'})
+        with self.assertRaises(ValueError):
+            self.datasource.rename_fields({'[x]': '[Sales]', '[y]': '[Sales]'})
+        with self.assertRaises(ValueError):
+            self.datasource.rename_fields({'[x]': 'Sales'})
+        # Swapping two ids is fine
+        self.datasource.rename_fields({'[x]': '[y]', '[y]': '[x]'})
+        self.assertEqual('X', self.datasource.fields['[y]'].caption)
+
+    def test_qualified_references(self):
+        root = ET.fromstring('<workbook><worksheets><worksheet><rows>[a b].[x] + [c].[x] + [a b].[[x]]]</rows>'
+                             '</worksheet></worksheets></workbook>')
+        changed = rewrite_references(root, {'a b': {'[x]': '[y]', '[[x]]]': '[z]'}})
+        self.assertEqual('[a b].[y] + [c].[x] + [a b].[z]', root.findtext('.//rows'))
+        self.assertEqual([None], list(changed))
@@ -0,0 +1,117 @@
+import unittest
+import os.path
+
+from test.assets.index import *
+from tableaudocumentapi import Datasource, Workbook
+from tableaudocumentapi.scanner import scan, scan_file, summarize_file, find_tableau_files, DatasourceRecord, \
+    WorksheetRecord, DashboardRecord, ShapeRecord
+from tableaudocumentapi.xfile import TableauVersionNotSupportedException
+
+TEST_ASSET_DIR = os.path.join(
+    os.path.dirname(__file__),
+    'assets'
+)
+
+WORKBOOK_FILES = [
+    TABLEAU_93_TWB,
+    TABLEAU_10_TWB,
+    TABLEAU_10_TWBX,
+    MULTI_CONNECTION_10,
+    TWBX_WITH_CACHE_FILES,
+    COMPLEX_TWB,
+    os.path.join(TEST_ASSET_DIR, 'datasource_test.twb'),
+    os.path.join(TEST_ASSET_DIR, 'shapes_test.twb'),
+]
+
+DATASOURCE_FILES = [
+    TABLEAU_93_TDS,
+    TABLEAU_10_TDS,
+    TABLEAU_10_TDSX,
+    os.path.join(TEST_ASSET_DIR, 'datasource_test.tds'),
+    os.path.join(TEST_ASSET_DIR, 'unicode.tds'),
+]
+
+
+def records_of_type(records, record_type):
+    return [x for x in records if isinstance(x, record_type)]
+
+
+def summarize_datasource(datasource):
+    # Datasource.fields is a dict, DatasourceRecord.fields a tuple
+    fields = datasource.fields.values() if isinstance(datasource, Datasource) else datasource.fields
+    return (datasource.name,
+            datasource.caption,
+            [(x.dbclass, x.server, x.dbname, x.username, x.port) for x in datasource.connections],
+            [(x.id, x.caption, x.datatype, x.role, x.calculation, x.default_aggregation)
+             for x in fields])
+
+
+class ScannerMatchesObjectModel(unittest.TestCase):
+
+    def test_workbooks(self):
+        for filename in WORKBOOK_FILES:
+            wb = Workbook(filename)
+            records = list(scan_file(filename))
+
+            self.assertEqual([summarize_datasource(x) for x in wb.datasources],
+                             [summarize_datasource(x) for x in records_of_type(records, DatasourceRecord)])
+            self.assertEqual(wb.worksheets, [x.name for x in records_of_type(records, WorksheetRecord)])
+            self.assertEqual(wb.dashboards, [x.name for x in records_of_type(records, DashboardRecord)])
+            self.assertEqual(wb.shapes, [x.name for x in records_of_type(records, ShapeRecord)])
+
+    def test_datasources(self):
+        for filename in DATASOURCE_FILES:
+            ds = Datasource.from_file(filename)
+            records = list(scan_file(filename))
+
+            self.assertEqual([summarize_datasource(ds)],
+                             [summarize_datasource(x) for x in records])
+
+    def test_worksheet_dependencies_match_field_usage(self):
+        filename = os.path.join(TEST_ASSET_DIR, 'datasource_test.twb')
+        wb = Workbook(filename)
+        used_by = {(ds.name, field_id, worksheet)
+                   for ds in wb.datasources
+                   for field_id, field in ds.fields.items()
+                   for worksheet in field.worksheets}
+
+        worksheets = records_of_type(scan_file(filename), WorksheetRecord)
+        dependencies = {(ds_name, column, x.name) for x in worksheets for ds_name, column in x.dependencies}
+        self.assertTrue(used_by)
+        self.assertTrue(used_by <= dependencies)
+
+
+class ScannerEdgeCases(unittest.TestCase):
+
+    def test_unsupported_version_raises(self):
+        with self.assertRaises(TableauVersionNotSupportedException):
+            list(scan_file(TABLEAU_82_TWB))
+
+    def test_empty_workbook(self):
+        self.assertEqual([], list(scan_file(EMPTY_WORKBOOK)))
+
+
+class BulkScan(unittest.TestCase):
+
+    def test_scan_returns_a_summary_per_file(self):
+        paths = WORKBOOK_FILES + DATASOURCE_FILES
+        summaries = list(scan(paths, workers=2, max_in_flight=3))
+
+        self.assertEqual(sorted(paths), sorted(x.filename for x in summaries))
+        for summary in summaries:
+            self.assertIsNone(summary.error)
+            self.assertEqual(summary, summarize_file(summary.filename))
+
+    def test_scan_captures_errors(self):
+        summaries = {x.filename: x for x in scan([BAD_ZIP_FILE, TABLEAU_82_TWB, TABLEAU_10_TWB], workers=2)}
+
+        self.assertIn('TableauInvalidFileException', summaries[BAD_ZIP_FILE].error)
+        self.assertIn('TableauVersionNotSupportedException', summaries[TABLEAU_82_TWB].error)
+        self.assertIsNone(summaries[TABLEAU_10_TWB].error)
+        self.assertEqual(1, len(summaries[TABLEAU_10_TWB].datasources))
+
+    def test_find_tableau_files(self):
+        found = list(find_tableau_files(TEST_ASSET_DIR))
+        self.assertIn(TABLEAU_10_TWBX, found)
+        self.assertIn(TABLEAU_10_TDS, found)
+        self.assertNotIn(BAD_ZIP_FILE, found)
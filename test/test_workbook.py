@@ -1,7 +1,13 @@
 import unittest
 import os.path
+import shutil
+import tempfile
 
+from lxml import etree as ET
+
+from test.assets.index import MULTI_CONNECTION_10, TWBX_WITH_CACHE_FILES
 from tableaudocumentapi import Datasource, Workbook
+from tableaudocumentapi.xfile import HEAVY_SUBTREES
 
 TEST_ASSET_DIR = os.path.join(
     os.path.dirname(__file__),
@@ -22,6 +28,11 @@ DASHBOARDS_FILE = os.path.join(
     'filtering.twb'
 )
 
+DATASOURCE_TWB_FILE = os.path.join(
+    TEST_ASSET_DIR,
+    'datasource_test.twb'
+)
+
 
 class EphemeralFields(unittest.TestCase):
     def test_ephemeral_fields_do_not_cause_errors(self):
@@ -49,3 +60,222 @@ class Dashboards(unittest.TestCase):
         wb = Workbook(DASHBOARDS_FILE)
         self.assertIsNotNone(wb)
         self.assertEqual(wb.dashboards, ['setTest'])
+
+
+class LazyWorkbook(unittest.TestCase):
+    def test_nothing_is_prepared_on_open(self):
+        wb = Workbook(DASHBOARDS_FILE, lazy=True)
+        self.assertIsNone(wb._datasources)
+        self.assertIsNone(wb._worksheets)
+        self.assertIsNone(wb._dashboards)
+
+    def test_lazy_workbook_matches_eager_workbook(self):
+        for filename in (DASHBOARDS_FILE, SHAPES_FILE, DATASOURCE_TWB_FILE):
+            eager = Workbook(filename)
+            lazy = Workbook(filename, lazy=True)
+            self.assertEqual(eager.dashboards, lazy.dashboards)
+            self.assertEqual(eager.worksheets, lazy.worksheets)
+            self.assertEqual(eager.shapes, lazy.shapes)
+            self.assertEqual([x.name for x in eager.datasources], [x.name for x in lazy.datasources])
+
+    def test_lazy_workbook_links_fields_to_worksheets(self):
+        wb = Workbook(DATASOURCE_TWB_FILE, lazy=True)
+        fields = wb.datasources[0].fields
+        self.assertEqual(['A'], [x.name for x in fields.used_by_sheet('Sheet 1')])
+        self.assertEqual({'A', 'X'}, {x.name for x in fields.used_by_sheet('Sheet 2')})
+
+
+class Worksheets(unittest.TestCase):
+    def setUp(self):
+        self.wb = Workbook(DATASOURCE_TWB_FILE)
+
+    def test_get_worksheet(self):
+        worksheet = self.wb.get_worksheet('Sheet 2')
+        self.assertEqual('Sheet 2', worksheet.name)
+        self.assertIs(worksheet, self.wb.get_worksheet('Sheet 2'))
+        self.assertEqual([('datasource_test', '[a]'), ('datasource_test', '[x]')], worksheet.dependencies)
+        self.assertEqual(['A', 'X'], [x.name for x in worksheet.fields])
+        self.assertEqual([self.wb.datasources[0]], worksheet.datasources)
+
+    def test_get_unknown_worksheet_raises(self):
+        with self.assertRaises(KeyError):
+            self.wb.get_worksheet('Not a sheet')
+
+    def test_worksheets_using_field(self):
+        self.assertEqual(['Sheet 1', 'Sheet 2'],
+                         [x.name for x in self.wb.worksheets_using('datasource_test', '[a]')])
+        self.assertEqual(['Sheet 2'], [x.name for x in self.wb.worksheets_using('datasource_test', '[x]')])
+        self.assertEqual([], self.wb.worksheets_using('datasource_test', '[y]'))
+
+    def test_worksheet_fields_in_lazy_workbook(self):
+        wb = Workbook(DATASOURCE_TWB_FILE, lazy=True)
+        self.assertEqual(['A'], [x.name for x in wb.get_worksheet('Sheet 1').fields])
+        self.assertIsNone(wb._dashboards)
+
+
+class OpaqueSubtrees(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp('tda-opaque')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def read_section(self, filename, tag):
+        with open(filename, 'rb') as f:
+            data = f.read()
+        start = data.index('<{}'.format(tag).encode())
+        end = data.index('</{}>'.format(tag).encode()) + len(tag) + 3
+        return data[start:end]
+
+    def test_heavy_subtrees_are_not_parsed(self):
+        wb = Workbook(DASHBOARDS_FILE, opaque_subtrees=HEAVY_SUBTREES)
+        self.assertIsNone(wb._workbookRoot.find('thumbnails'))
+        self.assertIsNone(wb._workbookRoot.find('windows'))
+        self.assertEqual(Workbook(DASHBOARDS_FILE).worksheets, wb.worksheets)
+        self.assertEqual(['setTest'], wb.dashboards)
+
+    def test_heavy_subtrees_are_saved_verbatim(self):
+        wb = Workbook(SHAPES_FILE, opaque_subtrees=HEAVY_SUBTREES)
+        wb.datasources[0].caption = 'Renamed'
+        new_filename = os.path.join(self.temp_dir, 'saved.twb')
+        wb.save_as(new_filename)
+
+        for tag in HEAVY_SUBTREES:
+            self.assertEqual(self.read_section(SHAPES_FILE, tag), self.read_section(new_filename, tag))
+
+        expected = Workbook(SHAPES_FILE)
+        expected.datasources[0].caption = 'Renamed'
+        expected_filename = os.path.join(self.temp_dir, 'expected.twb')
+        expected.save_as(expected_filename)
+        self.assertEqual(ET.tostring(ET.parse(expected_filename), method='c14n'),
+                         ET.tostring(ET.parse(new_filename), method='c14n'))
+
+    def test_matches_outside_the_top_level_fall_back_to_parsing(self):
+        with open(SHAPES_FILE, 'rb') as f:
+            data = f.read()
+        filename = os.path.join(self.temp_dir, 'commented.twb')
+        with open(filename, 'wb') as f:
+            f.write(data.replace(b'<datasources>', b'<!-- <windows>x</windows> --><datasources>', 1))
+
+        wb = Workbook(filename, opaque_subtrees=HEAVY_SUBTREES)
+        self.assertIsNone(wb._opaque_segments)
+        self.assertIsNotNone(wb._workbookRoot.find('windows'))
+
+    def test_pieces_over_ten_megabytes(self):
+        with open(SHAPES_FILE, 'rb') as f:
+            data = f.read()
+        # libxml2 won't take more than about 10 MB in one call to feed
+        preferences = b'<preferences>' + b"<preference name='padding' value='x' />" * 300000
+        data = data.replace(b'<preferences>', preferences, 1)
+        self.assertGreater(data.index(b'<windows'), 10 * 1024 * 1024)
+
+        wb = Workbook(data, lazy=True, opaque_subtrees=HEAVY_SUBTREES)
+        self.assertEqual(Workbook(SHAPES_FILE).worksheets, wb.worksheets)
+        # Only the cut out bytes are kept, not the whole document
+        self.assertTrue(all(isinstance(x, bytes) for x in wb._opaque_segments.chunks))
+        self.assertLess(sum(len(x) for x in wb._opaque_segments.chunks), len(data) // 10)
+
+    def test_packaged_workbook_round_trip(self):
+        wb = Workbook(TWBX_WITH_CACHE_FILES, opaque_subtrees=HEAVY_SUBTREES)
+        self.assertIsNotNone(wb._opaque_segments)
+        new_filename = os.path.join(self.temp_dir, 'saved.twbx')
+        wb.save_as(new_filename)
+
+        saved = Workbook(new_filename)
+        self.assertIsNotNone(saved._workbookRoot.find('windows'))
+        self.assertEqual(Workbook(TWBX_WITH_CACHE_FILES).worksheets, saved.worksheets)
+
+
+class ChangeTracking(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp('tda-changes')
+        self.filename = os.path.join(self.temp_dir, 'Cache.twbx')
+        shutil.copy(TWBX_WITH_CACHE_FILES, self.filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_clean_workbook_is_not_saved(self):
+        mtime = os.stat(self.filename).st_mtime_ns
+        wb = Workbook(self.filename)
+        wb.datasources[1].connections[0].dbname = wb.datasources[1].connections[0].dbname
+        field = wb.datasources[1].fields['[Sales Target]']
+        field.role = field.role
+        self.assertFalse(wb.modified)
+        wb.save()
+        self.assertEqual(mtime, os.stat(self.filename).st_mtime_ns)
+
+    def test_modified_objects_are_reported(self):
+        wb = Workbook(self.filename)
+        datasource = wb.datasources[1]
+        connection = datasource.connections[0]
+        connection.server = 'newserver'
+        field = datasource.fields['[Sales Target]']
+        field.calculation = 'TODAY()'
+        new_field = datasource.add_field('[New]', 'string', 'dimension', 'nominal', None, 'false')
+
+        self.assertEqual([datasource], wb.modified_datasources)
+        self.assertEqual([connection], datasource.modified_connections)
+        self.assertEqual({field, new_field}, set(datasource.modified_fields))
+
+        wb.save()
+        self.assertFalse(wb.modified)
+        self.assertEqual([], datasource.modified_fields)
+        self.assertEqual('newserver', Workbook(self.filename).datasources[1].connections[0].server)
+
+    def test_datasource_changes(self):
+        wb = Workbook(self.filename)
+        datasource = wb.datasources[0]
+        datasource.caption = 'Renamed'
+        self.assertTrue(datasource.modified)
+        self.assertEqual([], datasource.modified_connections)
+
+        datasource = wb.datasources[1]
+        datasource.remove_field(datasource.fields['[Sales Target]'])
+        self.assertTrue(datasource.modified)
+        self.assertEqual(2, len(wb.modified_datasources))
+
+    def test_direct_xml_changes_need_marking(self):
+        wb = Workbook(self.filename, lazy=True)
+        self.assertFalse(wb.modified)
+        wb._workbookRoot.set('source-build', 'edited')
+        wb.mark_modified()
+        wb.save()
+        self.assertEqual('edited', Workbook(self.filename)._workbookRoot.get('source-build'))
+
+
+class ConnectionIndex(unittest.TestCase):
+    def setUp(self):
+        self.wb = Workbook(MULTI_CONNECTION_10)
+
+    def test_find_connections(self):
+        self.assertEqual(['awesomeserver', 'mysql55', 'mssql2012'], [x.server for x in self.wb.connections])
+        self.assertEqual(['mssql2012'], [x.server for x in self.wb.find_connections(dbclass='sqlserver')])
+        self.assertEqual(['mysql55'], [x.server for x in self.wb.find_connections(
+            named_connection='mysql.0unbi0i1tfh602155zoou04tacme', dbname='testv1')])
+        self.assertEqual([], self.wb.find_connections(dbclass='mysql', dbname='TestV1'))
+        self.assertEqual(['awesomeserver'], [x.server for x in self.wb.find_connections(username='')])
+
+        with self.assertRaises(ValueError):
+            self.wb.find_connections(table='xy')
+
+    def test_index_follows_changes(self):
+        connection = self.wb.find_connections(server='mysql55')[0]
+        connection.server = 'mysql57'
+        self.assertEqual([], self.wb.find_connections(server='mysql55'))
+        self.assertEqual([connection], self.wb.find_connections(server='mysql57'))
+
+    def test_update_connections(self):
+        touched = self.wb.update_connections({'dbname': 'TestV1'}, server='newserver', port='1433')
+        self.assertEqual(['sqlserver'], [x.dbclass for x in touched])
+        self.assertEqual(touched, self.wb.find_connections(server='newserver', port='1433'))
+        self.assertEqual(['sqlproxy', 'mysql'], [x.dbclass for x in self.wb.update_connections(server='newserver')])
+        self.assertEqual([], self.wb.update_connections(server='newserver'))
+        self.assertEqual(3, sum(len(x.modified_connections) for x in self.wb.modified_datasources))
+
+    def test_invalid_changes_change_nothing(self):
+        with self.assertRaises(AttributeError):
+            self.wb.update_connections(server='newserver', dbclass='notadbclass')
+        with self.assertRaises(ValueError):
+            self.wb.update_connections(authentication='none')
+        self.assertFalse(self.wb.modified)
@@ -1,8 +1,14 @@
 from test.assets.index import *
 
+import io
+import os
+import shutil
+import tempfile
 import unittest
 import zipfile
-from tableaudocumentapi.xfile import find_file_in_zip
+from unittest import mock
+from tableaudocumentapi.xfile import find_file_in_zip, get_xml_from_archive, save_into_archive, parse_version, \
+    TableauInvalidFileException
 from tableaudocumentapi import Workbook, Datasource
 
 TEST_ASSET_DIR = os.path.join(
@@ -30,6 +36,175 @@ class XFileEdgeTests(unittest.TestCase):
         twb_from_twbx_with_cache = zipfile.ZipFile(TWBX_WITH_CACHE_FILES)
         self.assertEqual(find_file_in_zip(twb_from_twbx_with_cache), 'Superstore.twb')
 
+    def test_skips_twbs_without_document_root(self):
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as zf:
+            zf.writestr('cache.twb', "<pack class='dataengine'/>")
+            zf.writestr('broken.twb', "not xml at all")
+            zf.writestr('Book1.twb', "<?xml version='1.0' encoding='utf-8' ?><workbook version='10.0'/>")
+        with zipfile.ZipFile(archive) as zf:
+            self.assertEqual(find_file_in_zip(zf), 'Book1.twb')
+
+    def test_archive_without_document_raises(self):
+        with self.assertRaises(TableauInvalidFileException):
+            get_xml_from_archive(BAD_ZIP_FILE)
+
+
+class Versions(unittest.TestCase):
+    def test_parse_version(self):
+        self.assertEqual((18, 1), parse_version('18.1'))
+        self.assertEqual((10,), parse_version('10.0'))
+        self.assertEqual(parse_version('10'), parse_version('10.0.0'))
+        self.assertEqual((9, 3, 1), parse_version('9.3.1-beta'))
+        self.assertEqual((0,), parse_version(None))
+        self.assertEqual((0,), parse_version('a.b'))
+
+    def test_versions_compare_numerically(self):
+        self.assertLess(parse_version('9.3'), parse_version('10.0'))
+        self.assertLess(parse_version('10.5'), parse_version('18.1'))
+        self.assertLess(parse_version('8.2'), parse_version('9.0'))
+
+
+class ArchiveRewrite(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp('tda-xfile')
+        self.twbx_file = os.path.join(self.temp_dir, 'Cache.twbx')
+        shutil.copy(TWBX_WITH_CACHE_FILES, self.twbx_file)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_save_copies_unchanged_members_verbatim(self):
+        new_filename = os.path.join(self.temp_dir, 'new.twbx')
+        wb = Workbook(self.twbx_file)
+        wb.datasources[1].connections[0].server = 'newserver'
+        wb.save_as(new_filename)
+
+        with zipfile.ZipFile(self.twbx_file) as original, zipfile.ZipFile(new_filename) as saved:
+            self.assertIsNone(saved.testzip())
+            self.assertEqual(original.namelist(), saved.namelist())
+            for member in original.infolist():
+                if member.filename == 'Superstore.twb':
+                    continue
+                copied = saved.getinfo(member.filename)
+                self.assertEqual((member.CRC, member.compress_size), (copied.CRC, copied.compress_size))
+                self.assertEqual(original.read(member), saved.read(copied))
+
+        self.assertEqual(Workbook(new_filename).datasources[1].connections[0].server, 'newserver')
+
+    def test_save_without_raw_copies(self):
+        new_filename = os.path.join(self.temp_dir, 'new.twbx')
+        wb = Workbook(self.twbx_file)
+        wb.datasources[1].connections[0].server = 'newserver'
+        with mock.patch('tableaudocumentapi.xfile._can_copy_raw', return_value=False):
+            wb.save_as(new_filename)
+
+        with zipfile.ZipFile(self.twbx_file) as original, zipfile.ZipFile(new_filename) as saved:
+            self.assertIsNone(saved.testzip())
+            self.assertEqual(original.namelist(), saved.namelist())
+            for member in original.infolist():
+                if member.filename != 'Superstore.twb':
+                    self.assertEqual(original.read(member), saved.read(member.filename))
+
+        self.assertEqual(Workbook(new_filename).datasources[1].connections[0].server, 'newserver')
+
+    def test_save_in_place(self):
+        wb = Workbook(self.twbx_file)
+        wb.datasources[1].connections[0].server = 'newserver'
+        wb.save()
+
+        self.assertEqual(Workbook(self.twbx_file).datasources[1].connections[0].server, 'newserver')
+        self.assertEqual([], [x for x in os.listdir(self.temp_dir) if x != 'Cache.twbx'])
+
+    def test_save_drops_directory_entries(self):
+        with_dirs = os.path.join(self.temp_dir, 'dirs.twbx')
+        with zipfile.ZipFile(TABLEAU_10_TWBX) as original, zipfile.ZipFile(with_dirs, 'w') as zf:
+            zf.writestr('Data/', b'')
+            for member in original.infolist():
+                zf.writestr(member, original.read(member))
+
+        wb = Workbook(with_dirs)
+        save_into_archive(wb._workbookTree, with_dirs)
+
+        with zipfile.ZipFile(with_dirs) as saved:
+            self.assertEqual(saved.namelist(), ['Book1.twb', 'Data/Datasources/xy (TestV1).tde'])
+
+
+class UnseekableStream(io.RawIOBase):
+    """Only supports writing, like a socket or a pipe."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+
+class InMemoryDocuments(unittest.TestCase):
+
+    def read(self, filename):
+        with open(filename, 'rb') as f:
+            return f.read()
+
+    def test_open_workbook_from_bytes_and_buffers(self):
+        for filename in (TABLEAU_10_TWB, TWBX_WITH_CACHE_FILES):
+            data = self.read(filename)
+            expected = Workbook(filename).worksheets
+            for source in (data, bytearray(data), memoryview(data), io.BytesIO(data)):
+                wb = Workbook(source)
+                self.assertEqual(expected, wb.worksheets)
+                self.assertIsNone(wb.filename)
+
+    def test_open_datasource_from_bytes(self):
+        for filename in (TABLEAU_10_TDS, TABLEAU_10_TDSX):
+            ds = Datasource.from_file(self.read(filename))
+            self.assertEqual(Datasource.from_file(filename).connections[0].server, ds.connections[0].server)
+
+    def test_to_bytes_round_trip(self):
+        wb = Workbook(memoryview(self.read(TWBX_WITH_CACHE_FILES)))
+        wb.datasources[1].connections[0].server = 'newserver'
+        data = wb.to_bytes()
+
+        with zipfile.ZipFile(io.BytesIO(data)) as saved, zipfile.ZipFile(TWBX_WITH_CACHE_FILES) as original:
+            self.assertEqual(original.namelist(), saved.namelist())
+        self.assertEqual('newserver', Workbook(data).datasources[1].connections[0].server)
+
+        ds = Datasource.from_file(TABLEAU_10_TDS)
+        ds.caption = 'In memory'
+        self.assertEqual('In memory', Datasource.from_file(ds.to_bytes()).caption)
+
+    def test_save_to_unseekable_stream(self):
+        for filename in (TABLEAU_10_TWB, TWBX_WITH_CACHE_FILES):
+            stream = UnseekableStream()
+            Workbook(filename).save_to(stream)
+            self.assertEqual(Workbook(filename).worksheets, Workbook(b''.join(stream.chunks)).worksheets)
+
+        with zipfile.ZipFile(io.BytesIO(b''.join(stream.chunks))) as saved:
+            self.assertIsNone(saved.testzip())
+
+    def test_in_memory_documents_need_a_new_name(self):
+        wb = Workbook(self.read(TABLEAU_10_TWB))
+        wb.datasources[0].caption = 'Changed'
+        with self.assertRaises(ValueError):
+            wb.save()
+
+        temp_dir = tempfile.mkdtemp('tda-xfile')
+        try:
+            new_filename = os.path.join(temp_dir, 'saved.twbx')
+            Workbook(self.read(TWBX_WITH_CACHE_FILES)).save_as(new_filename)
+            self.assertEqual(Workbook(TWBX_WITH_CACHE_FILES).worksheets, Workbook(new_filename).worksheets)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_invalid_in_memory_document(self):
+        with self.assertRaises(TableauInvalidFileException):
+            Datasource.from_file(self.read(TABLEAU_10_TWB))
+
 
 class Namespacing(unittest.TestCase):
 